@@ -5,6 +5,7 @@ from drf_yasg.utils import swagger_auto_schema
 from rest_framework.decorators import action
 from rest_framework import status
 from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
 from dojo.api_v2 import serializers
 from dojo.models import Question, Answer
 import itertools
@@ -56,3 +57,67 @@ class QuestionSubClassFieldsMixin(object):
 class AnswerSubClassFieldsMixin(object):
     def get_queryset(self):
         return Answer.objects.select_subclasses()
+
+
+class SparseFieldsetMixin(object):
+    """
+    Lets clients list or retrieve only some of the fields, with fields=a,b to return just those or omit=c,d to leave
+    those out. The id is always returned. Relations in field_prefetches are only prefetched when one of the fields
+    that reads them is returned, and the columns in deferrable_fields are not loaded when they are left out.
+    """
+    # serializer field -> relations it reads
+    field_prefetches = {}
+    # serializer fields that are just a (large) column of the model
+    deferrable_fields = ()
+
+    def get_sparse_fieldset(self):
+        """Returns the requested and the omitted fields, or None when all fields are returned"""
+        # the view is instantiated per request, so the parameters are parsed once
+        if not hasattr(self, '_sparse_fieldset'):
+            self._sparse_fieldset = self.parse_sparse_fieldset()
+        return self._sparse_fieldset
+
+    def parse_sparse_fieldset(self):
+        request = getattr(self, 'request', None)
+        if request is None or request.method != 'GET' or getattr(self, 'swagger_fake_view', False):
+            return None
+        fields = {name for name in request.query_params.get('fields', '').split(',') if name}
+        omit = {name for name in request.query_params.get('omit', '').split(',') if name}
+        if not fields and not omit:
+            return None
+        return fields, omit
+
+    def is_field_returned(self, name):
+        sparse_fieldset = self.get_sparse_fieldset()
+        if sparse_fieldset is None or name == 'id':
+            return True
+        fields, omit = sparse_fieldset
+        return (not fields or name in fields) and name not in omit
+
+    def get_sparse_prefetches(self, prefetches):
+        """Returns the prefetches that are needed by the returned fields"""
+        if self.get_sparse_fieldset() is None:
+            return prefetches
+        needed = set()
+        for name, relations in self.field_prefetches.items():
+            if self.is_field_returned(name):
+                needed.update(relations)
+        return [prefetch for prefetch in prefetches if prefetch in needed]
+
+    def get_sparse_deferred_fields(self):
+        if self.get_sparse_fieldset() is None:
+            return []
+        return [name for name in self.deferrable_fields if not self.is_field_returned(name)]
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        sparse_fieldset = self.get_sparse_fieldset()
+        if sparse_fieldset is not None:
+            serializer_fields = getattr(serializer, 'child', serializer).fields
+            unknown = (sparse_fieldset[0] | sparse_fieldset[1]) - set(serializer_fields)
+            if unknown:
+                raise ValidationError({'fields': 'Unknown fields: %s' % ', '.join(sorted(unknown))})
+            for name in list(serializer_fields):
+                if not self.is_field_returned(name):
+                    serializer_fields.pop(name)
+        return serializer
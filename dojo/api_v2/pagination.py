@@ -0,0 +1,124 @@
+from collections import OrderedDict
+
+import coreapi
+import coreschema
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination with an opt-in keyset mode for walking large lists to the end: when the cursor parameter is
+    given (0 for the first page), the results are ordered by id and start after the id of the cursor. The next link
+    carries the id of the last result and no count is queried, so a page takes the same time however deep it is.
+    updated_since limits the results to the objects changed since then, for incremental syncs. The field it filters
+    on is the updated_since_field of the view.
+    """
+    cursor_query_param = 'cursor'
+    cursor_query_description = 'Id after which the page starts, 0 for the first page. Orders the results by id and ' \
+                               'leaves out the count and the previous link.'
+    updated_since_query_param = 'updated_since'
+    updated_since_query_description = 'Only with cursor, the date or time since which the results have changed.'
+
+    keyset = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        queryset = queryset.filter(id__gt=self.get_cursor(request))
+        updated_since = self.get_updated_since(request)
+        if updated_since:
+            updated_since_field = getattr(view, 'updated_since_field', None)
+            if not updated_since_field:
+                raise ValidationError({self.updated_since_query_param: 'Not supported for this endpoint.'})
+            queryset = queryset.filter(**{updated_since_field + '__gte': updated_since})
+
+        # select the ids first, a distinct over just the id doesn't have to sort the whole (joined) table
+        ids = list(queryset.order_by('id').values_list('id', flat=True)[:self.limit + 1])
+        self.next_cursor = ids[self.limit - 1] if len(ids) > self.limit else None
+        return list(queryset.filter(id__in=ids[:self.limit]).order_by('id'))
+
+    def get_cursor(self, request):
+        try:
+            cursor = int(request.query_params[self.cursor_query_param] or 0)
+        except ValueError:
+            cursor = -1
+        if cursor < 0:
+            raise ValidationError({self.cursor_query_param: 'Must be the id of the last result or 0.'})
+        return cursor
+
+    def get_updated_since(self, request):
+        value = request.query_params.get(self.updated_since_query_param)
+        if not value:
+            return None
+        try:
+            updated_since = parse_datetime(value)
+            if updated_since is None and parse_date(value):
+                updated_since = parse_datetime(value + 'T00:00:00')
+        except ValueError:
+            updated_since = None
+        if updated_since is None:
+            raise ValidationError({self.updated_since_query_param: 'Must be an ISO 8601 date or time.'})
+        if timezone.is_naive(updated_since):
+            updated_since = timezone.make_aware(updated_since)
+        return updated_since
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if self.next_cursor is None:
+            return None
+        url = replace_query_param(self.request.build_absolute_uri(), self.limit_query_param, self.limit)
+        url = remove_query_param(url, self.offset_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', None),
+            ('results', data)
+        ]))
+
+    def get_schema_fields(self, view):
+        return super().get_schema_fields(view) + [
+            coreapi.Field(
+                name=self.cursor_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.Integer(title='Cursor', description=self.cursor_query_description)
+            ),
+            coreapi.Field(
+                name=self.updated_since_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.String(title='Updated since', description=self.updated_since_query_description)
+            ),
+        ]
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': self.cursor_query_description,
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.updated_since_query_param,
+                'required': False,
+                'in': 'query',
+                'description': self.updated_since_query_description,
+                'schema': {'type': 'string', 'format': 'date-time'},
+            },
+        ]
@@ -18,7 +18,7 @@ class PrefetchListMixin(ListModelMixin):
 
         for entry in queryset:
             results.append(serializer.to_representation(entry))
-            prefetcher._prefetch(entry, prefetch_params)
+        prefetcher.prefetch(queryset, prefetch_params)
 
         # Done in the original list method so we do it as well
         response = self.get_paginated_response(results)
@@ -36,7 +36,7 @@ class PrefetchRetrieveMixin(RetrieveModelMixin):
 
         # Get the queried object representation
         result = serializer.to_representation(entry)
-        prefetcher._prefetch(entry, prefetch_params)
+        prefetcher.prefetch([entry], prefetch_params)
         result["prefetch"] = prefetcher.prefetched_data
 
         return Response(result)
@@ -1,3 +1,4 @@
+from django.db.models import prefetch_related_objects
 from rest_framework.serializers import ModelSerializer
 from . import utils
 import inspect
@@ -8,6 +9,9 @@ SERIALIZER_DEFS_MODULE = "dojo.api_v2.serializers"
 
 
 class _Prefetcher():
+    # map model -> serializer, built once per process as the serializers don't change
+    _serializers_map = None
+
     @staticmethod
     def _build_serializers():
         """Returns a map model -> serializer where model is a django model and serializer is the corresponding
@@ -33,7 +37,9 @@ class _Prefetcher():
         return serializers
 
     def __init__(self):
-        self._serializers = _Prefetcher._build_serializers()
+        if _Prefetcher._serializers_map is None:
+            _Prefetcher._serializers_map = _Prefetcher._build_serializers()
+        self._serializers = _Prefetcher._serializers_map
         self._prefetch_data = dict()
 
     def _find_serializer(self, field_type):
@@ -91,6 +97,87 @@ class _Prefetcher():
             for data in field_data_list:
                 self._prefetch_data[field_to_fetch][data["id"]] = data
 
+    def _get_related_objects(self, entries, field_path):
+        """Get the distinct objects the entries refer to with the field path, with one query per relation in the path
+
+        Args:
+            entries (list[ModelInstance]): instances of the same model
+            field_path (string): name of a relation, or names of relations separated by __
+
+        Returns:
+            list[ModelInstance]: the related objects or None if the path is not made of relations
+        """
+        objects = entries
+        for field_name in field_path.split("__"):
+            if not objects:
+                return []
+
+            field_meta = getattr(type(objects[0]), field_name, None)
+            if utils._is_one_to_one_relation(field_meta):
+                field = field_meta.field
+                related = dict()
+                missing_ids = set()
+                for obj in objects:
+                    if field.is_cached(obj):
+                        related_object = field.get_cached_value(obj)
+                        if related_object is not None:
+                            related[related_object.pk] = related_object
+                    else:
+                        related_id = getattr(obj, field.attname)
+                        if related_id is not None:
+                            missing_ids.add(related_id)
+                missing_ids -= set(related)
+                if missing_ids:
+                    related.update(field.related_model._base_manager.in_bulk(missing_ids))
+                    # so that longer paths over the same relation don't fetch the objects again
+                    for obj in objects:
+                        related_id = getattr(obj, field.attname)
+                        if not field.is_cached(obj) and related_id in related:
+                            field.set_cached_value(obj, related[related_id])
+            elif utils._is_many_to_many_relation(field_meta):
+                # is a no-op for the objects of which the relation is already prefetched
+                prefetch_related_objects(objects, field_name)
+                related = dict()
+                for obj in objects:
+                    for related_object in getattr(obj, field_name).all():
+                        related[related_object.pk] = related_object
+            else:
+                return None
+            objects = list(related.values())
+
+        return objects
+
+    def prefetch(self, entries, fields_to_fetch):
+        """Apply prefetching for the given fields on all the given entries at once, each related object is fetched and
+        serialized once
+
+        Args:
+            entries (list[ModelInstance]): Instances of a model as returned by a django queryset
+            fields_to_fetch (list[string]): fields to prefetch, relations of relations are separated by __
+        """
+        entries = list(entries)
+        for field_to_fetch in fields_to_fetch:
+            if not field_to_fetch:
+                continue
+
+            related_objects = self._get_related_objects(entries, field_to_fetch)
+            if related_objects is None:
+                for entry in entries:
+                    self._prefetch(entry, [field_to_fetch])
+                continue
+
+            if field_to_fetch not in self._prefetch_data:
+                self._prefetch_data[field_to_fetch] = dict()
+
+            for related_object in related_objects:
+                if related_object.pk in self._prefetch_data[field_to_fetch]:
+                    continue
+                extra_serializer = self._find_serializer(type(related_object))
+                if extra_serializer is None:
+                    continue
+                data = extra_serializer().to_representation(related_object)
+                self._prefetch_data[field_to_fetch][data["id"]] = data
+
     @property
     def prefetched_data(self):
         return self._prefetch_data
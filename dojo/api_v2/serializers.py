@@ -1260,6 +1260,7 @@ class FindingSerializer(TaggitSerializer, serializers.ModelSerializer):
     accepted_risks = RiskAcceptanceSerializer(many=True, read_only=True, source='risk_acceptance_set')
     push_to_jira = serializers.BooleanField(default=False)
     age = serializers.IntegerField(read_only=True)
+    # reads the SLA configuration annotated by FindingViewSet, instead of the product of each finding
     sla_days_remaining = serializers.IntegerField(read_only=True)
     finding_meta = FindingMetaSerializer(read_only=True, many=True)
     related_fields = serializers.SerializerMethodField()
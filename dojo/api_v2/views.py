@@ -45,7 +45,9 @@ from dateutil.relativedelta import relativedelta
 from django.conf import settings
 from datetime import datetime
 from dojo.utils import get_period_counts_legacy, get_system_setting, get_setting, async_delete
+from dojo.sla_config.helpers import annotate_sla_configuration
 from dojo.api_v2 import serializers, permissions, prefetch, schema, mixins as dojo_mixins
+from dojo.api_v2.pagination import KeysetPagination
 import dojo.jira_link.helper as jira_helper
 import logging
 import tagulous
@@ -186,6 +188,7 @@ class EndPointViewSet(prefetch.PrefetchListMixin,
     serializer_class = serializers.EndpointSerializer
     queryset = Endpoint.objects.none()
     filter_backends = (DjangoFilterBackend,)
+    pagination_class = KeysetPagination
     filterset_class = ApiEndpointFilter
     swagger_schema = prefetch.get_prefetch_schema(["endpoints_list", "endpoints_read"], serializers.EndpointSerializer).to_schema()
     permission_classes = (IsAuthenticated, permissions.UserHasEndpointPermission)
@@ -235,6 +238,8 @@ class EndpointStatusViewSet(prefetch.PrefetchListMixin,
     serializer_class = serializers.EndpointStatusSerializer
     queryset = Endpoint_Status.objects.none()
     filter_backends = (DjangoFilterBackend,)
+    pagination_class = KeysetPagination
+    updated_since_field = 'last_modified'
     filterset_fields = ['mitigated', 'false_positive', 'out_of_scope', 'risk_accepted', 'mitigated_by', 'finding', 'endpoint']
     swagger_schema = prefetch.get_prefetch_schema(["endpoint_status_list", "endpoint_status_read"], serializers.EndpointStatusSerializer).to_schema()
     permission_classes = (IsAuthenticated, permissions.UserHasEndpointStatusPermission)
@@ -632,6 +637,10 @@ class FindingTemplatesViewSet(mixins.ListModelMixin,
                                             product_type, test, test_type)"),
             OpenApiParameter("prefetch", OpenApiTypes.STR, OpenApiParameter.QUERY, required=False,
                                 description="List of fields for which to prefetch model instances and add those to the response"),
+            OpenApiParameter("fields", OpenApiTypes.STR, OpenApiParameter.QUERY, required=False,
+                                description="List of fields to return, the id is always returned"),
+            OpenApiParameter("omit", OpenApiTypes.STR, OpenApiParameter.QUERY, required=False,
+                                description="List of fields to leave out of the response"),
     ],
     ),
     retrieve=extend_schema(parameters=[
@@ -640,10 +649,15 @@ class FindingTemplatesViewSet(mixins.ListModelMixin,
                                             product_type, test, test_type)"),
             OpenApiParameter("prefetch", OpenApiTypes.STR, OpenApiParameter.QUERY, required=False,
                                 description="List of fields for which to prefetch model instances and add those to the response"),
+            OpenApiParameter("fields", OpenApiTypes.STR, OpenApiParameter.QUERY, required=False,
+                                description="List of fields to return, the id is always returned"),
+            OpenApiParameter("omit", OpenApiTypes.STR, OpenApiParameter.QUERY, required=False,
+                                description="List of fields to leave out of the response"),
     ],
     )
 )
-class FindingViewSet(prefetch.PrefetchListMixin,
+class FindingViewSet(dojo_mixins.SparseFieldsetMixin,
+                     prefetch.PrefetchListMixin,
                      prefetch.PrefetchRetrieveMixin,
                      mixins.UpdateModelMixin,
                      mixins.DestroyModelMixin,
@@ -655,18 +669,53 @@ class FindingViewSet(prefetch.PrefetchListMixin,
     queryset = Finding.objects.none()
     filter_backends = (DjangoFilterBackend,)
     filterset_class = ApiFindingFilter
+    pagination_class = KeysetPagination
+    # findings have no timestamp of their last change, only of the last change of their status
+    updated_since_field = 'last_status_update'
     permission_classes = (IsAuthenticated, permissions.UserHasFindingPermission)
 
     _related_field_parameters = [openapi.Parameter(
                 name="related_fields",
                 in_=openapi.IN_QUERY,
                 description="Expand finding external relations (engagement, environment, product, product_type, test, test_type)",
-                type=openapi.TYPE_BOOLEAN)]
+                type=openapi.TYPE_BOOLEAN),
+        openapi.Parameter(
+                name="fields",
+                in_=openapi.IN_QUERY,
+                description="List of fields to return, the id is always returned",
+                type=openapi.TYPE_STRING),
+        openapi.Parameter(
+                name="omit",
+                in_=openapi.IN_QUERY,
+                description="List of fields to leave out of the response",
+                type=openapi.TYPE_STRING)]
     swagger_schema = prefetch.get_prefetch_schema(["findings_list", "findings_read"], serializers.FindingSerializer). \
         composeWith(schema.ExtraParameters("findings_list", _related_field_parameters)). \
         composeWith(schema.ExtraParameters("findings_read", _related_field_parameters)). \
         to_schema()
 
+    # the relations read by the fields of the FindingSerializer, for the fields= and omit= parameters
+    field_prefetches = {
+        'endpoints': ['endpoints'],
+        'reviewers': ['reviewers'],
+        'found_by': ['found_by'],
+        'notes': ['notes'],
+        'files': ['files'],
+        'tags': ['tags'],
+        'accepted_risks': ['risk_acceptance_set'],
+        'request_response': ['burprawrequestresponse_set'],
+        'finding_meta': ['finding_meta'],
+        'finding_groups': ['finding_group_set'],
+        'jira_creation': ['jira_issue'],
+        'jira_change': ['jira_issue'],
+        # the SLA configuration of the product is annotated in get_queryset
+        'sla_days_remaining': [],
+        'related_fields': ['jira_issue', 'test', 'test__test_type', 'test__engagement', 'test__environment',
+                           'test__engagement__product', 'test__engagement__product__prod_type'],
+    }
+    deferrable_fields = ('description', 'mitigation', 'impact', 'steps_to_reproduce', 'severity_justification',
+                         'references', 'url', 'param', 'payload')
+
     # Overriding mixins.UpdateModeMixin perform_update() method to grab push_to_jira
     # data and add that as a parameter to .save()
     def perform_update(self, serializer):
@@ -679,24 +728,29 @@ class FindingViewSet(prefetch.PrefetchListMixin,
         serializer.save(push_to_jira=push_to_jira)
 
     def get_queryset(self):
-        findings = get_authorized_findings(Permissions.Finding_View).prefetch_related('endpoints',
-                                                    'reviewers',
-                                                    'found_by',
-                                                    'notes',
-                                                    'risk_acceptance_set',
-                                                    'test',
-                                                    'tags',
-                                                    'jira_issue',
-                                                    'finding_group_set',
-                                                    'files',
-                                                    'burprawrequestresponse_set',
-                                                    'status_finding',
-                                                    'finding_meta',
-                                                    'test__test_type',
-                                                    'test__engagement',
-                                                    'test__environment',
-                                                    'test__engagement__product',
-                                                    'test__engagement__product__prod_type')
+        prefetches = self.get_sparse_prefetches(['endpoints',
+                                                 'reviewers',
+                                                 'found_by',
+                                                 'notes',
+                                                 'risk_acceptance_set',
+                                                 'test',
+                                                 'tags',
+                                                 'jira_issue',
+                                                 'finding_group_set',
+                                                 'files',
+                                                 'burprawrequestresponse_set',
+                                                 'finding_meta',
+                                                 'test__test_type',
+                                                 'test__engagement',
+                                                 'test__environment',
+                                                 'test__engagement__product',
+                                                 'test__engagement__product__prod_type'])
+        findings = get_authorized_findings(Permissions.Finding_View).prefetch_related(*prefetches)
+        if self.is_field_returned('sla_days_remaining'):
+            findings = annotate_sla_configuration(findings)
+        deferred_fields = self.get_sparse_deferred_fields()
+        if deferred_fields:
+            findings = findings.defer(*deferred_fields)
 
         return findings.distinct()
 
@@ -2064,6 +2118,8 @@ class TestImportViewSet(prefetch.PrefetchListMixin,
     serializer_class = serializers.TestImportSerializer
     queryset = Test_Import.objects.none()
     filter_backends = (DjangoFilterBackend,)
+    pagination_class = KeysetPagination
+    updated_since_field = 'modified'
     filterset_fields = ['test', 'findings_affected', 'version', 'branch_tag', 'build_id', 'commit_hash', 'test_import_finding_action__action', 'test_import_finding_action__finding', 'test_import_finding_action__created']
     swagger_schema = prefetch.get_prefetch_schema(["test_imports_list", "test_imports_read"], serializers.TestImportSerializer). \
         to_schema()
@@ -74,6 +74,7 @@ class DojoAppConfig(AppConfig):
         import dojo.announcement.signals  # noqa
         import dojo.product.signals  # noqa
         import dojo.test.signals  # noqa
+        import dojo.metrics.signals  # noqa
 
 
 def get_model_fields_with_extra(model, extra_fields=()):
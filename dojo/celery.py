@@ -1,7 +1,10 @@
 import os
+import time
+from fnmatch import fnmatch
 from celery import Celery
-from celery.signals import setup_logging
+from celery.signals import before_task_publish, setup_logging, task_postrun, task_prerun, worker_process_init
 from django.conf import settings
+from django.db import connection
 import logging
 
 logger = logging.getLogger(__name__)
@@ -29,6 +32,146 @@ def config_loggers(*args, **kwags):
     dictConfig(settings.LOGGING)
 
 
+@worker_process_init.connect
+def warm_caches(*args, **kwargs):
+    # load the active scan types once per worker process instead of on the first import
+    from dojo.tools.factory import ParserActivationCache
+    ParserActivationCache.warm()
+
+
+# the tasks of the routing classes, CELERY_ROUTED_TASK_CLASSES selects the classes which are sent to their own queue
+TASK_ROUTING_CLASSES = {
+    'import': [
+        'dojo.importers.*.process_parsed_findings',
+        'dojo.importers.reimporter.utils.*',
+        'dojo.importers.utils.add_endpoints_to_unsaved_finding',
+        'dojo.finding.helper.post_process_finding*',
+    ],
+    'dedupe': [
+        'dojo.utils.do_dedupe_finding_task',
+        'dojo.tasks.async_dupe_delete',
+        'dojo.tasks.fix_loop_duplicates_task',
+    ],
+    'integration': [
+        'dojo.jira_link.helper.*',
+        'dojo.tools.tool_issue_updater.*',
+        'dojo.utils.*_external_issue',
+        'dojo.tasks.jira_status_reconciliation_task',
+    ],
+    'notification': [
+        'dojo.notifications.helper.*',
+        'dojo.tasks.add_alerts',
+    ],
+    'maintenance': [
+        'dojo.utils.calculate_grade',
+        'dojo.utils.run_async_delete_job',
+        'dojo.tasks.resume_async_delete_jobs',
+        'dojo.product.helpers.propagate_tags_on_product',
+        'dojo.metrics.helper.*',
+        'dojo.reports.helper.generate_report_artifact',
+        'dojo.markdown_cache.warm_markdown_render_cache',
+        'dojo.risk_acceptance.helper.expiration_handler',
+        'dojo.tasks.cleanup_alerts',
+        'dojo.tasks.async_sla_compute_and_notify_task',
+    ],
+}
+
+
+def get_task_routing_class(name):
+    for routing_class, patterns in TASK_ROUTING_CLASSES.items():
+        if any(fnmatch(name, pattern) for pattern in patterns):
+            return routing_class
+    return None
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """
+    Celery router that sends the tasks of the routing classes selected by CELERY_ROUTED_TASK_CLASSES to the queue with
+    the name of the class. The update_test_progress task and all other tasks stay on the default queue.
+    The workers have to consume these queues, i.e. "celery worker -Q celery,import,dedupe".
+    """
+    routing_class = get_task_routing_class(name)
+    if routing_class in settings.CELERY_ROUTED_TASK_CLASSES:
+        return {'queue': routing_class}
+    return None
+
+
+class TaskMetrics(object):
+    """
+    The runtime, queue wait time and number of database queries per task, which are exported with the django metrics of
+    django_prometheus. The metrics are recorded in the worker processes, run the web and celery processes with a shared
+    PROMETHEUS_MULTIPROC_DIR to export them at /django_metrics.
+    """
+    metrics = None
+    running = {}
+
+    @classmethod
+    def enabled(cls):
+        return getattr(settings, 'DJANGO_METRICS_ENABLED', False)
+
+    @classmethod
+    def get_metrics(cls):
+        if cls.metrics is None:
+            from prometheus_client import Histogram
+            cls.metrics = {
+                'runtime': Histogram('dojo_celery_task_runtime_seconds', 'Runtime of the celery tasks',
+                                     ['task', 'queue', 'state'],
+                                     buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600, float('inf'))),
+                'queue_wait': Histogram('dojo_celery_task_queue_wait_seconds', 'Time the celery tasks waited in the queue',
+                                        ['task', 'queue'],
+                                        buckets=(0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600, float('inf'))),
+                'queries': Histogram('dojo_celery_task_queries', 'Number of database queries of the celery tasks',
+                                     ['task', 'queue'],
+                                     buckets=(0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, float('inf'))),
+            }
+        return cls.metrics
+
+
+@before_task_publish.connect
+def record_task_published(headers=None, **kwargs):
+    if headers is not None and TaskMetrics.enabled():
+        headers['dojo_published'] = time.time()
+
+
+@task_prerun.connect
+def record_task_started(task_id=None, task=None, **kwargs):
+    if not TaskMetrics.enabled():
+        return
+
+    queries = [0]
+
+    def count_queries(execute, sql, params, many, context):
+        queries[0] += 1
+        return execute(sql, params, many, context)
+
+    connection.execute_wrappers.append(count_queries)
+    TaskMetrics.running[task_id] = (time.monotonic(), count_queries, queries)
+
+    published = getattr(task.request, 'dojo_published', None) or (task.request.headers or {}).get('dojo_published')
+    if published:
+        TaskMetrics.get_metrics()['queue_wait'].labels(task.name, get_task_queue(task)).observe(max(time.time() - published, 0))
+
+
+@task_postrun.connect
+def record_task_finished(task_id=None, task=None, state=None, **kwargs):
+    if task_id not in TaskMetrics.running:
+        return
+
+    started, count_queries, queries = TaskMetrics.running.pop(task_id)
+    if count_queries in connection.execute_wrappers:
+        connection.execute_wrappers.remove(count_queries)
+
+    metrics = TaskMetrics.get_metrics()
+    queue = get_task_queue(task)
+    metrics['runtime'].labels(task.name, queue, state or 'UNKNOWN').observe(time.monotonic() - started)
+    metrics['queries'].labels(task.name, queue).observe(queries[0])
+
+
+def get_task_queue(task):
+    delivery_info = task.request.delivery_info or {}
+    return delivery_info.get('routing_key') or 'celery'
+
+
 # from celery import current_app
 
 # _ = current_app.loader.import_default_modules()
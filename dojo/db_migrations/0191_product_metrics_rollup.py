@@ -0,0 +1,43 @@
+# Generated by Django 4.1.10 on 2026-10-18 20:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dojo', '0190_system_settings_experimental_fp_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Product_Metrics_Rollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('severity', models.CharField(max_length=200)),
+                ('total', models.IntegerField(default=0)),
+                ('opened', models.IntegerField(default=0)),
+                ('active', models.IntegerField(default=0)),
+                ('accepted', models.IntegerField(default=0)),
+                ('mitigated', models.IntegerField(default=0)),
+                ('unmitigated', models.IntegerField(default=0)),
+                ('mitigated_age_0_30', models.IntegerField(default=0)),
+                ('mitigated_age_31_60', models.IntegerField(default=0)),
+                ('mitigated_age_61_90', models.IntegerField(default=0)),
+                ('mitigated_age_over_90', models.IntegerField(default=0)),
+                ('verified', models.IntegerField(default=0)),
+                ('open', models.IntegerField(default=0)),
+                ('inactive', models.IntegerField(default=0)),
+                ('closed', models.IntegerField(default=0)),
+                ('false_positive', models.IntegerField(default=0)),
+                ('out_of_scope', models.IntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metrics_rollup', to='dojo.product')),
+            ],
+            options={
+                'unique_together': {('product', 'date', 'severity')},
+            },
+        ),
+    ]
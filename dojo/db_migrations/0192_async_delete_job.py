@@ -0,0 +1,32 @@
+# Generated by Django 4.1.10 on 2026-10-18 21:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dojo', '0191_product_metrics_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Async_Delete_Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_model', models.CharField(max_length=100)),
+                ('object_id', models.IntegerField()),
+                ('object_name', models.CharField(max_length=1000)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('step', models.IntegerField(default=0)),
+                ('last_id', models.IntegerField(default=0)),
+                ('deleted', models.IntegerField(default=0)),
+                ('total', models.IntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='dojo.dojo_user')),
+            ],
+        ),
+    ]
@@ -1,6 +1,9 @@
+from collections import Counter
+from contextlib import contextmanager
 from functools import wraps
+import threading
 from dojo.models import Finding, Dojo_User
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 
 from django_ratelimit.exceptions import Ratelimited
@@ -35,19 +38,112 @@ def we_want_async(*args, func=None, **kwargs):
 
 # Defect Dojo performs all tasks asynchrnonously using celery
 # *unless* the user initiating the task has set block_execution to True in their usercontactinfo profile
-def dojo_async_task(func):
-    @wraps(func)
-    def __wrapper__(*args, **kwargs):
-        from dojo.utils import get_current_user
-        user = get_current_user()
-        kwargs['async_user'] = user
-        countdown = kwargs.pop("countdown", 0)
-        if we_want_async(*args, func=func, **kwargs):
-            return func.apply_async(args=args, kwargs=kwargs, countdown=countdown)
-        else:
-            return func(*args, **kwargs)
+# example usage: @dojo_async_task or @dojo_async_task(coalesce_key=0) to coalesce the calls per value of parameter 0
+def dojo_async_task(_func=None, *, coalesce_key=None):
+
+    def dojo_async_task_internal(func):
+        @wraps(func)
+        def __wrapper__(*args, **kwargs):
+            from dojo.utils import get_current_user
+            user = get_current_user()
+            kwargs['async_user'] = user
+            countdown = kwargs.pop("countdown", 0)
+            if we_want_async(*args, func=func, **kwargs):
+                if coalesce_key is not None and settings.ASYNC_TASK_COALESCING:
+                    coalesced_tasks = get_coalesced_tasks()
+                    if coalesced_tasks is not None:
+                        key = get_parameter_froms_args_kwargs(args, kwargs, coalesce_key)
+                        coalesced_tasks.add(func, key.id if isinstance(key, models.Model) else key, args, kwargs, countdown)
+                        # like apply_async, report the task as queued
+                        return True
+                return func.apply_async(args=args, kwargs=kwargs, countdown=countdown)
+            else:
+                return func(*args, **kwargs)
 
-    return __wrapper__
+        return __wrapper__
+
+    if _func is None:
+        # decorator called with parameters
+        return dojo_async_task_internal
+    else:
+        return dojo_async_task_internal(_func)
+
+
+# number of calls and submitted tasks per coalescing task in this process
+coalesced_task_counts = Counter()
+
+# the calls of coalescing tasks buffered in the current thread
+_coalescing = threading.local()
+
+
+class CoalescedTasks(object):
+    """
+    The buffered calls of coalescing tasks. Calls of a task with the same key are merged into one task with the
+    arguments of the last call, so the key has to identify calls that do the same work (i.e. update a product or a
+    jira issue to its current state).
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.counts = Counter()
+
+    def add(self, task, key, args, kwargs, countdown):
+        logger.debug('coalescing call of %s for %s', task.name, key)
+        self.calls[(task.name, key)] = (task, args, kwargs, countdown)
+        self.counts[task.name] += 1
+
+    def submit(self):
+        submitted = Counter(name for name, key in self.calls)
+        for task, args, kwargs, countdown in self.calls.values():
+            task.apply_async(args=args, kwargs=kwargs, countdown=countdown)
+
+        for name, count in self.counts.items():
+            coalesced_task_counts[name + '.calls'] += count
+            coalesced_task_counts[name + '.submitted'] += submitted[name]
+            logger.info('coalesced %i calls of %s into %i tasks', count, name, submitted[name])
+
+        self.calls = {}
+        self.counts = Counter()
+
+
+def get_coalesced_tasks():
+    """
+    Returns the buffer for the calls of coalescing tasks: the buffer of the coalesce_async_tasks block or of the current
+    transaction, which is submitted when the transaction is committed. Returns None when the calls can't be buffered.
+    """
+    coalesced_tasks = getattr(_coalescing, 'block', None)
+    if coalesced_tasks is not None:
+        return coalesced_tasks
+
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return None
+
+    coalesced_tasks = getattr(_coalescing, 'transaction', None)
+    # the on_commit callbacks are discarded when a transaction is rolled back, with them the buffered calls
+    if coalesced_tasks is None or not any(callback[1] == coalesced_tasks.submit for callback in connection.run_on_commit):
+        coalesced_tasks = _coalescing.transaction = CoalescedTasks()
+        transaction.on_commit(coalesced_tasks.submit)
+    return coalesced_tasks
+
+
+@contextmanager
+def coalesce_async_tasks():
+    """
+    Buffers the calls of coalescing tasks in the block (or function when used as decorator) and submits the merged
+    tasks when the block ends or, inside a transaction, when the transaction is committed.
+    Nested blocks are part of the outermost block.
+    """
+    if not settings.ASYNC_TASK_COALESCING or getattr(_coalescing, 'block', None) is not None:
+        yield
+        return
+
+    coalesced_tasks = _coalescing.block = CoalescedTasks()
+    try:
+        yield
+    finally:
+        _coalescing.block = None
+        transaction.on_commit(coalesced_tasks.submit)
 
 
 # decorator with parameters needs another wrapper layer
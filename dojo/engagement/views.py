@@ -297,8 +297,9 @@ def delete_engagement(request, eid):
                 product = engagement.product
                 if get_setting("ASYNC_OBJECT_DELETE"):
                     async_del = async_delete()
-                    async_del.delete(engagement)
-                    message = 'Engagement and relationships will be removed in the background.'
+                    job = async_del.delete(engagement)
+                    message = 'Engagement and relationships will be removed in the background, see %s for the progress.' \
+                        % reverse('async_delete_job_status', args=(job.id,))
                 else:
                     message = 'Engagement and relationships removed.'
                     engagement.delete()
@@ -745,7 +746,7 @@ def import_scan_results(request, eid=None, pid=None):
          'title': title,
          'cred_form': cred_form,
          'jform': jform,
-         'scan_types': get_scan_types_sorted(),
+         'scan_types': get_scan_types_sorted(active_only=True),
          })
 
 
@@ -1,16 +1,25 @@
+from auditlog.context import threadlocal as auditlog_threadlocal
+from auditlog.diff import model_instance_diff
+from auditlog.models import LogEntry
+from auditlog.registry import auditlog
+from django.contrib.contenttypes.models import ContentType
 from django.db.models.query_utils import Q
+from django.utils.encoding import smart_str
 from django.db.models.signals import post_delete, pre_delete
 from django.dispatch.dispatcher import receiver
 from dojo.celery import app
 from dojo.decorators import dojo_async_task, dojo_model_from_id, dojo_model_to_id
+from collections import defaultdict
 import dojo.jira_link.helper as jira_helper
+import copy
+import json
 import logging
 from time import strftime
 from django.utils import timezone
 from django.conf import settings
 from fieldsignals import pre_save_changed
 from dojo.utils import get_current_user, mass_model_updater, to_str_typed
-from dojo.models import Engagement, Finding, Finding_Group, System_Settings, Test, Endpoint, Endpoint_Status, \
+from dojo.models import Engagement, Finding, Finding_Group, Product, System_Settings, Test, Endpoint, Endpoint_Status, \
     Vulnerability_Id, Vulnerability_Id_Template
 from dojo.endpoint.utils import save_endpoints_to_add
 
@@ -51,21 +60,23 @@ def pre_save_finding_status_change(sender, instance, changed_fields=None, **kwar
         update_finding_status(instance, user, changed_fields)
 
 
+# the fields that trigger update_finding_status when they change
+FINDING_STATUS_FIELDS = [
+    "active",
+    "verified",
+    "false_p",
+    "is_mitigated",
+    "mitigated",
+    "mitigated_by",
+    "out_of_scope",
+    "risk_accepted",
+]
+
 # also get signal when id is set/changed so we can process new findings
 pre_save_changed.connect(
     pre_save_finding_status_change,
     sender=Finding,
-    fields=[
-        "id",
-        "active",
-        "verified",
-        "false_p",
-        "is_mitigated",
-        "mitigated",
-        "mitigated_by",
-        "out_of_scope",
-        "risk_accepted",
-    ],
+    fields=["id"] + FINDING_STATUS_FIELDS,
 )
 
 
@@ -143,6 +154,194 @@ def can_edit_mitigated_data(user):
     return settings.EDITABLE_MITIGATED_DATA and user.is_superuser
 
 
+def bulk_update_findings(finds, update, fields, user=None, batch_size=1000):
+    """
+    Calls update(finding) for each finding and saves the fields with one query per batch instead of a save() per finding.
+    Changed status fields get the same dependent changes (mitigated, last_status_update, ...) as with save(), but no
+    signals are sent: the auditlog entries are written here, the follow-up work of save() is done by
+    post_process_findings_bulk_update.
+    """
+    fields = list(dict.fromkeys(list(fields) + FINDING_STATUS_FIELDS + ['duplicate', 'duplicate_finding', 'last_status_update']))
+    log_changes = auditlog.contains(Finding) and not getattr(auditlog_threadlocal, 'auditlog_disabled', False)
+    if log_changes:
+        # the log entries contain the related objects as text
+        finds = finds.select_related(*[field for field in fields if Finding._meta.get_field(field).is_relation])
+    batch = []
+    log_entries = []
+    for finding in finds.iterator(chunk_size=batch_size):
+        old_finding = copy.copy(finding)
+        update(finding)
+        changed_fields = {field: (getattr(old_finding, field), getattr(finding, field))
+                          for field in FINDING_STATUS_FIELDS if getattr(finding, field) != getattr(old_finding, field)}
+        if changed_fields:
+            update_finding_status(finding, user, changed_fields)
+        batch.append(finding)
+        if log_changes:
+            log_entry = get_bulk_update_log_entry(old_finding, finding, fields, user)
+            if log_entry:
+                log_entries.append(log_entry)
+        if len(batch) >= batch_size:
+            Finding.objects.bulk_update(batch, fields)
+            LogEntry.objects.bulk_create(log_entries)
+            batch = []
+            log_entries = []
+    if batch:
+        Finding.objects.bulk_update(batch, fields)
+        LogEntry.objects.bulk_create(log_entries)
+
+
+def get_bulk_update_log_entry(old_finding, finding, fields, user):
+    """Returns the auditlog entry that save() would have written for the changes of the fields, or None"""
+    changed_fields = [field for field in fields
+                      if getattr(old_finding, Finding._meta.get_field(field).attname) != getattr(finding, Finding._meta.get_field(field).attname)]
+    changes = model_instance_diff(old_finding, finding, fields_to_check=changed_fields) if changed_fields else None
+    if not changes:
+        return None
+    # the auditlog middleware sets the actor and address with a pre_save signal, which bulk_create() doesn't send
+    remote_addr = (getattr(auditlog_threadlocal, 'auditlog', None) or {}).get('remote_addr')
+    return LogEntry(content_type=ContentType.objects.get_for_model(Finding), object_pk=str(finding.pk), object_id=finding.pk,
+                    object_repr=smart_str(finding), action=LogEntry.Action.UPDATE, changes=json.dumps(changes),
+                    actor=user, remote_addr=remote_addr)
+
+
+def bulk_set_tags(finds, tags):
+    """
+    Replaces the tags of the findings with one delete and one insert of the tag relations instead of a save() per finding.
+    The tags inherited from the product are kept.
+    """
+    field = Finding._meta.get_field('tags')
+    through = field.remote_field.through
+    tag_field_name = field.m2m_reverse_field_name()
+    if field.tag_options.force_lowercase:
+        tags = [tag.lower() for tag in tags]
+    new_tags = [field.tag_model.objects.get_or_create(name=tag)[0] for tag in dict.fromkeys(tags)]
+
+    finding_ids = list(finds.values_list('id', flat=True))
+    inherited_field = Finding._meta.get_field('inherited_tags')
+    inherited_tags = set(inherited_field.remote_field.through.objects.filter(finding_id__in=finding_ids)
+                         .values_list('finding_id', inherited_field.m2m_reverse_field_name() + '__name'))
+    old_relations = through.objects.filter(finding_id__in=finding_ids).values_list('id', 'finding_id', tag_field_name + '_id', tag_field_name + '__name')
+    old_tag_ids = set()
+    removed_relation_ids = []
+    for relation_id, finding_id, tag_id, tag_name in old_relations:
+        if (finding_id, tag_name) not in inherited_tags:
+            old_tag_ids.add(tag_id)
+            removed_relation_ids.append(relation_id)
+    through.objects.filter(id__in=removed_relation_ids).delete()
+    through.objects.bulk_create([through(finding_id=finding_id, **{tag_field_name: tag}) for finding_id in finding_ids for tag in new_tags
+                                 if (finding_id, tag.name) not in inherited_tags],
+                                batch_size=1000)
+
+    for tag in field.tag_model.objects.filter(id__in=old_tag_ids | set(tag.id for tag in new_tags)):
+        tag.update_count()
+
+
+def queue_findings_bulk_update_post_processing(finds, **options):
+    """
+    Runs the follow-up work of a bulk update as one background task per product. Returns the id of the celery group
+    of these tasks, which finding_bulk_update_job_status reports on, or None if the work was done in the foreground.
+    """
+    from dojo.decorators import we_want_async
+    from celery import group
+
+    finding_ids = defaultdict(list)
+    for finding_id, product_id in finds.order_by('id').values_list('id', 'test__engagement__product_id'):
+        finding_ids[product_id].append(finding_id)
+
+    if not we_want_async(func=post_process_findings_bulk_update):
+        for product_id, ids in finding_ids.items():
+            post_process_findings_bulk_update(product_id, ids, **options)
+        return None
+
+    job = group(post_process_findings_bulk_update.s(product_id, ids, **options) for product_id, ids in finding_ids.items()).apply_async()
+    # the results of the tasks are kept in the result backend to report the progress of the job
+    job.save()
+    return job.id
+
+
+@app.task(ignore_result=False)
+def post_process_findings_bulk_update(product_id, finding_ids, product_grading_option=False, push_to_jira=False,
+                                      false_positive_ids=(), reactivated_false_positive_ids=(), tags_changed=False,
+                                      risk_accepted_ids=(), risk_unaccepted_ids=(), *args, **kwargs):
+    """
+    The follow-up work of save() for the findings of one product after a bulk update: false positive history, tag
+    inheritance, tool issue updates, JIRA pushes and risk acceptance comments, the product grade and the metrics rollup.
+    """
+    from dojo.tools import tool_issue_updater
+    from dojo.utils import do_false_positive_history, match_finding_to_existing_findings, perform_product_grading
+    from dojo.metrics.helper import perform_metrics_rollup
+    import dojo.risk_acceptance.helper as ra_helper
+
+    system_settings = System_Settings.objects.get()
+    findings = Finding.objects.filter(id__in=finding_ids).select_related('test__engagement__product', 'test__test_type').order_by('id')
+
+    if system_settings.false_positive_history:
+        for finding in findings.filter(id__in=false_positive_ids):
+            do_false_positive_history(finding)
+
+        # If finding was a false positive and is being reactivated: retroactively reactivates all equal findings
+        if system_settings.retroactive_false_positive_history:
+            for finding in findings.filter(id__in=reactivated_false_positive_ids):
+                logger.debug('FALSE_POSITIVE_HISTORY: Reactivating existing findings based on: %s', finding)
+                existing_fp_findings = match_finding_to_existing_findings(
+                    finding, product=finding.test.engagement.product
+                ).filter(false_p=True)
+
+                for fp in existing_fp_findings:
+                    logger.debug('FALSE_POSITIVE_HISTORY: Reactivating false positive %i: %s', fp.id, fp)
+                    fp.active = finding.active
+                    fp.verified = finding.verified
+                    fp.false_p = False
+                    fp.out_of_scope = finding.out_of_scope
+                    fp.is_mitigated = finding.is_mitigated
+                    fp.save_no_options()
+
+    if tags_changed:
+        from dojo.product.signals import inherit_product_tags, propagate_inheritance
+        for finding in findings.prefetch_related('tags', 'inherited_tags', 'test__engagement__product__tags'):
+            if inherit_product_tags(finding):
+                tag_list = [tag.name for tag in finding.tags.all()]
+                if propagate_inheritance(finding, tag_list=tag_list):
+                    finding.inherit_tags(tag_list)
+
+    # the finding groups are pushed instead of their findings
+    groups_pushed_to_jira = False
+    if push_to_jira:
+        for group in Finding_Group.objects.filter(findings__in=findings).distinct():
+            can_be_pushed_to_jira, error_message, error_code = jira_helper.can_be_pushed_to_jira(group)
+            if not can_be_pushed_to_jira:
+                jira_helper.log_jira_alert(error_message, group)
+            else:
+                logger.debug('pushing to jira from post_process_findings_bulk_update()')
+                jira_helper.push_to_jira(group)
+                groups_pushed_to_jira = True
+
+    for finding in findings:
+        tool_issue_updater.async_tool_issue_update(finding)
+
+        if not groups_pushed_to_jira and (push_to_jira or jira_helper.is_push_all_issues(finding)):
+            can_be_pushed_to_jira, error_message, error_code = jira_helper.can_be_pushed_to_jira(finding)
+            if finding.has_jira_group_issue and not finding.has_jira_issue:
+                jira_helper.log_jira_alert('finding already pushed as part of Finding Group', finding)
+            elif not can_be_pushed_to_jira:
+                jira_helper.log_jira_alert(error_message, finding)
+            else:
+                logger.debug('pushing to jira from post_process_findings_bulk_update()')
+                jira_helper.push_to_jira(finding)
+
+    for finding in findings.filter(id__in=risk_accepted_ids):
+        ra_helper.post_jira_comment(finding, ra_helper.accepted_message_creator)
+    for finding in findings.filter(id__in=risk_unaccepted_ids):
+        ra_helper.post_jira_comment(finding, ra_helper.unaccepted_message_creator)
+
+    if product_grading_option:
+        perform_product_grading(Product.objects.get(id=product_id))
+
+    # the bulk updates don't send the post_save signals that update the rollup
+    if settings.METRICS_ROLLUP_ENABLED:
+        perform_metrics_rollup(product_id)
+
+
 def create_finding_group(finds, finding_group_name):
     logger.debug('creating finding_group_create')
     if not finds or len(finds) == 0:
@@ -338,6 +537,49 @@ def add_findings_to_auto_group(name, findings, group_by, create_finding_groups_f
 def post_process_finding_save(finding, dedupe_option=True, rules_option=True, product_grading_option=True,
              issue_updater_option=True, push_to_jira=False, user=None, *args, **kwargs):
 
+    post_process_finding_save_internal(finding, dedupe_option=dedupe_option, rules_option=rules_option, product_grading_option=product_grading_option,
+        issue_updater_option=issue_updater_option, push_to_jira=push_to_jira, user=user, *args, **kwargs)
+
+
+# same as post_process_finding_save, but for a batch of findings of the same test, i.e. the ones inserted by the bulk importer.
+# product grading is done only once for the whole batch instead of once per finding
+@dojo_async_task
+@app.task
+def post_process_findings_batch(finding_ids, dedupe_option=True, rules_option=True, product_grading_option=True,
+             issue_updater_option=True, push_to_jira=False, user=None, *args, **kwargs):
+
+    if not finding_ids:
+        return
+
+    findings = list(Finding.objects.filter(id__in=finding_ids).select_related('test__engagement__product', 'test__test_type')
+                    .prefetch_related('endpoints').order_by('id'))
+
+    # all findings of the batch are deduplicated against one in memory index of the product's findings
+    dedupe_session = None
+    if dedupe_option and findings and System_Settings.objects.get().enable_deduplication:
+        from dojo.utils import DedupeSession
+        dedupe_session = DedupeSession(findings[0].test.engagement.product)
+
+    from dojo.metrics.helper import defer_metrics_rollup
+    with defer_metrics_rollup():
+        for finding in findings:
+            # findings of the same batch were inserted at once, so only consider older findings as original to
+            # keep the same outcome as when findings are saved (and deduplicated) one by one
+            post_process_finding_save_internal(finding, dedupe_option=dedupe_option, rules_option=rules_option, product_grading_option=False,
+                issue_updater_option=issue_updater_option, push_to_jira=push_to_jira, user=user, dedupe_only_older=True,
+                dedupe_session=dedupe_session)
+
+        if dedupe_session:
+            dedupe_session.flush()
+
+    if product_grading_option and findings:
+        from dojo.utils import perform_product_grading
+        perform_product_grading(findings[0].test.engagement.product)
+
+
+def post_process_finding_save_internal(finding, dedupe_option=True, rules_option=True, product_grading_option=True,
+             issue_updater_option=True, push_to_jira=False, user=None, *args, dedupe_only_older=False, dedupe_session=None, **kwargs):
+
     system_settings = System_Settings.objects.get()
 
     # STEP 1 run all status changing tasks sequentially to avoid race conditions
@@ -345,7 +587,7 @@ def post_process_finding_save(finding, dedupe_option=True, rules_option=True, pr
         if finding.hash_code is not None:
             if system_settings.enable_deduplication:
                 from dojo.utils import do_dedupe_finding
-                do_dedupe_finding(finding, *args, **kwargs)
+                do_dedupe_finding(finding, *args, only_older=dedupe_only_older, dedupe_session=dedupe_session, **kwargs)
             else:
                 deduplicationLogger.debug("skipping dedupe because it's disabled in system settings")
         else:
@@ -365,11 +607,8 @@ def post_process_finding_save(finding, dedupe_option=True, rules_option=True, pr
         tool_issue_updater.async_tool_issue_update(finding)
 
     if product_grading_option:
-        if system_settings.enable_product_grade:
-            from dojo.utils import calculate_grade
-            calculate_grade(finding.test.engagement.product)
-        else:
-            deduplicationLogger.debug("skipping product grading because it's disabled in system settings")
+        from dojo.utils import perform_product_grading
+        perform_product_grading(finding.test.engagement.product)
 
     # Adding a snippet here for push to JIRA so that it's in one place
     if push_to_jira:
@@ -479,55 +718,46 @@ def reconfigure_duplicate_cluster(original, cluster_outside):
             mass_model_updater(Finding, cluster_outside, lambda f: set_new_original(f, new_original), fields=['duplicate_finding'])
 
 
-def prepare_duplicates_for_delete(test=None, engagement=None):
+def prepare_duplicates_for_delete(test=None, engagement=None, findings=None, finding_ids=None, fix_loops=True):
+    """
+    Prepares the duplicate clusters of the originals that are going to be deleted with the test, the engagement or the
+    queryset findings: the duplicates inside are reset so django can delete them and the duplicates outside get a new
+    original. finding_ids limits the originals to a batch of the findings, as deleted by async_delete, which fixes the
+    loops once for all batches and passes fix_loops=False.
+    """
     logger.debug('prepare duplicates for delete, test: %s, engagement: %s', test.id if test else None, engagement.id if engagement else None)
-    if test is None and engagement is None:
-        logger.warning('nothing to prepare as test and engagement are None')
-
-    fix_loop_duplicates()
-
-    # get all originals in the test/engagement
-    originals = Finding.objects.filter(original_finding__isnull=False)
-    if engagement:
-        originals = originals.filter(test__engagement=engagement)
-    if test:
-        originals = originals.filter(test=test)
+    if findings is None:
+        if test is None and engagement is None:
+            logger.warning('nothing to prepare as test and engagement are None')
 
-    # use distinct to flatten the join result
-    originals = originals.distinct()
-
-    if len(originals) == 0:
-        logger.debug('no originals found, so no duplicates to prepare for deletion of original')
-        return
-
-    # remove the link to the original from the duplicates inside the cluster so they can be safely deleted by the django framework
-    total = len(originals)
-    i = 0
-    # logger.debug('originals: %s', [original.id for original in originals])
-    for original in originals:
-        i += 1
-        logger.debug('%d/%d: preparing duplicate cluster for deletion of original: %d', i, total, original.id)
-        cluster_inside = original.original_finding.all()
+        findings = Finding.objects.all()
         if engagement:
-            cluster_inside = cluster_inside.filter(test__engagement=engagement)
-
+            findings = findings.filter(test__engagement=engagement)
         if test:
-            cluster_inside = cluster_inside.filter(test=test)
+            findings = findings.filter(test=test)
 
-        if len(cluster_inside) > 0:
-            reset_duplicates_before_delete(cluster_inside)
+    # the tests and engagements deleted by async_delete have no findings left
+    if fix_loops and findings.exists():
+        fix_loop_duplicates()
 
-        # reconfigure duplicates outside test/engagement
-        cluster_outside = original.original_finding.all()
-        if engagement:
-            cluster_outside = cluster_outside.exclude(test__engagement=engagement)
+    # get all originals in the test/engagement, use distinct to flatten the join result
+    originals = findings.filter(original_finding__isnull=False)
+    if finding_ids is not None:
+        originals = originals.filter(id__in=finding_ids)
+    original_ids = list(originals.distinct().values_list('id', flat=True))
 
-        if test:
-            cluster_outside = cluster_outside.exclude(test=test)
+    if len(original_ids) == 0:
+        logger.debug('no originals found, so no duplicates to prepare for deletion of original')
+        return
 
-        if len(cluster_outside) > 0:
-            reconfigure_duplicate_cluster(original, cluster_outside)
+    # remove the link to the original from the duplicates inside the cluster so they can be safely deleted by the django framework,
+    # for all clusters at once
+    logger.debug('preparing %d duplicate clusters for deletion of the original', len(original_ids))
+    findings.filter(duplicate_finding__in=original_ids).update(duplicate=False, duplicate_finding=None)
 
+    # reconfigure duplicates outside test/engagement, all that is left of the clusters
+    for original in Finding.objects.filter(id__in=original_ids, original_finding__isnull=False).distinct():
+        reconfigure_duplicate_cluster(original, original.original_finding.all())
         logger.debug('done preparing duplicate cluster for deletion of original: %d', original.id)
 
 
@@ -553,6 +783,55 @@ def engagement_post_delete(sender, instance, **kwargs):
     logger.debug('engagement post_delete, sender: %s instance: %s', to_str_typed(sender), to_str_typed(instance))
 
 
+def get_hash_code_columns():
+    # all finding columns that compute_hash_code() can read, including the fallback to the legacy algorithm
+    fields = set(settings.HASHCODE_ALLOWED_FIELDS) | set(getattr(settings, 'HASH_CODE_FIELDS_ALWAYS', []))
+    fields |= {'title', 'cwe', 'line', 'file_path', 'description', 'dynamic_finding', 'hash_code'}
+    return sorted(field.name for field in Finding._meta.concrete_fields if field.name in fields)
+
+
+def bulk_update_hash_codes(finding_ids):
+    """
+    Recomputes the hash_code of a page of findings with a few queries: only the columns used for the hash_code are
+    fetched, the endpoints and vulnerability ids are fetched for the whole page at once and only the changed hash_codes
+    are written back with bulk_update(). Returns the number of findings for which the hash_code changed.
+    """
+    findings = list(Finding.objects.filter(id__in=finding_ids)
+                    .select_related('test__test_type')
+                    .only('id', 'test__scan_type', 'test__test_type__name', *get_hash_code_columns())
+                    .order_by('id'))
+
+    hash_code_fields = set()
+    for test in {finding.test for finding in findings}:
+        hash_code_fields |= set(test.hash_code_fields or [])
+
+    endpoints = {}
+    if 'endpoints' in hash_code_fields:
+        for finding_id, *values in Endpoint_Status.objects.filter(finding_id__in=finding_ids).order_by().values_list(
+                'finding_id', 'endpoint__protocol', 'endpoint__userinfo', 'endpoint__host', 'endpoint__port',
+                'endpoint__path', 'endpoint__query', 'endpoint__fragment'):
+            endpoint = Endpoint(**dict(zip(['protocol', 'userinfo', 'host', 'port', 'path', 'query', 'fragment'], values)))
+            endpoints.setdefault(finding_id, []).append(str(endpoint))
+
+    vulnerability_ids = {}
+    if 'vulnerability_ids' in hash_code_fields:
+        for finding_id, vulnerability_id in Vulnerability_Id.objects.filter(finding_id__in=finding_ids).order_by().values_list(
+                'finding_id', 'vulnerability_id'):
+            vulnerability_ids.setdefault(finding_id, []).append(vulnerability_id)
+
+    changed = []
+    for finding in findings:
+        hash_code = finding.compute_hash_code(endpoints=''.join(sorted(endpoints.get(finding.id, []))),
+                                              vulnerability_ids=''.join(sorted(vulnerability_ids.get(finding.id, []))))
+        if hash_code != finding.hash_code:
+            logger.debug('%d: hash_code changed from %s to %s', finding.id, finding.hash_code, hash_code)
+            finding.hash_code = hash_code
+            changed.append(finding)
+
+    Finding.objects.bulk_update(changed, ['hash_code'])
+    return len(changed)
+
+
 def fix_loop_duplicates():
     """ Due to bugs in the past and even currently when under high parallel load, there can be transitive duplicates. """
     """ i.e. A -> B -> C. This can lead to problems when deleting findingns, performing deduplication, etc """
@@ -10,6 +10,8 @@ urlpatterns = [
         name='finding_bulk_update_all'),
     re_path(r'^product/(?P<pid>\d+)/finding/bulk_product$', views.finding_bulk_update_all,
         name='finding_bulk_update_all_product'),
+    re_path(r'^finding/bulk/job/(?P<job_handle>[\w:-]+)$', views.finding_bulk_update_job_status,
+        name='finding_bulk_update_job_status'),
     # re_path(r'^test/(?P<tid>\d+)/bulk', views.finding_bulk_update_all,
     #     name='finding_bulk_update_all_test'),
     re_path(r'^finding/open$', views.open_findings,
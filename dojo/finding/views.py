@@ -3,13 +3,13 @@ import base64
 import json
 import logging
 import mimetypes
-from collections import OrderedDict, defaultdict
+from collections import OrderedDict
 from django.db import models
 from django.db.models.functions import Length
 from django.conf import settings
 from django.contrib import messages
 from django.core.exceptions import PermissionDenied, ValidationError
-from django.core import serializers
+from django.core import serializers, signing
 from django.urls import reverse
 from django.http import Http404, HttpResponse, JsonResponse
 from django.http import HttpResponseRedirect
@@ -22,6 +22,7 @@ from django.views.decorators.http import require_POST
 from itertools import chain
 from imagekit import ImageSpec
 from imagekit.processors import ResizeToFill
+from dojo.sla_config.helpers import annotate_sla_configuration
 from dojo.utils import (
     add_error_message_to_response,
     add_field_errors_to_response,
@@ -29,7 +30,6 @@ from dojo.utils import (
     close_external_issue,
     redirect,
     reopen_external_issue,
-    do_false_positive_history,
     match_finding_to_existing_findings,
 )
 import copy
@@ -103,6 +103,10 @@ from dojo.utils import (
     get_words_for_field,
 )
 from dojo.notifications.helper import create_notification
+from dojo.decorators import coalesce_async_tasks
+from dojo.metrics.helper import defer_metrics_rollup
+from dojo.celery import app
+from celery.result import GroupResult
 
 from django.template.defaultfilters import pluralize
 from django.db.models import Q, QuerySet, Count
@@ -371,6 +375,7 @@ def prefetch_for_findings(findings, prefetch_type="all"):
         prefetched_findings = prefetched_findings.prefetch_related(
             "vulnerability_id_set"
         )
+        prefetched_findings = annotate_sla_configuration(prefetched_findings)
     else:
         logger.debug("unable to prefetch because query was already executed")
 
@@ -2457,6 +2462,8 @@ def merge_finding_product(request, pid):
 
 
 # bulk update and delete are combined, so we can't have the nice user_is_authorized decorator
+@coalesce_async_tasks()
+@defer_metrics_rollup()
 def finding_bulk_update_all(request, pid=None):
     system_settings = System_Settings.objects.get()
 
@@ -2471,7 +2478,6 @@ def finding_bulk_update_all(request, pid=None):
         finding_to_update = request.POST.getlist("finding_to_update")
         finds = Finding.objects.filter(id__in=finding_to_update).order_by("id")
         total_find_count = finds.count()
-        prods = set([find.test.engagement.product for find in finds])
         if request.POST.get("delete_bulk_findings"):
             if form.is_valid() and finding_to_update:
                 if pid is not None:
@@ -2529,94 +2535,85 @@ def finding_bulk_update_all(request, pid=None):
                         )
                     )
 
-                finds = prefetch_for_findings(finds)
-                if form.cleaned_data["severity"] or form.cleaned_data["status"]:
-                    for find in finds:
-                        old_find = copy.deepcopy(find)
-
-                        if form.cleaned_data["severity"]:
-                            find.severity = form.cleaned_data["severity"]
-                            find.numerical_severity = Finding.get_numerical_severity(
-                                form.cleaned_data["severity"]
-                            )
-                            find.last_reviewed = now
-                            find.last_reviewed_by = request.user
-
-                        if form.cleaned_data["status"]:
-                            # logger.debug('setting status from bulk edit form: %s', form)
-                            find.active = form.cleaned_data["active"]
-                            find.verified = form.cleaned_data["verified"]
-                            find.false_p = form.cleaned_data["false_p"]
-                            find.out_of_scope = form.cleaned_data["out_of_scope"]
-                            find.is_mitigated = form.cleaned_data["is_mitigated"]
-                            find.last_reviewed = timezone.now()
-                            find.last_reviewed_by = request.user
-
-                        # use super to avoid all custom logic in our overriden save method
-                        # it will trigger the pre_save signal
-                        find.save_no_options()
-
-                        if system_settings.false_positive_history:
-                            # If finding is being marked as false positive
-                            if find.false_p:
-                                do_false_positive_history(find)
-
-                            # If finding was a false positive and is being reactivated: retroactively reactivates all equal findings
-                            elif old_find.false_p and not find.false_p:
-                                if system_settings.retroactive_false_positive_history:
-                                    logger.debug('FALSE_POSITIVE_HISTORY: Reactivating existing findings based on: %s', find)
-
-                                    existing_fp_findings = match_finding_to_existing_findings(
-                                        find, product=find.test.engagement.product
-                                    ).filter(false_p=True)
-
-                                    for fp in existing_fp_findings:
-                                        logger.debug('FALSE_POSITIVE_HISTORY: Reactivating false positive %i: %s', fp.id, fp)
-                                        fp.active = find.active
-                                        fp.verified = find.verified
-                                        fp.false_p = False
-                                        fp.out_of_scope = find.out_of_scope
-                                        fp.is_mitigated = find.is_mitigated
-                                        fp.save_no_options()
-
-                    for prod in prods:
-                        calculate_grade(prod)
-
-                if form.cleaned_data["date"]:
-                    for finding in finds:
-                        finding.date = form.cleaned_data["date"]
-                        finding.save_no_options()
-
-                if form.cleaned_data["planned_remediation_date"]:
-                    for finding in finds:
-                        finding.planned_remediation_date = form.cleaned_data[
-                            "planned_remediation_date"
-                        ]
-                        finding.save_no_options()
+                # the plain field changes are saved with bulk updates, the follow-up work of save() like the
+                # grading and the JIRA pushes is done by one background task per product
+                finding_ids = list(finds.values_list("id", flat=True))
+                finds = Finding.objects.filter(id__in=finding_ids).select_related("test__engagement__product").order_by("id")
+                product_grading_option = False
+                tags_changed = False
+
+                if form.cleaned_data["severity"]:
+                    def update_severity(find):
+                        find.severity = form.cleaned_data["severity"]
+                        find.numerical_severity = Finding.get_numerical_severity(form.cleaned_data["severity"])
+                        find.last_reviewed = now
+                        find.last_reviewed_by = request.user
+
+                    finding_helper.bulk_update_findings(
+                        finds, update_severity, ["severity", "numerical_severity", "last_reviewed", "last_reviewed_by"], user=request.user
+                    )
+                    product_grading_option = True
+
+                false_positive_history = (form.cleaned_data["severity"] or form.cleaned_data["status"]) and system_settings.false_positive_history
+                if false_positive_history:
+                    old_false_positive_ids = set(finds.filter(false_p=True).values_list("id", flat=True))
+
+                if form.cleaned_data["status"]:
+                    def update_status(find):
+                        # logger.debug('setting status from bulk edit form: %s', form)
+                        find.active = form.cleaned_data["active"]
+                        find.verified = form.cleaned_data["verified"]
+                        find.false_p = form.cleaned_data["false_p"]
+                        find.out_of_scope = form.cleaned_data["out_of_scope"]
+                        find.is_mitigated = form.cleaned_data["is_mitigated"]
+                        find.last_reviewed = now
+                        find.last_reviewed_by = request.user
+
+                    finding_helper.bulk_update_findings(finds, update_status, ["last_reviewed", "last_reviewed_by"], user=request.user)
+                    product_grading_option = True
+
+                false_positive_ids = []
+                reactivated_false_positive_ids = []
+                if false_positive_history:
+                    false_positive_ids = list(finds.filter(false_p=True).values_list("id", flat=True))
+                    reactivated_false_positive_ids = sorted(old_false_positive_ids - set(false_positive_ids))
+
+                field_updates = {
+                    field: form.cleaned_data[field]
+                    for field in ["date", "planned_remediation_date", "planned_remediation_version"]
+                    if form.cleaned_data[field]
+                }
+                if field_updates:
+                    def update_fields(find):
+                        for field, value in field_updates.items():
+                            setattr(find, field, value)
 
-                if form.cleaned_data["planned_remediation_version"]:
-                    for finding in finds:
-                        finding.planned_remediation_version = form.cleaned_data[
-                            "planned_remediation_version"
-                        ]
-                        finding.save_no_options()
+                    finding_helper.bulk_update_findings(finds, update_fields, list(field_updates), user=request.user)
 
                 skipped_risk_accept_count = 0
+                risk_accepted_ids = []
+                risk_unaccepted_ids = []
                 if form.cleaned_data["risk_acceptance"]:
-                    for finding in finds:
+                    if form.cleaned_data["risk_accept"]:
+                        skipped_risk_accept_count = finds.filter(
+                            duplicate=False, test__engagement__product__enable_simple_risk_acceptance=False
+                        ).count()
+
+                    # the JIRA comments are posted by the background work, after the findings are saved
+                    def update_risk_acceptance(finding):
                         if not finding.duplicate:
                             if form.cleaned_data["risk_accept"]:
-                                if (
-                                    not finding.test.engagement.product.enable_simple_risk_acceptance
-                                ):
-                                    skipped_risk_accept_count += 1
-                                else:
-                                    ra_helper.simple_risk_accept(finding)
+                                if finding.test.engagement.product.enable_simple_risk_acceptance:
+                                    ra_helper.simple_risk_accept(finding, perform_save=False, post_comments=False)
+                                    risk_accepted_ids.append(finding.id)
                             elif form.cleaned_data["risk_unaccept"]:
-                                ra_helper.risk_unaccept(finding)
+                                if finding.risk_accepted:
+                                    risk_unaccepted_ids.append(finding.id)
+                                ra_helper.risk_unaccept(finding, perform_save=False, post_comments=False, remove_from_risk_acceptances=False)
 
-                    for prod in prods:
-                        calculate_grade(prod)
+                    finding_helper.bulk_update_findings(finds, update_risk_acceptance, [], user=request.user)
+                    ra_helper.remove_findings_from_any_risk_acceptance(risk_unaccepted_ids)
+                    product_grading_option = True
 
                 if skipped_risk_accept_count > 0:
                     messages.add_message(
@@ -2766,114 +2763,31 @@ def finding_bulk_update_all(request, pid=None):
                     )
                     history.save()
                     note.history.add(history)
-                    for finding in finds:
-                        finding.notes.add(note)
-                        finding.save()
+                    Finding.notes.through.objects.bulk_create(
+                        [Finding.notes.through(finding_id=finding_id, notes_id=note.id) for finding_id in finding_ids],
+                        batch_size=1000,
+                    )
 
                 if form.cleaned_data["tags"]:
-                    for finding in finds:
-                        tags = form.cleaned_data["tags"]
-                        logger.debug(
-                            "bulk_edit: setting tags for: %i %s %s",
-                            finding.id,
-                            finding,
-                            tags,
-                        )
-                        # currently bulk edit overwrites existing tags
-                        finding.tags = tags
-                        finding.save()
-
-                error_counts = defaultdict(lambda: 0)
-                success_count = 0
-                finding_groups = set(
-                    [find.finding_group for find in finds if find.has_finding_group]
+                    logger.debug("bulk_edit: setting tags for %i findings: %s", len(finding_ids), form.cleaned_data["tags"])
+                    # currently bulk edit overwrites existing tags
+                    finding_helper.bulk_set_tags(finds, form.cleaned_data["tags"])
+                    tags_changed = True
+
+                job_id = finding_helper.queue_findings_bulk_update_post_processing(
+                    finds,
+                    product_grading_option=product_grading_option,
+                    push_to_jira=bool(form.cleaned_data.get("push_to_jira")),
+                    false_positive_ids=false_positive_ids,
+                    reactivated_false_positive_ids=reactivated_false_positive_ids,
+                    risk_accepted_ids=risk_accepted_ids,
+                    risk_unaccepted_ids=risk_unaccepted_ids,
+                    tags_changed=tags_changed,
                 )
-                logger.debug("finding_groups: %s", finding_groups)
-                groups_pushed_to_jira = False
-                for group in finding_groups:
-                    if form.cleaned_data.get("push_to_jira"):
-                        (
-                            can_be_pushed_to_jira,
-                            error_message,
-                            error_code,
-                        ) = jira_helper.can_be_pushed_to_jira(group)
-                        if not can_be_pushed_to_jira:
-                            error_counts[error_message] += 1
-                            jira_helper.log_jira_alert(error_message, group)
-                        else:
-                            logger.debug(
-                                "pushing to jira from finding.finding_bulk_update_all()"
-                            )
-                            jira_helper.push_to_jira(group)
-                            success_count += 1
-
-                for error_message, error_count in error_counts.items():
-                    add_error_message_to_response(
-                        "%i finding groups could not be pushed to JIRA: %s"
-                        % (error_count, error_message)
-                    )
-
-                if success_count > 0:
-                    add_success_message_to_response(
-                        "%i finding groups pushed to JIRA successfully" % success_count
-                    )
-                    groups_pushed_to_jira = True
-
-                # refresh from db
-                finds = finds.all()
-
-                error_counts = defaultdict(lambda: 0)
-                success_count = 0
-                for finding in finds:
-                    from dojo.tools import tool_issue_updater
-
-                    tool_issue_updater.async_tool_issue_update(finding)
-
-                    # not sure yet if we want to support bulk unlink, so leave as commented out for now
-                    # if form.cleaned_data['unlink_from_jira']:
-                    #     if finding.has_jira_issue:
-                    #         jira_helper.finding_unlink_jira(request, finding)
-
-                    # Because we never call finding.save() in a bulk update, we need to actually
-                    # push the JIRA stuff here, rather than in finding.save()
-                    # can't use helper as when push_all_jira_issues is True,
-                    # the checkbox gets disabled and is always false
-                    # push_to_jira = jira_helper.is_push_to_jira(new_finding,
-                    # form.cleaned_data.get('push_to_jira'))
-                    if not groups_pushed_to_jira and (
-                        jira_helper.is_push_all_issues(finding)
-                        or form.cleaned_data.get("push_to_jira")
-                    ):
-                        (
-                            can_be_pushed_to_jira,
-                            error_message,
-                            error_code,
-                        ) = jira_helper.can_be_pushed_to_jira(finding)
-                        if finding.has_jira_group_issue and not finding.has_jira_issue:
-                            error_message = (
-                                "finding already pushed as part of Finding Group"
-                            )
-                            error_counts[error_message] += 1
-                            jira_helper.log_jira_alert(error_message, finding)
-                        elif not can_be_pushed_to_jira:
-                            error_counts[error_message] += 1
-                            jira_helper.log_jira_alert(error_message, finding)
-                        else:
-                            logger.debug(
-                                "pushing to jira from finding.finding_bulk_update_all()"
-                            )
-                            jira_helper.push_to_jira(finding)
-                            success_count += 1
-
-                for error_message, error_count in error_counts.items():
-                    add_error_message_to_response(
-                        "%i findings could not be pushed to JIRA: %s"
-                        % (error_count, error_message)
-                    )
-
-                if success_count > 0:
+                if job_id:
                     add_success_message_to_response(
-                        "%i findings pushed to JIRA successfully" % success_count
+                        "The grading and JIRA pushes of the findings are processed in the background, see %s for the progress."
+                        % reverse("finding_bulk_update_job_status", args=(get_bulk_update_job_handle(job_id, request.user),))
                     )
 
                 if updated_find_count > 0:
@@ -2899,6 +2813,33 @@ def finding_bulk_update_all(request, pid=None):
     return redirect_to_return_url_or_else(request, None)
 
 
+# the celery group of a bulk update has no owner, so the handle in the status url is the signed id of the group and the user
+BULK_UPDATE_JOB_SALT = 'dojo.finding.bulk_update_job'
+
+
+def get_bulk_update_job_handle(job_id, user):
+    return signing.dumps([job_id, user.id], salt=BULK_UPDATE_JOB_SALT)
+
+
+def finding_bulk_update_job_status(request, job_handle):
+    try:
+        job_id, user_id = signing.loads(job_handle, salt=BULK_UPDATE_JOB_SALT)
+    except signing.BadSignature:
+        raise Http404()
+    # only the user who started the bulk update can follow the progress
+    if user_id != request.user.id and not request.user.is_superuser:
+        raise PermissionDenied()
+    job = GroupResult.restore(job_id, app=app)
+    if job is None:
+        raise Http404()
+    return JsonResponse({
+        'job_id': job_id,
+        'status': 'done' if job.ready() else 'pending',
+        'products': len(job),
+        'completed': job.completed_count(),
+    })
+
+
 def find_available_notetypes(notes):
     single_note_types = Note_Type.objects.filter(
         is_single=True, is_active=True
@@ -34,7 +34,7 @@ from dojo.models import Announcement, Finding, Finding_Group, Product_Type, Prod
     Product_Member, Global_Role, Dojo_Group, Product_Group, Product_Type_Group, Dojo_Group_Member, \
     Product_API_Scan_Configuration
 
-from dojo.tools.factory import requires_file, get_choices_sorted, requires_tool_type
+from dojo.tools.factory import requires_file, get_active_choices_sorted, requires_tool_type
 from django.urls import reverse
 from tagulous.forms import TagField
 import logging
@@ -431,7 +431,7 @@ class ImportScanForm(forms.Form):
 
     # help_do_not_reactivate = 'Select if the import should ignore active findings from the report, useful for triage-less scanners. Will keep existing findings closed, without reactivating them. For more information check the docs.'
     # do_not_reactivate = forms.BooleanField(help_text=help_do_not_reactivate, required=False)
-    scan_type = forms.ChoiceField(required=True, choices=get_choices_sorted)
+    scan_type = forms.ChoiceField(required=True, choices=get_active_choices_sorted)
     environment = forms.ModelChoiceField(
         queryset=Development_Environment.objects.all().order_by('name'))
     endpoints = forms.ModelMultipleChoiceField(Endpoint.objects, required=False, label='Systems / Endpoints')
@@ -2,7 +2,9 @@ import base64
 
 from django.db.models.query_utils import Q
 from dojo.importers import utils as importer_utils
-from dojo.decorators import dojo_async_task
+from dojo.decorators import coalesce_async_tasks, dojo_async_task
+from dojo.markdown_cache import warm_markdown_render_cache
+from dojo.metrics.helper import defer_metrics_rollup
 from dojo.utils import get_current_user, is_finding_groups_enabled
 from dojo.celery import app
 from django.core.exceptions import ValidationError
@@ -15,7 +17,7 @@ from django.core.files.base import ContentFile
 from django.utils import timezone
 from dojo.models import (BurpRawRequestResponse, FileUpload,
                          Finding, Test, Test_Import, Test_Type)
-from dojo.tools.factory import get_parser
+from dojo.tools.factory import get_parser, supports_iter_findings
 import logging
 
 
@@ -59,9 +61,16 @@ class DojoDefaultImporter(object):
 
     @dojo_async_task
     @app.task(ignore_result=False)
+    @defer_metrics_rollup()
+    @notifications_helper.batch_notifications()
     def process_parsed_findings(self, test, parsed_findings, scan_type, user, active=None, verified=None, minimum_severity=None,
                                 endpoints_to_add=None, push_to_jira=None, group_by=None, now=timezone.now(), service=None, scan_date=None,
-                                create_finding_groups_for_all_findings=True, **kwargs):
+                                create_finding_groups_for_all_findings=True, jira_group_finding_ids=None, **kwargs):
+        """
+        Saves the parsed findings of the test. The finding groups are pushed to JIRA after their findings have been
+        added, unless jira_group_finding_ids is given: then the first finding of each group is added to it, for the
+        caller to push the groups once after all batches of a streaming import.
+        """
         logger.debug('endpoints_to_add: %s', endpoints_to_add)
         new_findings = []
         items = parsed_findings
@@ -69,99 +78,81 @@ class DojoDefaultImporter(object):
         i = 0
         group_names_to_findings_dict = {}
 
-        for item in items:
-            # FIXME hack to remove when all parsers have unit tests for this attribute
-            if item.severity.lower().startswith('info') and item.severity != 'Info':
-                item.severity = 'Info'
-
-            item.numerical_severity = Finding.get_numerical_severity(item.severity)
-
-            if minimum_severity and (Finding.SEVERITIES[item.severity] >
-                    Finding.SEVERITIES[minimum_severity]):
-                # finding's severity is below the configured threshold : ignoring the finding
-                continue
-
-            item.test = test
-            item.reporter = user if user else get_current_user
-            item.last_reviewed = now
-            item.last_reviewed_by = user if user else get_current_user
-
-            logger.debug('process_parsed_findings: active from report: %s, verified from report: %s', item.active, item.verified)
-            if active is not None:
-                # indicates an override. Otherwise, do not change the value of item.active
-                item.active = active
-
-            if verified is not None:
-                # indicates an override. Otherwise, do not change the value of verified
-                item.verified = verified
-
-            # if scan_date was provided, override value from parser
-            if scan_date:
-                item.date = scan_date.date()
-
-            if service:
-                item.service = service
-
-            item.save(dedupe_option=False)
-
-            if is_finding_groups_enabled() and group_by:
-                # If finding groups are enabled, group all findings by group name
-                name = finding_helper.get_group_by_group_name(item, group_by)
-                if name is not None:
-                    if name in group_names_to_findings_dict:
-                        group_names_to_findings_dict[name].append(item)
-                    else:
-                        group_names_to_findings_dict[name] = [item]
-
-            if (hasattr(item, 'unsaved_req_resp') and
-                    len(item.unsaved_req_resp) > 0):
-                for req_resp in item.unsaved_req_resp:
+        if importer_utils.can_bulk_create_findings():
+            new_findings, group_names_to_findings_dict = self.bulk_create_parsed_findings(
+                test, items, user, active=active, verified=verified, minimum_severity=minimum_severity,
+                endpoints_to_add=endpoints_to_add, push_to_jira=push_to_jira, group_by=group_by, now=now,
+                service=service, scan_date=scan_date)
+        else:
+            # all findings of the import share the endpoint index of the product
+            endpoint_resolver = importer_utils.EndpointResolver(test.engagement.product)
+            for item in items:
+                if not self.prepare_parsed_finding(item, test, user, active=active, verified=verified, minimum_severity=minimum_severity,
+                                                   now=now, service=service, scan_date=scan_date):
+                    continue
+
+                item.save(dedupe_option=False)
+
+                if is_finding_groups_enabled() and group_by:
+                    # If finding groups are enabled, group all findings by group name
+                    name = finding_helper.get_group_by_group_name(item, group_by)
+                    if name is not None:
+                        if name in group_names_to_findings_dict:
+                            group_names_to_findings_dict[name].append(item)
+                        else:
+                            group_names_to_findings_dict[name] = [item]
+
+                if (hasattr(item, 'unsaved_req_resp') and
+                        len(item.unsaved_req_resp) > 0):
+                    for req_resp in item.unsaved_req_resp:
+                        burp_rr = BurpRawRequestResponse(
+                            finding=item,
+                            burpRequestBase64=base64.b64encode(req_resp["req"].encode("utf-8")),
+                            burpResponseBase64=base64.b64encode(req_resp["resp"].encode("utf-8")))
+                        burp_rr.clean()
+                        burp_rr.save()
+
+                if (item.unsaved_request is not None and
+                        item.unsaved_response is not None):
                     burp_rr = BurpRawRequestResponse(
                         finding=item,
-                        burpRequestBase64=base64.b64encode(req_resp["req"].encode("utf-8")),
-                        burpResponseBase64=base64.b64encode(req_resp["resp"].encode("utf-8")))
+                        burpRequestBase64=base64.b64encode(item.unsaved_request.encode()),
+                        burpResponseBase64=base64.b64encode(item.unsaved_response.encode()))
                     burp_rr.clean()
                     burp_rr.save()
 
-            if (item.unsaved_request is not None and
-                    item.unsaved_response is not None):
-                burp_rr = BurpRawRequestResponse(
-                    finding=item,
-                    burpRequestBase64=base64.b64encode(item.unsaved_request.encode()),
-                    burpResponseBase64=base64.b64encode(item.unsaved_response.encode()))
-                burp_rr.clean()
-                burp_rr.save()
-
-            importer_utils.chunk_endpoints_and_disperse(item, test, item.unsaved_endpoints)
-            if endpoints_to_add:
-                importer_utils.chunk_endpoints_and_disperse(item, test, endpoints_to_add)
-
-            if item.unsaved_tags:
-                item.tags = item.unsaved_tags
-
-            if item.unsaved_files:
-                for unsaved_file in item.unsaved_files:
-                    data = base64.b64decode(unsaved_file.get('data'))
-                    title = unsaved_file.get('title', '<No title>')
-                    file_upload, file_upload_created = FileUpload.objects.get_or_create(
-                        title=title,
-                    )
-                    file_upload.file.save(title, ContentFile(data))
-                    file_upload.save()
-                    item.files.add(file_upload)
-
-            importer_utils.handle_vulnerability_ids(item)
-
-            new_findings.append(item)
-            # to avoid pushing a finding group multiple times, we push those outside of the loop
-            if is_finding_groups_enabled() and group_by:
-                item.save()
-            else:
-                item.save(push_to_jira=push_to_jira)
+                importer_utils.chunk_endpoints_and_disperse(item, test, item.unsaved_endpoints, endpoint_resolver=endpoint_resolver)
+                if endpoints_to_add:
+                    importer_utils.chunk_endpoints_and_disperse(item, test, endpoints_to_add, endpoint_resolver=endpoint_resolver)
+
+                if item.unsaved_tags:
+                    item.tags = item.unsaved_tags
+
+                if item.unsaved_files:
+                    for unsaved_file in item.unsaved_files:
+                        data = base64.b64decode(unsaved_file.get('data'))
+                        title = unsaved_file.get('title', '<No title>')
+                        file_upload, file_upload_created = FileUpload.objects.get_or_create(
+                            title=title,
+                        )
+                        file_upload.file.save(title, ContentFile(data))
+                        file_upload.save()
+                        item.files.add(file_upload)
+
+                importer_utils.handle_vulnerability_ids(item)
+
+                new_findings.append(item)
+                # to avoid pushing a finding group multiple times, we push those outside of the loop
+                if is_finding_groups_enabled() and group_by:
+                    item.save()
+                else:
+                    item.save(push_to_jira=push_to_jira)
 
         for (group_name, findings) in group_names_to_findings_dict.items():
             finding_helper.add_findings_to_auto_group(group_name, findings, group_by, create_finding_groups_for_all_findings, **kwargs)
-            if push_to_jira:
+            if push_to_jira and jira_group_finding_ids is not None:
+                jira_group_finding_ids.setdefault(group_name, findings[0].id)
+            elif push_to_jira:
                 if findings[0].finding_group is not None:
                     jira_helper.push_to_jira(findings[0].finding_group)
                 else:
@@ -172,6 +163,126 @@ class DojoDefaultImporter(object):
             return [serializers.serialize('json', [finding, ]) for finding in new_findings]
         return new_findings
 
+    def push_finding_groups_to_jira(self, finding_ids):
+        # the groups are pushed by their first finding, which is pushed itself when it isn't grouped
+        for finding in Finding.objects.filter(id__in=finding_ids).order_by('id'):
+            jira_helper.push_to_jira(finding.finding_group if finding.finding_group is not None else finding)
+
+    def prepare_parsed_finding(self, item, test, user, active=None, verified=None, minimum_severity=None, now=timezone.now(),
+                               service=None, scan_date=None):
+        # FIXME hack to remove when all parsers have unit tests for this attribute
+        if item.severity.lower().startswith('info') and item.severity != 'Info':
+            item.severity = 'Info'
+
+        item.numerical_severity = Finding.get_numerical_severity(item.severity)
+
+        if minimum_severity and (Finding.SEVERITIES[item.severity] >
+                Finding.SEVERITIES[minimum_severity]):
+            # finding's severity is below the configured threshold : ignoring the finding
+            return False
+
+        item.test = test
+        item.reporter = user if user else get_current_user
+        item.last_reviewed = now
+        item.last_reviewed_by = user if user else get_current_user
+
+        logger.debug('process_parsed_findings: active from report: %s, verified from report: %s', item.active, item.verified)
+        if active is not None:
+            # indicates an override. Otherwise, do not change the value of item.active
+            item.active = active
+
+        if verified is not None:
+            # indicates an override. Otherwise, do not change the value of verified
+            item.verified = verified
+
+        # if scan_date was provided, override value from parser
+        if scan_date:
+            item.date = scan_date.date()
+
+        if service:
+            item.service = service
+
+        return True
+
+    def bulk_create_parsed_findings(self, test, items, user, active=None, verified=None, minimum_severity=None,
+                                    endpoints_to_add=None, push_to_jira=None, group_by=None, now=timezone.now(), service=None, scan_date=None):
+        """
+        Bulk variant of the import loop in process_parsed_findings, used when IMPORT_BULK_CREATE is enabled.
+        Findings are prepared in memory (including their hash_code), inserted with bulk_create() in batches of
+        IMPORT_BULK_CREATE_BATCH_SIZE and their dependent rows are created in bulk as well.
+        Deduplication, JIRA pushes and product grading are run once per batch by post_process_findings_batch.
+        Note: bulk_create() doesn't send any signals, so no audit log entries are created for the new findings.
+        """
+        from dojo.product.signals import inherit_product_tags
+
+        new_findings = []
+        group_names_to_findings_dict = {}
+        finding_groups_enabled = is_finding_groups_enabled()
+        inherit_tags = inherit_product_tags(test)
+        endpoint_resolver = importer_utils.EndpointResolver(test.engagement.product)
+
+        prepared_findings = []
+        for item in items:
+            if not self.prepare_parsed_finding(item, test, user, active=active, verified=verified, minimum_severity=minimum_severity,
+                                               now=now, service=service, scan_date=scan_date):
+                continue
+
+            # endpoints and vulnerability ids are part of the hash_code, so they have to be complete before computing it
+            if endpoints_to_add:
+                item.unsaved_endpoints = item.unsaved_endpoints + list(endpoints_to_add)
+            for endpoint in item.unsaved_endpoints:
+                try:
+                    endpoint.clean()
+                except ValidationError as e:
+                    logger.warning("DefectDojo is storing broken endpoint because cleaning wasn't successful: "
+                                   "{}".format(e))
+            importer_utils.normalize_vulnerability_ids(item)
+
+            item.prepare_for_bulk_create(user=user)
+            prepared_findings.append(item)
+
+        for batch in importer_utils.chunk_list(prepared_findings, chunk_size=settings.IMPORT_BULK_CREATE_BATCH_SIZE):
+            Finding.objects.bulk_create(batch)
+            logger.debug('IMPORT_SCAN: bulk created %i findings', len(batch))
+
+            importer_utils.bulk_create_vulnerability_ids(batch)
+            importer_utils.bulk_create_req_resp(batch)
+            importer_utils.bulk_add_found_by(batch, test.test_type)
+            importer_utils.bulk_add_tags(batch)
+
+            endpoint_resolver.add_endpoints_to_findings([(item, item.unsaved_endpoints) for item in batch])
+
+            for item in batch:
+                if item.unsaved_files:
+                    for unsaved_file in item.unsaved_files:
+                        data = base64.b64decode(unsaved_file.get('data'))
+                        title = unsaved_file.get('title', '<No title>')
+                        file_upload, file_upload_created = FileUpload.objects.get_or_create(
+                            title=title,
+                        )
+                        file_upload.file.save(title, ContentFile(data))
+                        file_upload.save()
+                        item.files.add(file_upload)
+
+                if inherit_tags:
+                    item.inherit_tags([tag.name for tag in item.tags.all()])
+
+                if finding_groups_enabled and group_by:
+                    # If finding groups are enabled, group all findings by group name
+                    name = finding_helper.get_group_by_group_name(item, group_by)
+                    if name is not None:
+                        group_names_to_findings_dict.setdefault(name, []).append(item)
+
+            importer_utils.update_search_index(batch)
+
+            # to avoid pushing a finding group multiple times, we push those outside of the loop
+            finding_helper.post_process_findings_batch([item.id for item in batch],
+                push_to_jira=False if finding_groups_enabled and group_by else push_to_jira, user=user)
+
+            new_findings.extend(batch)
+
+        return new_findings, group_names_to_findings_dict
+
     def close_old_findings(self, test, scan_date_time, user, push_to_jira=None, service=None, close_old_findings_product_scope=False):
         # Close old active findings that are not reported by this scan.
         # Refactoring this to only call test.finding_set.values() once.
@@ -235,6 +346,9 @@ class DojoDefaultImporter(object):
 
         return old_findings
 
+    @coalesce_async_tasks()
+    @defer_metrics_rollup()
+    @notifications_helper.batch_notifications()
     def import_scan(self, scan, scan_type, engagement, lead, environment, active=None, verified=None, tags=None, minimum_severity=None,
                     user=None, endpoints_to_add=None, scan_date=None, version=None, branch_tag=None, build_id=None,
                     commit_hash=None, push_to_jira=None, close_old_findings=False, close_old_findings_product_scope=False,
@@ -253,6 +367,7 @@ class DojoDefaultImporter(object):
         # if yes, we parse the data first
         # after that we customize the Test_Type to reflect the data
         # This allow us to support some meta-formats like SARIF or the generic format
+        streaming = False
         parser = get_parser(scan_type)
         if hasattr(parser, 'get_tests'):
             logger.debug('IMPORT_SCAN parser v2: Create Test and parse findings')
@@ -305,16 +420,21 @@ class DojoDefaultImporter(object):
 
             logger.debug('IMPORT_SCAN: Parse findings')
             parser = get_parser(scan_type)
-            try:
-                parsed_findings = parser.get_findings(scan, test)
-            except ValueError as e:
-                logger.warning(e)
-                raise ValidationError(e)
+            if supports_iter_findings(parser):
+                # the report is parsed while the findings are being processed
+                streaming = True
+                parsed_findings = importer_utils.iter_parsed_findings(parser, scan, test)
+            else:
+                try:
+                    parsed_findings = parser.get_findings(scan, test)
+                except ValueError as e:
+                    logger.warning(e)
+                    raise ValidationError(e)
 
         logger.debug('IMPORT_SCAN: Processing findings')
         new_findings = []
         if settings.ASYNC_FINDING_IMPORT:
-            chunk_list = importer_utils.chunk_list(parsed_findings)
+            chunk_list = importer_utils.iter_chunks(parsed_findings)
             results_list = []
             # First kick off all the workers
             for findings_list in chunk_list:
@@ -335,12 +455,28 @@ class DojoDefaultImporter(object):
             # Indicate that the test is not complete yet as endpoints will still be rolling in.
             test.percent_complete = 50
             test.save()
+        elif streaming:
+            # findings of a streaming parser are processed in bounded batches and not kept, so the parsed findings
+            # with their unsaved endpoints, tags and request/responses only exist for one batch at a time
+            # a group can span several batches, so the groups are pushed to JIRA once after the last batch
+            jira_group_finding_ids = {}
+            for findings_list in importer_utils.iter_chunks(parsed_findings, chunk_size=settings.IMPORT_STREAMING_BATCH_SIZE):
+                self.process_parsed_findings(test, findings_list, scan_type, user, active=active,
+                                                verified=verified, minimum_severity=minimum_severity,
+                                                endpoints_to_add=endpoints_to_add, push_to_jira=push_to_jira,
+                                                group_by=group_by, now=now, service=service, scan_date=scan_date, sync=True,
+                                                create_finding_groups_for_all_findings=create_finding_groups_for_all_findings,
+                                                jira_group_finding_ids=jira_group_finding_ids)
+            self.push_finding_groups_to_jira(jira_group_finding_ids.values())
+            # the import history and the notification list all new findings, i.e. all findings of the new test, so
+            # these are loaded again once at the end, which still takes memory in proportion to the number of findings
+            new_findings = list(Finding.objects.filter(test=test).order_by('id'))
         else:
             new_findings = self.process_parsed_findings(test, parsed_findings, scan_type, user, active=active,
-                                                            verified=verified, minimum_severity=minimum_severity,
-                                                            endpoints_to_add=endpoints_to_add, push_to_jira=push_to_jira,
-                                                            group_by=group_by, now=now, service=service, scan_date=scan_date, sync=True,
-                                                            create_finding_groups_for_all_findings=create_finding_groups_for_all_findings)
+                                                        verified=verified, minimum_severity=minimum_severity,
+                                                        endpoints_to_add=endpoints_to_add, push_to_jira=push_to_jira,
+                                                        group_by=group_by, now=now, service=service, scan_date=scan_date, sync=True,
+                                                        create_finding_groups_for_all_findings=create_finding_groups_for_all_findings)
 
         closed_findings = []
         if close_old_findings:
@@ -364,6 +500,9 @@ class DojoDefaultImporter(object):
         if updated_count > 0:
             notifications_helper.notify_scan_added(test, updated_count, new_findings=new_findings, findings_mitigated=closed_findings)
 
+        if settings.MARKDOWN_RENDER_CACHE_WARM and new_findings:
+            warm_markdown_render_cache([finding.id for finding in new_findings])
+
         logger.debug('IMPORT_SCAN: Updating Test progress')
         importer_utils.update_test_progress(test)
 
@@ -4,7 +4,9 @@ import logging
 import dojo.finding.helper as finding_helper
 import dojo.jira_link.helper as jira_helper
 import dojo.notifications.helper as notifications_helper
-from dojo.decorators import dojo_async_task
+from dojo.decorators import coalesce_async_tasks, dojo_async_task
+from dojo.markdown_cache import warm_markdown_render_cache
+from dojo.metrics.helper import defer_metrics_rollup
 from dojo.celery import app
 from django.conf import settings
 from django.core.exceptions import ValidationError
@@ -25,6 +27,8 @@ deduplicationLogger = logging.getLogger("dojo.specific-loggers.deduplication")
 class DojoDefaultReImporter(object):
     @dojo_async_task
     @app.task(ignore_result=False)
+    @defer_metrics_rollup()
+    @notifications_helper.batch_notifications()
     def process_parsed_findings(
         self,
         test,
@@ -59,6 +63,12 @@ class DojoDefaultReImporter(object):
         logger.debug("starting reimport of %i items.", len(items) if items else 0)
         deduplication_algorithm = test.deduplication_algorithm
 
+        # all matching is done in memory against the findings of the test, so we don't need a query per finding of the report.
+        # the index holds its own instances, as the matched findings are compared to original_items to find the findings to mitigate
+        existing_findings_index = reimporter_utils.ExistingFindingsIndex(test, deduplication_algorithm)
+        # all findings of the report share the endpoint index of the product
+        endpoint_resolver = importer_utils.EndpointResolver(test.engagement.product)
+
         i = 0
         group_names_to_findings_dict = {}
         logger.debug(
@@ -108,9 +118,7 @@ class DojoDefaultReImporter(object):
             item.hash_code = item.compute_hash_code()
             deduplicationLogger.debug("item's hash_code: %s", item.hash_code)
 
-            findings = reimporter_utils.match_new_finding_to_existing_finding(
-                item, test, deduplication_algorithm
-            )
+            findings = existing_findings_index.match(item)
 
             deduplicationLogger.debug(
                 "found %i findings matching with current new finding", len(findings)
@@ -352,6 +360,8 @@ class DojoDefaultReImporter(object):
                 finding_added_count += 1
                 new_items.append(item)
                 finding = item
+                # the report can contain duplicates that have to match this new finding (see #3958)
+                existing_findings_index.add(item)
 
                 if hasattr(item, "unsaved_req_resp"):
                     for req_resp in item.unsaved_req_resp:
@@ -384,11 +394,11 @@ class DojoDefaultReImporter(object):
             if finding:
                 finding_count += 1
                 importer_utils.chunk_endpoints_and_disperse(
-                    finding, test, item.unsaved_endpoints
+                    finding, test, item.unsaved_endpoints, endpoint_resolver=endpoint_resolver
                 )
                 if endpoints_to_add:
                     importer_utils.chunk_endpoints_and_disperse(
-                        finding, test, endpoints_to_add
+                        finding, test, endpoints_to_add, endpoint_resolver=endpoint_resolver
                     )
 
                 if item.unsaved_tags:
@@ -548,6 +558,9 @@ class DojoDefaultReImporter(object):
 
         return mitigated_findings
 
+    @coalesce_async_tasks()
+    @defer_metrics_rollup()
+    @notifications_helper.batch_notifications()
     def reimport_scan(
         self,
         scan,
@@ -757,6 +770,9 @@ class DojoDefaultReImporter(object):
                 findings_untouched=untouched_findings,
             )
 
+        if settings.MARKDOWN_RENDER_CACHE_WARM and new_findings:
+            warm_markdown_render_cache([finding.id for finding in new_findings])
+
         logger.debug("REIMPORT_SCAN: Done")
 
         return (
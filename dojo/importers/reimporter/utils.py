@@ -55,6 +55,50 @@ def match_new_finding_to_existing_finding(new_finding, test, deduplication_algor
         return None
 
 
+class ExistingFindingsIndex(object):
+    """
+    In memory index of the findings of a test, used by the reimporter to match the findings of the report to the
+    existing findings with dictionary lookups instead of one query per finding of the report.
+    Lookups follow the same rules as match_new_finding_to_existing_finding and return the matches ordered by id.
+    Findings created during the reimport must be added to the index, as later findings of the same report can match them.
+    """
+
+    def __init__(self, test, deduplication_algorithm):
+        self.deduplication_algorithm = deduplication_algorithm
+        self.by_hash_code = {}
+        self.by_unique_id_from_tool = {}
+        self.by_title_and_severity = {}
+        deduplicationLogger.debug('building index of existing findings based on algorithm: %s', deduplication_algorithm)
+        for finding in test.finding_set.all().order_by('id'):
+            self.add(finding)
+
+    def add(self, finding):
+        if finding.hash_code is not None:
+            self.by_hash_code.setdefault(finding.hash_code, []).append(finding)
+        if finding.unique_id_from_tool is not None:
+            self.by_unique_id_from_tool.setdefault(finding.unique_id_from_tool, []).append(finding)
+        self.by_title_and_severity.setdefault((finding.title, finding.severity, finding.numerical_severity), []).append(finding)
+
+    def match(self, new_finding):
+        deduplicationLogger.debug('return findings bases on algorithm: %s', self.deduplication_algorithm)
+        if self.deduplication_algorithm == 'hash_code':
+            return list(self.by_hash_code.get(new_finding.hash_code, []))
+        elif self.deduplication_algorithm == 'unique_id_from_tool':
+            return list(self.by_unique_id_from_tool.get(new_finding.unique_id_from_tool, []))
+        elif self.deduplication_algorithm == 'unique_id_from_tool_or_hash_code':
+            findings = {finding.id: finding for finding in self.by_hash_code.get(new_finding.hash_code, [])}
+            findings.update({finding.id: finding for finding in self.by_unique_id_from_tool.get(new_finding.unique_id_from_tool, [])})
+            return [findings[id] for id in sorted(findings)]
+        elif self.deduplication_algorithm == 'legacy':
+            # see match_new_finding_to_existing_finding for the (flawed) legacy reimport behavior
+            logger.debug("Legacy reimport. In case of issue, you're advised to create a deduplication configuration in order not to go through this section")
+            key = (new_finding.title, new_finding.severity, Finding.get_numerical_severity(new_finding.severity))
+            return list(self.by_title_and_severity.get(key, []))
+        else:
+            logger.error("Internal error: unexpected deduplication_algorithm: '%s' ", self.deduplication_algorithm)
+            return None
+
+
 def update_endpoint_status(existing_finding, new_finding, user):
     # New endpoints are already added in serializers.py / views.py (see comment "# for existing findings: make sure endpoints are present or created")
     # So we only need to mitigate endpoints that are no longer present
@@ -1,13 +1,19 @@
+import base64
 from django.core.exceptions import ValidationError
-from django.core.exceptions import MultipleObjectsReturned
 from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.urls import reverse
+from hyperlink._url import SCHEME_PORT_MAP
+from tagulous.utils import parse_tags
+from watson import search as watson
 from dojo.decorators import dojo_async_task
 from dojo.celery import app
-from dojo.endpoint.utils import endpoint_get_or_create
 from dojo.utils import max_safe
 from dojo.models import IMPORT_CLOSED_FINDING, IMPORT_CREATED_FINDING, \
     IMPORT_REACTIVATED_FINDING, IMPORT_UNTOUCHED_FINDING, Test_Import, Test_Import_Finding_Action, \
-    Endpoint_Status, Vulnerability_Id
+    Endpoint, Endpoint_Status, Vulnerability_Id, BurpRawRequestResponse, Finding
+from dojo.tools.factory import iter_findings
 import logging
 
 
@@ -104,33 +110,57 @@ def construct_imported_message(scan_type, finding_count=0, new_finding_count=0,
     return message
 
 
-def chunk_list(list):
-    chunk_size = settings.ASYNC_FINDING_IMPORT_CHUNK_SIZE
+def chunk_list(list, chunk_size=None):
+    chunk_size = chunk_size or settings.ASYNC_FINDING_IMPORT_CHUNK_SIZE
     # Break the list of parsed findings into "chunk_size" lists
     chunk_list = [list[i:i + chunk_size] for i in range(0, len(list), chunk_size)]
     logger.debug('IMPORT_SCAN: Split endpoints into ' + str(len(chunk_list)) + ' chunks of ' + str(chunk_size))
     return chunk_list
 
 
-def chunk_endpoints_and_disperse(finding, test, endpoints, **kwargs):
+def iter_chunks(iterable, chunk_size=None):
+    # Same as chunk_list, but pulls the items lazily so a streaming parser is consumed in bounded batches
+    chunk_size = chunk_size or settings.ASYNC_FINDING_IMPORT_CHUNK_SIZE
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_parsed_findings(parser, scan, test):
+    # Parsing errors of a streaming parser only surface while iterating, so they are translated here
+    try:
+        yield from iter_findings(parser, scan, test)
+    except ValueError as e:
+        logger.warning(e)
+        raise ValidationError(e)
+
+
+def chunk_endpoints_and_disperse(finding, test, endpoints, endpoint_resolver=None, **kwargs):
     if settings.ASYNC_FINDING_IMPORT:
         chunked_list = chunk_list(endpoints)
         # If there is only one chunk, then do not bother with async
         if len(chunked_list) < 2:
-            add_endpoints_to_unsaved_finding(finding, test, endpoints, sync=True)
+            add_endpoints_to_unsaved_finding(finding, test, endpoints, sync=True, endpoint_resolver=endpoint_resolver)
             return []
         # First kick off all the workers
         for endpoints_list in chunked_list:
             add_endpoints_to_unsaved_finding(finding, test, endpoints_list, sync=False)
     else:
-        add_endpoints_to_unsaved_finding(finding, test, endpoints, sync=True)
+        add_endpoints_to_unsaved_finding(finding, test, endpoints, sync=True, endpoint_resolver=endpoint_resolver)
 
 
 # Since adding a model to a ManyToMany relationship does not require an additional
 # save, there is no need to keep track of when the task finishes.
+# The endpoint_resolver can only be passed when running in the foreground (sync=True),
+# it holds the endpoint index of the product that is shared by all findings of an import.
 @dojo_async_task
 @app.task()
-def add_endpoints_to_unsaved_finding(finding, test, endpoints, **kwargs):
+def add_endpoints_to_unsaved_finding(finding, test, endpoints, endpoint_resolver=None, **kwargs):
     logger.debug('IMPORT_SCAN: Adding ' + str(len(endpoints)) + ' endpoints to finding:' + str(finding))
     for endpoint in endpoints:
         try:
@@ -138,29 +168,125 @@ def add_endpoints_to_unsaved_finding(finding, test, endpoints, **kwargs):
         except ValidationError as e:
             logger.warning("DefectDojo is storing broken endpoint because cleaning wasn't successful: "
                             "{}".format(e))
-        ep = None
-        try:
-            ep, created = endpoint_get_or_create(
-                protocol=endpoint.protocol,
-                userinfo=endpoint.userinfo,
-                host=endpoint.host,
-                port=endpoint.port,
-                path=endpoint.path,
-                query=endpoint.query,
-                fragment=endpoint.fragment,
-                product=test.engagement.product)
-        except (MultipleObjectsReturned):
-            raise Exception("Endpoints in your database are broken. Please access {} and migrate them to new format or "
-                            "remove them.".format(reverse('endpoint_migrate')))
-
-        eps, created = Endpoint_Status.objects.get_or_create(
-            finding=finding,
-            endpoint=ep,
-            defaults={'date': finding.date})
+
+    if endpoint_resolver is None:
+        endpoint_resolver = EndpointResolver(test.engagement.product)
+    endpoint_resolver.add_endpoints_to_findings([(finding, endpoints)])
 
     logger.debug('IMPORT_SCAN: ' + str(len(endpoints)) + ' imported')
 
 
+class EndpointResolver(object):
+    """
+    Resolves the endpoints of the findings of one import to the endpoints of the product.
+    The existing endpoints of the product are loaded once into an index keyed on the normalized endpoint fields,
+    using the same matching rules as dojo.endpoint.utils.endpoint_filter. Missing endpoints and the Endpoint_Status
+    rows are created in bulk, so adding endpoints takes a handful of queries instead of a few queries per endpoint.
+    """
+
+    def __init__(self, product):
+        self.product = product
+        self.endpoint_ids = None
+        self.broken_keys = set()
+
+    @staticmethod
+    def get_key(protocol, userinfo, host, port, path, query, fragment):
+        protocol = protocol.lower() if protocol else protocol
+        host = host.lower() if host else host
+        # the default port of the protocol matches endpoints without a port and vice versa
+        if protocol in SCHEME_PORT_MAP and (port is None or port == SCHEME_PORT_MAP[protocol]):
+            port = None
+        return (protocol, userinfo, host, port, path, query, fragment)
+
+    @classmethod
+    def get_lookup_key(cls, endpoint):
+        # empty values are looked up as NULL, see endpoint_filter
+        return cls.get_key(*[value or None for value in (endpoint.protocol, endpoint.userinfo, endpoint.host, endpoint.port,
+                                                         endpoint.path, endpoint.query, endpoint.fragment)])
+
+    def load(self):
+        self.endpoint_ids = {}
+        for id, *values in Endpoint.objects.filter(product=self.product).order_by().values_list(
+                'id', 'protocol', 'userinfo', 'host', 'port', 'path', 'query', 'fragment'):
+            key = self.get_key(*values)
+            if key in self.endpoint_ids:
+                self.broken_keys.add(key)
+            else:
+                self.endpoint_ids[key] = id
+        logger.debug('IMPORT_SCAN: loaded %i endpoints of product %s', len(self.endpoint_ids), self.product)
+
+    def get_or_create_endpoint_ids(self, endpoints):
+        """
+        Returns the ids of the endpoints of the product that match the given unsaved endpoints,
+        missing endpoints are created.
+        """
+        if self.endpoint_ids is None:
+            self.load()
+
+        keys = []
+        missing = {}
+        for endpoint in endpoints:
+            key = self.get_lookup_key(endpoint)
+            if key in self.broken_keys:
+                raise Exception("Endpoints in your database are broken. Please access {} and migrate them to new format or "
+                                "remove them.".format(reverse('endpoint_migrate')))
+            if key not in self.endpoint_ids and key not in missing:
+                missing[key] = Endpoint(
+                    protocol=endpoint.protocol,
+                    userinfo=endpoint.userinfo,
+                    host=endpoint.host,
+                    port=endpoint.port,
+                    path=endpoint.path,
+                    query=endpoint.query,
+                    fragment=endpoint.fragment,
+                    product=self.product)
+            keys.append(key)
+
+        if missing:
+            new_endpoints = list(missing.values())
+            if connection.features.can_return_rows_from_bulk_insert:
+                Endpoint.objects.bulk_create(new_endpoints)
+                # bulk_create() doesn't send post_save signals, take care of the tags and the search index ourselves
+                from dojo.product.signals import inherit_product_tags
+                if inherit_product_tags(self.product):
+                    for endpoint in new_endpoints:
+                        endpoint.inherit_tags([])
+                update_search_index(new_endpoints)
+            else:
+                for endpoint in new_endpoints:
+                    endpoint.save()
+            for key, endpoint in missing.items():
+                self.endpoint_ids[key] = endpoint.id
+            logger.debug('IMPORT_SCAN: created %i endpoints', len(new_endpoints))
+
+        return [self.endpoint_ids[key] for key in keys]
+
+    def add_endpoints_to_findings(self, findings_and_endpoints):
+        """
+        Links the findings to their endpoints, findings_and_endpoints is a list of (finding, unsaved endpoints) tuples.
+        """
+        findings_and_endpoints = [(finding, endpoints) for finding, endpoints in findings_and_endpoints if endpoints]
+        if not findings_and_endpoints:
+            return
+
+        endpoint_ids = self.get_or_create_endpoint_ids([endpoint for finding, endpoints in findings_and_endpoints for endpoint in endpoints])
+
+        # findings of a reimport can already have (some of) these endpoints
+        existing = set(Endpoint_Status.objects.filter(finding__in=[finding for finding, endpoints in findings_and_endpoints])
+                       .order_by().values_list('finding_id', 'endpoint_id'))
+        statuses = []
+        endpoint_ids = iter(endpoint_ids)
+        for finding, endpoints in findings_and_endpoints:
+            for endpoint in endpoints:
+                endpoint_id = next(endpoint_ids)
+                if (finding.id, endpoint_id) not in existing:
+                    existing.add((finding.id, endpoint_id))
+                    statuses.append(Endpoint_Status(finding=finding, endpoint_id=endpoint_id, date=finding.date))
+
+        Endpoint_Status.objects.bulk_create(statuses, batch_size=settings.IMPORT_BULK_CREATE_BATCH_SIZE)
+        logger.debug('IMPORT_SCAN: created %i endpoint statuses', len(statuses))
+
+
 # This function is added to the async queue at the end of all finding import tasks
 # and after endpoint task, so this should only run after all the other ones are done
 @dojo_async_task
@@ -171,6 +297,18 @@ def update_test_progress(test, **kwargs):
 
 
 def handle_vulnerability_ids(finding):
+    normalize_vulnerability_ids(finding)
+
+    if finding.unsaved_vulnerability_ids:
+        # Add all vulnerability ids to the database
+        for vulnerability_id in finding.unsaved_vulnerability_ids:
+            Vulnerability_Id(
+                vulnerability_id=vulnerability_id,
+                finding=finding,
+            ).save()
+
+
+def normalize_vulnerability_ids(finding):
     # Synchronize the cve field with the unsaved_vulnerability_ids
     # We do this to be as flexible as possible to handle the fields until
     # the cve field is not needed anymore and can be removed.
@@ -188,9 +326,89 @@ def handle_vulnerability_ids(finding):
         # Remove duplicates
         finding.unsaved_vulnerability_ids = list(dict.fromkeys(finding.unsaved_vulnerability_ids))
 
-        # Add all vulnerability ids to the database
-        for vulnerability_id in finding.unsaved_vulnerability_ids:
-            Vulnerability_Id(
-                vulnerability_id=vulnerability_id,
+
+def can_bulk_create_findings():
+    # the ids of the inserted findings are needed to create the dependent rows,
+    # so the bulk import can only be used if the database returns them (PostgreSQL, SQLite 3.35+, MariaDB 10.5+)
+    return settings.IMPORT_BULK_CREATE and connection.features.can_return_rows_from_bulk_insert
+
+
+def bulk_create_vulnerability_ids(findings):
+    vulnerability_ids = []
+    for finding in findings:
+        if finding.unsaved_vulnerability_ids:
+            for vulnerability_id in finding.unsaved_vulnerability_ids:
+                vulnerability_ids.append(Vulnerability_Id(vulnerability_id=vulnerability_id, finding=finding))
+
+    Vulnerability_Id.objects.bulk_create(vulnerability_ids)
+
+
+def bulk_create_req_resp(findings):
+    req_resps = []
+    for finding in findings:
+        if hasattr(finding, 'unsaved_req_resp') and len(finding.unsaved_req_resp) > 0:
+            for req_resp in finding.unsaved_req_resp:
+                req_resps.append(BurpRawRequestResponse(
+                    finding=finding,
+                    burpRequestBase64=base64.b64encode(req_resp["req"].encode("utf-8")),
+                    burpResponseBase64=base64.b64encode(req_resp["resp"].encode("utf-8"))))
+
+        if finding.unsaved_request is not None and finding.unsaved_response is not None:
+            req_resps.append(BurpRawRequestResponse(
                 finding=finding,
-            ).save()
+                burpRequestBase64=base64.b64encode(finding.unsaved_request.encode()),
+                burpResponseBase64=base64.b64encode(finding.unsaved_response.encode())))
+
+    for burp_rr in req_resps:
+        burp_rr.clean()
+
+    BurpRawRequestResponse.objects.bulk_create(req_resps)
+
+
+def bulk_add_found_by(findings, test_type):
+    Finding.found_by.through.objects.bulk_create(
+        [Finding.found_by.through(finding_id=finding.id, test_type_id=test_type.id) for finding in findings],
+        ignore_conflicts=True)
+
+
+def bulk_add_tags(findings):
+    tag_model = Finding.tags.tag_model
+    tag_through = Finding.tags.through
+    tag_options = Finding.tags.tag_options
+
+    tag_names_per_finding = {}
+    for finding in findings:
+        if finding.unsaved_tags:
+            tag_names = parse_tags(finding.unsaved_tags) if isinstance(finding.unsaved_tags, str) else finding.unsaved_tags
+            if tag_options.force_lowercase:
+                tag_names = [tag_name.lower() for tag_name in tag_names]
+            tag_names_per_finding[finding] = list(dict.fromkeys(tag_names))
+
+    if not tag_names_per_finding:
+        return
+
+    # one lookup per distinct tag instead of one per finding per tag
+    tags = {}
+    for tag_names in tag_names_per_finding.values():
+        for tag_name in tag_names:
+            if tag_name not in tags:
+                tags[tag_name], _ = tag_model.objects.get_or_create(name=tag_name, defaults={'protected': False})
+
+    rows = []
+    counts = {}
+    for finding, tag_names in tag_names_per_finding.items():
+        for tag_name in tag_names:
+            rows.append(tag_through(finding=finding, tagulous_finding_tags=tags[tag_name]))
+            counts[tag_name] = counts.get(tag_name, 0) + 1
+
+    tag_through.objects.bulk_create(rows)
+    for tag_name, count in counts.items():
+        tag_model.objects.filter(pk=tags[tag_name].pk).update(count=F('count') + count)
+
+
+def update_search_index(instances):
+    # bulk_create() doesn't send post_save signals, so add the new instances to the search index ourselves.
+    # The search context saves all search entries in one go when it is closed.
+    with watson.update_index():
+        for instance in instances:
+            watson.search_context_manager.add_to_context(watson.default_search_engine, instance)
@@ -811,7 +811,7 @@ def add_jira_issue(obj, *args, **kwargs):
 # we need two separate celery tasks due to the decorators we're using to map to/from ids
 
 @dojo_model_to_id
-@dojo_async_task
+@dojo_async_task(coalesce_key=0)
 @app.task
 @dojo_model_from_id
 def update_jira_issue_for_finding(finding, *args, **kwargs):
@@ -819,7 +819,7 @@ def update_jira_issue_for_finding(finding, *args, **kwargs):
 
 
 @dojo_model_to_id
-@dojo_async_task
+@dojo_async_task(coalesce_key=0)
 @app.task
 @dojo_model_from_id(model=Finding_Group)
 def update_jira_issue_for_finding_group(finding_group, *args, **kwargs):
@@ -1297,9 +1297,10 @@ def add_comment(obj, note, force_push=False, **kwargs):
                 return False
 
 
-def add_simple_jira_comment(jira_instance, jira_issue, comment):
+def add_simple_jira_comment(jira_instance, jira_issue, comment, jira=None):
     try:
-        jira = get_jira_connection(jira_instance)
+        if jira is None:
+            jira = get_jira_connection(jira_instance)
 
         jira.add_comment(
             jira_issue.jira_id, comment
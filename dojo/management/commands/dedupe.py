@@ -1,6 +1,10 @@
+from concurrent.futures import ProcessPoolExecutor
 from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Max, Min
 from pytz import timezone
 
+from dojo.finding.helper import bulk_update_hash_codes
 from dojo.models import Finding, Product
 from dojo.utils import calculate_grade, do_dedupe_finding, do_dedupe_finding_task, get_system_setting, mass_model_updater
 import logging
@@ -11,20 +15,43 @@ logger = logging.getLogger(__name__)
 deduplicationLogger = logging.getLogger("dojo.specific-loggers.deduplication")
 
 
-def generate_hash_code(f):
-    old_hash_code = f.hash_code
-    f.hash_code = f.compute_hash_code()
-    if f.hash_code != old_hash_code:
-        logger.debug('%d: hash_code changed from %s to %s', f.id, old_hash_code, f.hash_code)
-    return f
+def get_findings(restrict_to_parsers):
+    if restrict_to_parsers is not None:
+        return Finding.objects.filter(test__test_type__name__in=restrict_to_parsers)
+    # add filter on id to make counts not slow on mysql
+    return Finding.objects.all().filter(id__gt=0)
+
+
+def generate_hash_codes(restrict_to_parsers, min_id, max_id, page_size=1000):
+    """
+    Recomputes the hash_codes of the findings with an id between min_id and max_id (inclusive), page by page.
+    Pages are selected on id instead of with LIMIT/OFFSET, see mass_model_updater.
+    """
+    findings = get_findings(restrict_to_parsers).filter(id__gte=min_id, id__lte=max_id).order_by('id')
+    last_id = min_id - 1
+    processed = changed = 0
+    while True:
+        finding_ids = list(findings.filter(id__gt=last_id).values_list('id', flat=True)[:page_size])
+        if not finding_ids:
+            break
+        changed += bulk_update_hash_codes(finding_ids)
+        processed += len(finding_ids)
+        last_id = finding_ids[-1]
+        logger.info('hash_code computation %d-%d: %d findings processed, %d hash_codes changed ...', min_id, max_id, processed, changed)
+    return processed, changed
+
+
+def split_id_range(min_id, max_id, parts):
+    size = (max_id - min_id) // parts + 1
+    return [(start, min(start + size - 1, max_id)) for start in range(min_id, max_id + 1, size)]
 
 
 class Command(BaseCommand):
     """
     Updates hash codes and/or runs deduplication for findings. Hashcode calculation always runs in the foreground, dedupe by default runs in the background.
-    Usage: manage.py dedupe [--parser "Parser1 Scan" --parser "Parser2 Scan"...] [--hash_code_only] [--dedupe_only] [--dedupe_sync]'
+    Usage: manage.py dedupe [--parser "Parser1 Scan" --parser "Parser2 Scan"...] [--hash_code_only] [--dedupe_only] [--dedupe_sync] [--workers N]'
     """
-    help = 'Usage: manage.py dedupe [--parser "Parser1 Scan" --parser "Parser2 Scan"...] [--hash_code_only] [--dedupe_only] [--dedupe_sync]'
+    help = 'Usage: manage.py dedupe [--parser "Parser1 Scan" --parser "Parser2 Scan"...] [--hash_code_only] [--dedupe_only] [--dedupe_sync] [--workers N]'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -37,28 +64,36 @@ class Command(BaseCommand):
         parser.add_argument('--hash_code_only', action='store_true', help='Only compute hash codes')
         parser.add_argument('--dedupe_only', action='store_true', help='Only run deduplication')
         parser.add_argument('--dedupe_sync', action='store_true', help='Run dedupe in the foreground, default false')
+        parser.add_argument('--workers', type=int, default=1, help='Number of processes to split the hash code computation over, default 1')
 
     def handle(self, *args, **options):
         restrict_to_parsers = options['parser']
         hash_code_only = options['hash_code_only']
         dedupe_only = options['dedupe_only']
         dedupe_sync = options['dedupe_sync']
+        workers = max(options['workers'], 1)
 
+        findings = get_findings(restrict_to_parsers)
         if restrict_to_parsers is not None:
-            findings = Finding.objects.filter(test__test_type__name__in=restrict_to_parsers)
             logger.info("######## Will process only parsers %s and %d findings ########", *restrict_to_parsers, findings.count())
         else:
-            # add filter on id to make counts not slow on mysql
-            findings = Finding.objects.all().filter(id__gt=0)
             logger.info("######## Will process the full database with %d findings ########", findings.count())
 
         # Phase 1: update hash_codes without deduplicating
         if not dedupe_only:
-            logger.info("######## Start Updating Hashcodes (foreground) ########")
-
-            # only prefetch here for hash_code calculation
-            finds = findings.prefetch_related('endpoints', 'test__test_type')
-            mass_model_updater(Finding, finds, lambda f: generate_hash_code(f), fields=['hash_code'], order='asc', log_prefix='hash_code computation ')
+            logger.info("######## Start Updating Hashcodes (foreground, %d workers) ########", workers)
+
+            id_range = findings.aggregate(min_id=Min('id'), max_id=Max('id'))
+            if id_range['min_id'] is not None:
+                id_ranges = split_id_range(id_range['min_id'], id_range['max_id'], workers)
+                if workers > 1:
+                    # the worker processes are forked, they must not share the database connection of this process
+                    connections.close_all()
+                    with ProcessPoolExecutor(max_workers=workers) as executor:
+                        results = list(executor.map(generate_hash_codes, [restrict_to_parsers] * len(id_ranges), *zip(*id_ranges)))
+                else:
+                    results = [generate_hash_codes(restrict_to_parsers, *id_ranges[0])]
+                logger.info("%d findings processed, %d hash_codes changed", sum(result[0] for result in results), sum(result[1] for result in results))
 
             logger.info("######## Done Updating Hashcodes########")
 
@@ -0,0 +1,25 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dojo.tools.factory import PARSER_MANIFEST_PATH, generate_parser_manifest, load_parser_manifest
+
+
+class Command(BaseCommand):
+    help = 'Generate the manifest of the parsers in dojo/tools that is used to import parsers lazily'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only check that the manifest is up to date')
+
+    def handle(self, *args, **options):
+        manifest = generate_parser_manifest()
+        if options['check']:
+            if manifest != load_parser_manifest():
+                raise CommandError(f'{PARSER_MANIFEST_PATH} is out of date, run "./manage.py generate_parser_manifest"')
+            self.stdout.write(f'{PARSER_MANIFEST_PATH} is up to date')
+            return
+
+        with open(PARSER_MANIFEST_PATH, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=4, sort_keys=True)
+            manifest_file.write('\n')
+        self.stdout.write(f'Wrote {len(manifest)} scan types to {PARSER_MANIFEST_PATH}')
@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from dojo.tools.factory import PARSERS
+from dojo.tools.factory import get_scan_types, requires_tool_type
 from dojo.models import Test_Type, Tool_Type
 
 
@@ -8,10 +8,8 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         # called by the initializer to fill the table with test_types
-        for scan_type in PARSERS:
+        for scan_type in get_scan_types():
             Test_Type.objects.get_or_create(name=scan_type)
-            parser = PARSERS[scan_type]
-            if hasattr(parser, 'requires_tool_type'):
-                tool_type = parser.requires_tool_type(scan_type)
-                if tool_type:
-                    Tool_Type.objects.get_or_create(name=tool_type)
+            tool_type = requires_tool_type(scan_type)
+            if tool_type:
+                Tool_Type.objects.get_or_create(name=tool_type)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from dojo.metrics.helper import update_metrics_rollup
+from dojo.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Recompute the rollup of the findings per product, date and severity that is read by the metrics pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product_id', type=int, action='append', help='Only recompute the rollup of these products')
+
+    def handle(self, *args, **options):
+        products = Product.objects.order_by('id')
+        if options['product_id']:
+            products = products.filter(id__in=options['product_id'])
+        for product_id in products.values_list('id', flat=True):
+            update_metrics_rollup(product_id)
+            self.stdout.write(f'Updated the metrics rollup of product {product_id}')
@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import threading
+from collections import Counter, OrderedDict
+import bleach
+import markdown
+from django.conf import settings
+from django.core.cache import cache
+from dojo.celery import app
+from dojo.decorators import dojo_async_task
+from dojo.models import Finding
+
+logger = logging.getLogger(__name__)
+
+MARKDOWN_EXTENSIONS = ['markdown.extensions.nl2br',
+                       'markdown.extensions.sane_lists',
+                       'markdown.extensions.codehilite',
+                       'markdown.extensions.fenced_code',
+                       'markdown.extensions.toc',
+                       'markdown.extensions.tables']
+
+# part of the cache key, increment it when the sanitizing below changes
+MARKDOWN_RENDER_VERSION = 1
+
+# Tags suitable for rendering markdown
+markdown_tags = {
+    "h1", "h2", "h3", "h4", "h5", "h6",
+    "b", "i", "strong", "em", "tt",
+    "table", "thead", "th", "tbody", "tr", "td",  # enables markdown.extensions.tables
+    "p", "br",
+    "pre", "div",  # used for code highlighting
+    "span", "blockquote", "code", "hr",
+    "ul", "ol", "li", "dd", "dt",
+    "img",
+    "a",
+    "sub", "sup",
+    "center",
+}
+
+markdown_attrs = {
+    "*": ["id"],
+    "img": ["src", "alt", "title", "width", "height", "style"],
+    "a": ["href", "alt", "target", "title"],
+    "span": ["class"],  # used for code highlighting
+    "pre": ["class"],  # used for code highlighting
+    "div": ["class"],  # used for code highlighting
+}
+
+markdown_styles = [
+    "background-color"
+]
+
+# number of lookups per result (local, shared or miss) in this process
+markdown_render_cache_counts = Counter()
+
+
+def render_markdown(text):
+    markdown_text = markdown.markdown(text, extensions=MARKDOWN_EXTENSIONS)
+    return bleach.clean(markdown_text, tags=markdown_tags, attributes=markdown_attrs, css_sanitizer=markdown_styles)
+
+
+class MarkdownRenderCache(object):
+    """
+    Cache of the sanitized HTML rendered from markdown. The key is the sha256 of the text and the markdown extensions, so
+    a cached rendering never becomes outdated and edited texts simply get a new key. The renderings are kept in a LRU
+    per process of at most MARKDOWN_RENDER_CACHE_SIZE characters, backed by the django cache for
+    MARKDOWN_RENDER_CACHE_TTL seconds, which the processes share when a shared cache backend is configured.
+    """
+    _lock = threading.Lock()
+    _rendered = OrderedDict()
+    _size = 0
+    metrics = None
+
+    @classmethod
+    def get_key(cls, text):
+        digest = hashlib.sha256(('%d:%s:' % (MARKDOWN_RENDER_VERSION, ','.join(MARKDOWN_EXTENSIONS))).encode())
+        digest.update(text.encode('utf-8', 'surrogatepass'))
+        return 'dojo_markdown_' + digest.hexdigest()
+
+    @classmethod
+    def render(cls, text):
+        key = cls.get_key(text)
+        with cls._lock:
+            html = cls._rendered.get(key)
+            if html is not None:
+                cls._rendered.move_to_end(key)
+        if html is not None:
+            cls.record('local')
+            return html
+
+        ttl = settings.MARKDOWN_RENDER_CACHE_TTL
+        html = cache.get(key) if ttl > 0 else None
+        if html is not None:
+            cls.record('shared')
+        else:
+            cls.record('miss')
+            html = render_markdown(text)
+            if ttl > 0:
+                cache.set(key, html, timeout=ttl)
+        cls.store(key, html)
+        return html
+
+    @classmethod
+    def warm(cls, text):
+        """Renders the text into the django cache, without keeping it in this process"""
+        ttl = settings.MARKDOWN_RENDER_CACHE_TTL
+        key = cls.get_key(text)
+        if ttl > 0 and cache.get(key) is None:
+            cache.set(key, render_markdown(text), timeout=ttl)
+
+    @classmethod
+    def store(cls, key, html):
+        max_size = settings.MARKDOWN_RENDER_CACHE_SIZE
+        if len(html) > max_size:
+            return
+        with cls._lock:
+            if key not in cls._rendered:
+                cls._rendered[key] = html
+                cls._size += len(html)
+            while cls._size > max_size:
+                evicted_key, evicted = cls._rendered.popitem(last=False)
+                cls._size -= len(evicted)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._rendered.clear()
+            cls._size = 0
+
+    @classmethod
+    def record(cls, result):
+        markdown_render_cache_counts[result] += 1
+        if getattr(settings, 'DJANGO_METRICS_ENABLED', False):
+            if cls.metrics is None:
+                from prometheus_client import Counter as PrometheusCounter
+                cls.metrics = PrometheusCounter('dojo_markdown_render_cache_lookups', 'Lookups of rendered markdown per result',
+                                                ['result'])
+            cls.metrics.labels(result=result).inc()
+
+
+@dojo_async_task
+@app.task
+def warm_markdown_render_cache(finding_ids, *args, **kwargs):
+    """Renders the markdown of new findings, so they are cached before their first view"""
+    for texts in Finding.objects.filter(id__in=finding_ids).values_list('description', 'mitigation', 'impact').iterator():
+        for text in texts:
+            if text:
+                MarkdownRenderCache.warm(text)
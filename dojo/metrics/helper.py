@@ -0,0 +1,355 @@
+import calendar as tcalendar
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+from math import ceil
+
+from dateutil.relativedelta import relativedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.urls import reverse
+from django.utils import timezone
+
+from dojo.authorization.roles_permissions import Permissions
+from dojo.celery import app
+from dojo.decorators import dojo_async_task, we_want_async
+from dojo.filters import MetricsDateRangeFilter
+from dojo.models import Finding, Product, Product_Metrics_Rollup, Test, get_current_date
+from dojo.product.queries import get_authorized_products
+from dojo.utils import get_period_boundaries, get_range_sums, get_work_days, get_zero_severity_level
+
+logger = logging.getLogger(__name__)
+
+SEVERITIES = ('Critical', 'High', 'Medium', 'Low', 'Info')
+CHART_SEVERITIES = ('Critical', 'High', 'Medium', 'Low')
+
+# the counts of the rollup by finding date, the conditions mirror the queries of the metrics views
+FINDING_DATE_COUNTS = {
+    'total': None,
+    'opened': Q(verified=True),
+    'active': Q(verified=True, active=True),
+    'accepted': Q(risk_accepted=True),
+    'unmitigated': Q(verified=True, false_p=False, duplicate=False, out_of_scope=False, mitigated__isnull=True),
+    'verified': Q(verified=True, active=True, false_p=False, duplicate=False, out_of_scope=False),
+    'open': Q(active=True, false_p=False, duplicate=False, out_of_scope=False, is_mitigated=False),
+    'inactive': Q(active=False, duplicate=False, out_of_scope=False, is_mitigated=False),
+    'closed': Q(active=False, false_p=False, duplicate=False, out_of_scope=False, is_mitigated=True),
+    'false_positive': Q(false_p=True, duplicate=False, out_of_scope=False),
+    'out_of_scope': Q(false_p=False, duplicate=False, out_of_scope=True),
+}
+# the age buckets of the metrics page, the upper bound in days and the rollup field of the mitigated findings
+AGE_BUCKETS = ((30, 'mitigated_age_0_30'), (60, 'mitigated_age_31_60'), (90, 'mitigated_age_61_90'),
+               (None, 'mitigated_age_over_90'))
+
+
+def get_age(start_date, end_date):
+    """The age of a finding like Finding.age"""
+    if settings.SLA_BUSINESS_DAYS:
+        days = get_work_days(start_date, end_date)
+    else:
+        days = (end_date - start_date).days
+    return days if days > 0 else 0
+
+
+def get_age_bucket(age):
+    for index, (upper_bound, _) in enumerate(AGE_BUCKETS):
+        if upper_bound is None or age <= upper_bound:
+            return index
+
+
+def update_metrics_rollup(product_id):
+    """Recompute the rollup of a product from its findings, with one query per kind of count"""
+    rows = {}
+
+    def get_row(day, severity):
+        if (day, severity) not in rows:
+            rows[(day, severity)] = Product_Metrics_Rollup(product_id=product_id, date=day, severity=severity)
+        return rows[(day, severity)]
+
+    findings = Finding.objects.filter(test__engagement__product_id=product_id, severity__in=SEVERITIES).order_by()
+    # prefixed, as some of the fields of the rollup are also fields of the findings used in the conditions
+    annotations = {'count_' + field: Count('id', filter=condition) for field, condition in FINDING_DATE_COUNTS.items()}
+    for counts in findings.values('date', 'severity').annotate(**annotations):
+        row = get_row(counts['date'], counts['severity'])
+        for field in FINDING_DATE_COUNTS:
+            setattr(row, field, counts['count_' + field])
+
+    mitigated_findings = findings.filter(mitigated__isnull=False).annotate(mitigated_date=TruncDate('mitigated'))
+    for counts in mitigated_findings.values('mitigated_date', 'severity').annotate(count=Count('id')):
+        get_row(counts['mitigated_date'], counts['severity']).mitigated = counts['count']
+
+    for counts in mitigated_findings.filter(verified=True).values('date', 'mitigated_date', 'severity').annotate(count=Count('id')):
+        row = get_row(counts['date'], counts['severity'])
+        field = AGE_BUCKETS[get_age_bucket(get_age(counts['date'], counts['mitigated_date']))][1]
+        setattr(row, field, getattr(row, field) + counts['count'])
+
+    with transaction.atomic():
+        Product_Metrics_Rollup.objects.filter(product_id=product_id).delete()
+        Product_Metrics_Rollup.objects.bulk_create(rows.values(), batch_size=1000)
+    logger.debug('updated the metrics rollup of product %s with %i rows', product_id, len(rows))
+
+
+def get_metrics_rollup_cache_key(product_id):
+    return 'dojo_metrics_rollup_pending_%s' % product_id
+
+
+# the products and tests of which the rollup is outdated by the changes in the current defer_metrics_rollup block
+_deferred_rollups = threading.local()
+
+
+@contextmanager
+def defer_metrics_rollup():
+    """
+    Collects the products of which the rollup is outdated by the changes in the block (or function when used as
+    decorator), i.e. an import or a bulk operation, and updates the rollup of each product once when the block ends
+    instead of after every saved finding. The products of the tests of the saved findings are looked up with one
+    query. Nested blocks are part of the outermost block.
+    """
+    if getattr(_deferred_rollups, 'product_ids', None) is not None:
+        yield
+        return
+
+    _deferred_rollups.product_ids = set()
+    _deferred_rollups.test_ids = set()
+    try:
+        yield
+    finally:
+        product_ids, test_ids = _deferred_rollups.product_ids, _deferred_rollups.test_ids
+        _deferred_rollups.product_ids = _deferred_rollups.test_ids = None
+        if test_ids:
+            product_ids.update(Test.objects.filter(id__in=test_ids).values_list('engagement__product_id', flat=True))
+        for product_id in sorted(product_ids):
+            perform_metrics_rollup(product_id)
+
+
+def perform_metrics_rollup(product_id):
+    """
+    Marks the rollup of the product as outdated. Like perform_product_grading, the rollup is recomputed by one task per
+    product that is deferred by METRICS_ROLLUP_DEBOUNCE_SECONDS to handle all changes within that window at once, per
+    process unless the processes share the django cache (DD_CACHE_URL). Within a defer_metrics_rollup block the
+    rollup is only updated at the end of the block.
+    """
+    if not settings.METRICS_ROLLUP_ENABLED or not product_id:
+        return
+
+    deferred_product_ids = getattr(_deferred_rollups, 'product_ids', None)
+    if deferred_product_ids is not None:
+        deferred_product_ids.add(product_id)
+        return
+
+    debounce_seconds = settings.METRICS_ROLLUP_DEBOUNCE_SECONDS
+    if debounce_seconds <= 0 or not we_want_async(func=async_update_metrics_rollup):
+        update_metrics_rollup(product_id)
+        return
+
+    # the marker expires when the task is due, changes after that schedule a new task
+    if cache.add(get_metrics_rollup_cache_key(product_id), True, timeout=debounce_seconds):
+        async_update_metrics_rollup(product_id, countdown=debounce_seconds)
+
+
+def perform_metrics_rollup_of_test(test_id):
+    """perform_metrics_rollup for the product of the test, within a defer_metrics_rollup block when the block ends"""
+    if not settings.METRICS_ROLLUP_ENABLED or not test_id:
+        return
+
+    deferred_test_ids = getattr(_deferred_rollups, 'test_ids', None)
+    if deferred_test_ids is not None:
+        deferred_test_ids.add(test_id)
+        return
+
+    perform_metrics_rollup(Test.objects.filter(id=test_id).values_list('engagement__product_id', flat=True).first())
+
+
+@dojo_async_task(coalesce_key=0)
+@app.task
+def async_update_metrics_rollup(product_id, *args, **kwargs):
+    update_metrics_rollup(product_id)
+
+
+@app.task(ignore_result=True)
+def reconcile_metrics_rollup(*args, **kwargs):
+    """Recompute the rollup of all products, to include changes that don't send signals like queryset updates"""
+    if not settings.METRICS_ROLLUP_ENABLED:
+        return
+    for product_id in Product.objects.order_by('id').values_list('id', flat=True):
+        update_metrics_rollup(product_id)
+    # products without findings don't have rows that need to be removed, deleted products cascade
+
+
+def use_metrics_rollup(request, *params):
+    """The rollup only counts per product and date, so the metrics views can only use it when no other filter is applied"""
+    if not settings.METRICS_ROLLUP_ENABLED:
+        return False
+    return all(key in ('type', 'view', 'date') + params for key, value in request.GET.items() if value)
+
+
+def filter_metrics_rollup_by_date(rollup, request):
+    """Limits the rollup to the dates of the date filter of the metrics views, which defaults to the past 30 days"""
+    date_filter = MetricsDateRangeFilter(field_name='date')
+    try:
+        value = int(request.GET.get('date', ''))
+    except ValueError:
+        value = ''
+    if value not in date_filter.options or value == 7:
+        # any date, like the filter for unknown choices that the form rejects
+        return rollup
+    return date_filter.options[value][1](date_filter, rollup, 'date')
+
+
+def get_period_rollup_counts(opened_counts, closed_counts, accepted_counts, period_interval, start_date, end_date,
+                             relative_delta='months'):
+    """
+    The same charts as dojo.utils.get_period_counts, from counts per date and severity instead of the findings. The
+    closed findings are limited to the range of the finding dates, like the metrics view does.
+    """
+    tz = timezone.get_current_timezone()
+    start_date = datetime(start_date.year, start_date.month, start_date.day, tzinfo=tz)
+    range_start, range_end = start_date.date(), end_date.date()
+
+    opened_sum = get_range_sums(opened_counts, 'opened')
+    active_sum = get_range_sums(opened_counts, 'active')
+    closed_sum = get_range_sums(closed_counts, 'mitigated')
+    accepted_sum = get_range_sums(accepted_counts, 'accepted')
+
+    opened_in_period = [['Timestamp', 'Date', 'S0', 'S1', 'S2', 'S3', 'Total', 'Closed']]
+    active_in_period = [['Timestamp', 'Date', 'S0', 'S1', 'S2', 'S3', 'Total', 'Closed']]
+    accepted_in_period = [['Timestamp', 'Date', 'S0', 'S1', 'S2', 'S3', 'Total', 'Closed']]
+
+    for new_date, period_end in get_period_boundaries(period_interval, start_date, relative_delta):
+        period_start, period_end = new_date.date(), period_end.date()
+        opened = [opened_sum(severity, period_start, period_end) for severity in CHART_SEVERITIES]
+        active = [active_sum(severity, date.min, period_end) for severity in CHART_SEVERITIES]
+        accepted = [accepted_sum(severity, period_start, period_end) for severity in CHART_SEVERITIES]
+        closed = sum(closed_sum(severity, max(period_start, range_start), min(period_end, range_end)) for severity in SEVERITIES)
+
+        timestamp = tcalendar.timegm(new_date.timetuple()) * 1000
+        opened_in_period.append([timestamp, new_date] + opened + [sum(opened), closed])
+        accepted_in_period.append([timestamp, new_date] + accepted + [sum(accepted)])
+        active_in_period.append([timestamp, new_date] + active + [sum(active)])
+
+    return {
+        'opened_per_period': opened_in_period,
+        'accepted_per_period': accepted_in_period,
+        'active_per_period': active_in_period,
+    }
+
+
+def get_details_by_product(rows, field, path):
+    counts = get_zero_severity_level()
+    counts['Total'] = 0
+    details = {}
+    for row in rows:
+        if not row[field]:
+            continue
+        counts[row['severity']] += row[field]
+        counts['Total'] += row[field]
+        if row['product__name'] not in details:
+            details[row['product__name']] = dict(get_zero_severity_level(), Total=0, path=path(row['product']))
+        details[row['product__name']][row['severity']] += row[field]
+        details[row['product__name']]['Total'] += row[field]
+    return counts, details
+
+
+def finding_rollup_querys(prod_type, request, findings):
+    """The data of the metrics view by findings (see dojo.metrics.views.finding_querys) read from the rollup"""
+    products = get_authorized_products(Permissions.Product_View, request.user).filter(prod_type__in=prod_type)
+    all_rollup = Product_Metrics_Rollup.objects.filter(product__in=products).order_by()
+    rollup = filter_metrics_rollup_by_date(all_rollup, request)
+
+    date_range = rollup.filter(opened__gt=0).aggregate(start_date=Min('date'), end_date=Max('date'))
+    if date_range['start_date']:
+        tz = timezone.get_current_timezone()
+        start_date = datetime.combine(date_range['start_date'], datetime.min.time()).replace(tzinfo=tz)
+        end_date = datetime.combine(date_range['end_date'], datetime.min.time()).replace(tzinfo=tz)
+    else:
+        start_date = timezone.now()
+        end_date = timezone.now()
+
+    r = relativedelta(end_date, start_date)
+    months_between = (r.years * 12) + r.months
+    # include current month
+    months_between += 1
+
+    weeks_between = int(ceil((((r.years * 12) + r.months) * 4.33) + (r.days / 7)))
+    if weeks_between <= 0:
+        weeks_between += 2
+
+    # the findings closed and accepted in the period don't have to be opened in the period
+    in_range = all_rollup.filter(date__range=[start_date.date(), end_date.date()])
+    opened_counts = list(rollup.values('date', 'severity').annotate(opened=Sum('opened'), active=Sum('active')))
+    closed_counts = list(in_range.values('date', 'severity').annotate(mitigated=Sum('mitigated')))
+    # the charts count the accepted findings by the date of their risk acceptance, which isn't part of the rollup
+    accepted_counts = [row for row in Finding.objects.filter(
+        risk_accepted=True, date__range=[start_date, end_date], severity__in=SEVERITIES, test__engagement__product__in=products
+    ).annotate(acceptance_date=TruncDate('risk_acceptance__created')).values('acceptance_date', 'severity').annotate(
+        accepted=Count('id')).order_by() if row['acceptance_date']]
+    for row in accepted_counts:
+        row['date'] = row.pop('acceptance_date')
+    monthly_counts = get_period_rollup_counts(opened_counts, closed_counts, accepted_counts, months_between, start_date,
+                                              end_date, relative_delta='months')
+    weekly_counts = get_period_rollup_counts(opened_counts, closed_counts, accepted_counts, weeks_between, start_date,
+                                             end_date, relative_delta='weeks')
+
+    severity_sums = {severity.lower(): Coalesce(Sum('metrics_rollup__unmitigated', filter=Q(metrics_rollup__severity=severity)), 0)
+                     for severity in SEVERITIES}
+    top_ten = products.annotate(
+        total=Coalesce(Sum('metrics_rollup__unmitigated', filter=Q(metrics_rollup__severity__in=CHART_SEVERITIES)), 0), **severity_sums
+    ).filter(total__gt=0).order_by('-critical', '-high', '-medium', '-low')[:10]
+
+    product_counts = list(rollup.values('product', 'product__name', 'severity').annotate(opened=Sum('opened')))
+    in_period_counts, in_period_details = get_details_by_product(
+        product_counts, 'opened', lambda product_id: reverse('product_open_findings', args=(product_id, )))
+
+    product_counts = list(in_range.values('product', 'product__name', 'severity').annotate(
+        accepted=Sum('accepted'), mitigated=Sum('mitigated')))
+    accepted_count, accepted_in_period_details = get_details_by_product(
+        product_counts, 'accepted', lambda product_id: reverse('accepted_findings') + '?test__engagement__product=' + str(product_id))
+    closed_in_period_counts, closed_in_period_details = get_details_by_product(
+        product_counts, 'mitigated', lambda product_id: reverse('closed_findings') + '?test__engagement__product=' + str(product_id))
+
+    # the age of the open findings grows every day, the age of the mitigated findings is counted by the rollup
+    today = get_current_date()
+    age_detail = [0, 0, 0, 0]
+    age_fields = [field for _, field in AGE_BUCKETS]
+    for counts in rollup.values('date').annotate(opened=Sum('opened'), **{field: Sum(field) for field in age_fields}):
+        mitigated_counts = [counts[field] for field in age_fields]
+        age_detail[get_age_bucket(get_age(counts['date'], today))] += counts['opened'] - sum(mitigated_counts)
+        for index, count in enumerate(mitigated_counts):
+            age_detail[index] += count
+
+    return {
+        'all': findings,
+        # like the aggregate of the findings, which is empty without accepted findings
+        'accepted_count': {severity.lower(): count if accepted_count['Total'] else None for severity, count in accepted_count.items()},
+        'top_ten': top_ten,
+        'monthly_counts': monthly_counts,
+        'weekly_counts': weekly_counts,
+        'weeks_between': weeks_between,
+        'start_date': start_date,
+        'end_date': end_date,
+        'in_period_counts': in_period_counts,
+        'in_period_details': in_period_details,
+        'age_detail': age_detail,
+        'accepted_in_period_details': accepted_in_period_details,
+        'closed_in_period_counts': closed_in_period_counts,
+        'closed_in_period_details': closed_in_period_details,
+    }
+
+
+def get_product_rollup_by_severity(product, week, request):
+    """The counts by severity of the product metrics view (see dojo.product.views.finding_querys) read from the rollup"""
+    fields = ['verified', 'inactive', 'closed', 'false_positive', 'out_of_scope', 'total']
+    by_severity = {field: get_zero_severity_level() for field in fields + ['new_verified']}
+    rollup = filter_metrics_rollup_by_date(Product_Metrics_Rollup.objects.filter(product=product).order_by(), request)
+    for counts in rollup.values('severity').annotate(**{field: Sum(field) for field in fields}):
+        for field in fields:
+            by_severity[field][counts['severity']] = counts[field]
+    for counts in rollup.filter(date__gte=week.date()).values('severity').annotate(verified=Sum('verified')):
+        by_severity['new_verified'][counts['severity']] = counts['verified']
+    by_severity['all'] = by_severity.pop('total')
+    return by_severity
@@ -0,0 +1,13 @@
+from django.db.models import signals
+from django.dispatch import receiver
+import logging
+from dojo.models import Finding
+from dojo.metrics.helper import perform_metrics_rollup_of_test
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(signals.post_save, sender=Finding)
+@receiver(signals.post_delete, sender=Finding)
+def finding_metrics_rollup(sender, instance, **kwargs):
+    perform_metrics_rollup_of_test(instance.test_id)
@@ -21,6 +21,7 @@ from django.views.decorators.cache import cache_page
 from django.utils import timezone
 
 from dojo.filters import MetricsFindingFilter, UserFilter, MetricsEndpointFilter
+from dojo.metrics.helper import finding_rollup_querys, use_metrics_rollup
 from dojo.forms import SimpleMetricsForm, ProductTypeCountsForm
 from dojo.models import Product_Type, Finding, Product, Engagement, Test, \
     Risk_Acceptance, Dojo_User, Endpoint_Status
@@ -125,7 +126,7 @@ def identify_view(request):
     return 'Finding'
 
 
-def finding_querys(prod_type, request):
+def finding_query(request):
     findings_query = Finding.objects.filter(
         verified=True,
         severity__in=('Critical', 'High', 'Medium', 'Low', 'Info')
@@ -140,7 +141,11 @@ def finding_querys(prod_type, request):
         'test__test_type',
     )
 
-    findings_query = get_authorized_findings(Permissions.Finding_View, findings_query, request.user)
+    return get_authorized_findings(Permissions.Finding_View, findings_query, request.user)
+
+
+def finding_querys(prod_type, request):
+    findings_query = finding_query(request)
 
     findings = MetricsFindingFilter(request.GET, queryset=findings_query)
     findings_qs = queryset_check(findings)
@@ -404,25 +409,34 @@ def metrics(request, mtype):
     filters = dict()
     if view == 'Finding':
         page_name = _('Product Type Metrics by Findings')
-        filters = finding_querys(prod_type, request)
+        if use_metrics_rollup(request, 'test__engagement__product__prod_type'):
+            filters = finding_rollup_querys(prod_type, request, MetricsFindingFilter(request.GET, queryset=finding_query(request)))
+        else:
+            filters = finding_querys(prod_type, request)
     elif view == 'Endpoint':
         page_name = _('Product Type Metrics by Affected Endpoints')
         filters = endpoint_querys(prod_type, request)
 
-    in_period_counts, in_period_details, age_detail = get_in_period_details([
-        obj.finding if view == 'Endpoint' else obj
-        for obj in queryset_check(filters['all'])
-    ])
-
-    accepted_in_period_details = get_accepted_in_period_details([
-        obj.finding if view == 'Endpoint' else obj
-        for obj in filters['accepted']
-    ])
-
-    closed_in_period_counts, closed_in_period_details = get_closed_in_period_details([
-        obj.finding if view == 'Endpoint' else obj
-        for obj in filters['closed']
-    ])
+    if 'in_period_counts' in filters:
+        # counted by the rollup
+        in_period_counts, in_period_details, age_detail = filters['in_period_counts'], filters['in_period_details'], filters['age_detail']
+        accepted_in_period_details = filters['accepted_in_period_details']
+        closed_in_period_counts, closed_in_period_details = filters['closed_in_period_counts'], filters['closed_in_period_details']
+    else:
+        in_period_counts, in_period_details, age_detail = get_in_period_details([
+            obj.finding if view == 'Endpoint' else obj
+            for obj in queryset_check(filters['all'])
+        ])
+
+        accepted_in_period_details = get_accepted_in_period_details([
+            obj.finding if view == 'Endpoint' else obj
+            for obj in filters['accepted']
+        ])
+
+        closed_in_period_counts, closed_in_period_details = get_closed_in_period_details([
+            obj.finding if view == 'Endpoint' else obj
+            for obj in filters['closed']
+        ])
 
     punchcard = list()
     ticks = list()
@@ -3,7 +3,9 @@ from django.conf import settings
 from urllib.parse import quote
 from re import compile
 import logging
-from threading import local
+from threading import local, Lock
+import time
+from django.core.cache import cache
 from django.db import models
 from django.urls import reverse
 
@@ -96,11 +98,71 @@ class DojoSytemSettingsMiddleware(object):
     @classmethod
     def load(cls):
         from dojo.models import System_Settings
-        system_settings = System_Settings.objects.get(no_cache=True)
+        system_settings = SystemSettingsCache.get(lambda: System_Settings.objects.get(no_cache=True))
         cls._thread_local.system_settings = system_settings
         return system_settings
 
 
+class SystemSettingsCache(object):
+    """
+    Process wide cache of the system settings, used outside of requests (celery tasks, management commands) and
+    when the settings are needed before the request cache is loaded. A copy is valid for SYSTEM_SETTINGS_CACHE_TTL seconds
+    and as long as the version counter in the django cache is unchanged. Saving the system settings increments the
+    version, so the other processes reload them on their next lookup when they share the django cache (DD_CACHE_URL),
+    otherwise when their copy expires.
+    The cached instance is shared, it must not be modified.
+    """
+    VERSION_KEY = 'dojo_system_settings_version'
+
+    _lock = Lock()
+    _system_settings = None
+    _version = None
+    _expires = 0
+    hits = 0
+    misses = 0
+
+    @classmethod
+    def get(cls, loader):
+        ttl = getattr(settings, 'SYSTEM_SETTINGS_CACHE_TTL', 0)
+        if ttl <= 0:
+            return loader()
+
+        version = cache.get(cls.VERSION_KEY, 0)
+        with cls._lock:
+            if cls._system_settings is not None and cls._version == version and time.monotonic() < cls._expires:
+                cls.hits += 1
+                return cls._system_settings
+            cls.misses += 1
+
+        system_settings = loader()
+        if system_settings.pk is None:
+            # default instance constructed because the database is not available, don't keep it around
+            return system_settings
+        with cls._lock:
+            cls._system_settings = system_settings
+            cls._version = version
+            cls._expires = time.monotonic() + ttl
+        return system_settings
+
+    @classmethod
+    def invalidate(cls, *args, **kwargs):
+        with cls._lock:
+            cls._system_settings = None
+        try:
+            cache.incr(cls.VERSION_KEY)
+        except ValueError:
+            # the key doesn't exist (yet)
+            cache.set(cls.VERSION_KEY, 1, timeout=None)
+
+    @classmethod
+    def get_stats(cls):
+        return {'hits': cls.hits, 'misses': cls.misses}
+
+
+models.signals.post_save.connect(SystemSettingsCache.invalidate, sender='dojo.System_Settings')
+models.signals.post_delete.connect(SystemSettingsCache.invalidate, sender='dojo.System_Settings')
+
+
 class System_Settings_Manager(models.Manager):
 
     def get_from_db(self, *args, **kwargs):
@@ -123,8 +185,10 @@ class System_Settings_Manager(models.Manager):
         from_cache = DojoSytemSettingsMiddleware.get_system_settings()
 
         if not from_cache:
-            # logger.debug('no cached value found, loading system settings from db')
-            return self.get_from_db(*args, **kwargs)
+            # logger.debug('no cached value found, loading system settings from process cache or db')
+            if args or kwargs:
+                return self.get_from_db(*args, **kwargs)
+            return SystemSettingsCache.get(self.get_from_db)
 
         return from_cache
 
@@ -1428,7 +1428,7 @@ class Engagement(models.Model):
         import dojo.finding.helper as helper
         helper.prepare_duplicates_for_delete(engagement=self)
         super().delete(*args, **kwargs)
-        calculate_grade(self.product)
+        perform_product_grading(self.product)
 
     def inherit_tags(self, potentially_existing_tags):
         # get a copy of the tags to be inherited
@@ -1985,7 +1985,7 @@ class Test(models.Model):
     def delete(self, *args, **kwargs):
         logger.debug('%d test delete', self.id)
         super().delete(*args, **kwargs)
-        calculate_grade(self.engagement.product)
+        perform_product_grading(self.engagement.product)
 
     @property
     def statistics(self):
@@ -2463,7 +2463,7 @@ class Finding(models.Model):
         import dojo.finding.helper as helper
         helper.finding_delete(self)
         super().delete(*args, **kwargs)
-        calculate_grade(self.test.engagement.product)
+        perform_product_grading(self.test.engagement.product)
 
     # only used by bulk risk acceptance api
     @classmethod
@@ -2478,7 +2478,9 @@ class Finding(models.Model):
 
         return None
 
-    def compute_hash_code(self):
+    def compute_hash_code(self, endpoints=None, vulnerability_ids=None):
+        # endpoints and vulnerability_ids can be passed in as the strings returned by get_endpoints() and
+        # get_vulnerability_ids(), so the hash_code of many findings can be computed without querying them per finding
 
         # Check if all needed settings are defined
         if not hasattr(settings, 'HASHCODE_FIELDS_PER_SCANNER') or not hasattr(settings, 'HASHCODE_ALLOWS_NULL_CWE') or not hasattr(settings, 'HASHCODE_ALLOWED_FIELDS'):
@@ -2513,12 +2515,12 @@ class Finding(models.Model):
         for hashcodeField in hash_code_fields:
             if hashcodeField == 'endpoints':
                 # For endpoints, need to compute the field
-                myEndpoints = self.get_endpoints()
+                myEndpoints = self.get_endpoints() if endpoints is None else endpoints
                 fields_to_hash = fields_to_hash + myEndpoints
                 deduplicationLogger.debug(hashcodeField + ' : ' + myEndpoints)
             elif hashcodeField == 'vulnerability_ids':
                 # For vulnerability_ids, need to compute the field
-                my_vulnerability_ids = self.get_vulnerability_ids()
+                my_vulnerability_ids = self.get_vulnerability_ids() if vulnerability_ids is None else vulnerability_ids
                 fields_to_hash = fields_to_hash + my_vulnerability_ids
                 deduplicationLogger.debug(hashcodeField + ' : ' + my_vulnerability_ids)
             else:
@@ -2723,8 +2725,11 @@ class Finding(models.Model):
         return self._age(self.date)
 
     def get_sla_periods(self):
-        sla_configuration = SLA_Configuration.objects.filter(id=self.test.engagement.product.sla_configuration_id).first()
-        return sla_configuration
+        from dojo.sla_config.helpers import SLAConfigurationCache
+        # set on the findings of a page by dojo.sla_config.helpers.annotate_sla_configuration
+        if hasattr(self, 'sla_configuration_id'):
+            return SLAConfigurationCache.get(self.sla_configuration_id)
+        return SLAConfigurationCache.get(self.test.engagement.product.sla_configuration_id)
 
     def get_sla_start_date(self):
         if self.sla_start_date:
@@ -2810,19 +2815,7 @@ class Finding(models.Model):
     def has_finding_group(self):
         return self.finding_group is not None
 
-    def save_no_options(self, *args, **kwargs):
-        return self.save(dedupe_option=False, rules_option=False, product_grading_option=False,
-             issue_updater_option=False, push_to_jira=False, user=None, *args, **kwargs)
-
-    def save(self, dedupe_option=True, rules_option=True, product_grading_option=True,
-             issue_updater_option=True, push_to_jira=False, user=None, *args, **kwargs):
-
-        from dojo.finding import helper as finding_helper
-
-        if not user:
-            from dojo.utils import get_current_user
-            user = get_current_user()
-
+    def set_derived_fields(self):
         # Title Casing
         from titlecase import titlecase
         self.title = titlecase(self.title[:511])
@@ -2839,6 +2832,49 @@ class Finding(models.Model):
             except Exception as ex:
                 logger.error("Can't compute cvssv3 score for finding id %i. Invalid cvssv3 vector found: '%s'. Exception: %s", self.id, self.cvssv3, ex)
 
+    def prepare_new_finding(self, user):
+        from dojo.finding import helper as finding_helper
+        from dojo.utils import apply_cwe_to_template
+        apply_cwe_to_template(self)
+
+        if (self.file_path is not None) and (len(self.unsaved_endpoints) == 0):
+            self.static_finding = True
+            self.dynamic_finding = False
+        elif (self.file_path is not None):
+            self.static_finding = True
+
+        # because we have reduced the number of (super()).save() calls, the helper is no longer called for new findings
+        # so we call it manually
+        finding_helper.update_finding_status(self, user, changed_fields={'id': (None, None)})
+
+    # Prepares a new finding to be inserted with bulk_create(): sets the fields normally set by save()
+    # and computes the hash_code upfront from the unsaved endpoints and vulnerability ids
+    def prepare_for_bulk_create(self, user=None):
+        if not user:
+            from dojo.utils import get_current_user
+            user = get_current_user()
+
+        self.set_derived_fields()
+        self.prepare_new_finding(user)
+        if self.hash_code is None:
+            self.hash_code = self.compute_hash_code()
+            deduplicationLogger.debug("Hash_code computed for finding: %s", self.hash_code)
+
+    def save_no_options(self, *args, **kwargs):
+        return self.save(dedupe_option=False, rules_option=False, product_grading_option=False,
+             issue_updater_option=False, push_to_jira=False, user=None, *args, **kwargs)
+
+    def save(self, dedupe_option=True, rules_option=True, product_grading_option=True,
+             issue_updater_option=True, push_to_jira=False, user=None, *args, **kwargs):
+
+        from dojo.finding import helper as finding_helper
+
+        if not user:
+            from dojo.utils import get_current_user
+            user = get_current_user()
+
+        self.set_derived_fields()
+
         # Finding.save is called once from serializers.py with dedupe_option=False because the finding is not ready yet, for example the endpoints are not built
         # It is then called a second time with dedupe_option defaulted to true; now we can compute the hash_code and run the deduplication
         if dedupe_option:
@@ -2850,18 +2886,7 @@ class Finding(models.Model):
 
         if self.pk is None:
             # We enter here during the first call from serializers.py
-            from dojo.utils import apply_cwe_to_template
-            self = apply_cwe_to_template(self)
-
-            if (self.file_path is not None) and (len(self.unsaved_endpoints) == 0):
-                self.static_finding = True
-                self.dynamic_finding = False
-            elif (self.file_path is not None):
-                self.static_finding = True
-
-            # because we have reduced the number of (super()).save() calls, the helper is no longer called for new findings
-            # so we call it manually
-            finding_helper.update_finding_status(self, user, changed_fields={'id': (None, None)})
+            self.prepare_new_finding(user)
 
         else:
             # logger.debug('setting static / dynamic in save')
@@ -4029,6 +4054,75 @@ class Benchmark_Product_Summary(models.Model):
         unique_together = [('product', 'benchmark_type')]
 
 
+class Product_Metrics_Rollup(models.Model):
+    """
+    Number of findings of a product per finding date and severity, maintained by dojo.metrics.helper so the metrics
+    pages don't have to count the findings themselves. All counts are of the findings with this date, except mitigated,
+    which counts the findings mitigated on this date.
+    """
+    product = models.ForeignKey(Product, related_name='metrics_rollup', on_delete=models.CASCADE)
+    date = models.DateField()
+    severity = models.CharField(max_length=200)
+    total = models.IntegerField(default=0)
+    # metrics of the product types: verified findings, verified and active findings and risk accepted findings
+    opened = models.IntegerField(default=0)
+    active = models.IntegerField(default=0)
+    accepted = models.IntegerField(default=0)
+    mitigated = models.IntegerField(default=0)
+    # verified findings that are not a false positive, duplicate, out of scope or mitigated (top ten products)
+    unmitigated = models.IntegerField(default=0)
+    # age of the verified findings that have been mitigated, the age of the others is derived from the date
+    mitigated_age_0_30 = models.IntegerField(default=0)
+    mitigated_age_31_60 = models.IntegerField(default=0)
+    mitigated_age_61_90 = models.IntegerField(default=0)
+    mitigated_age_over_90 = models.IntegerField(default=0)
+    # metrics of the product, see dojo.product.views.finding_querys
+    verified = models.IntegerField(default=0)
+    open = models.IntegerField(default=0)
+    inactive = models.IntegerField(default=0)
+    closed = models.IntegerField(default=0)
+    false_positive = models.IntegerField(default=0)
+    out_of_scope = models.IntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [('product', 'date', 'severity')]
+
+    def __str__(self):
+        return '%s: %s %s' % (self.product_id, self.date, self.severity)
+
+
+class Async_Delete_Job(models.Model):
+    """
+    Progress of the deletion of a product type, product, engagement or test by dojo.utils.async_delete. The objects
+    below the deleted object are deleted per step of the plan (one model each) in batches ordered by id, the job is
+    updated in the same transaction as each batch so an interrupted deletion resumes after the last deleted id.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = ((PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed'))
+
+    object_model = models.CharField(max_length=100)
+    object_id = models.IntegerField()
+    object_name = models.CharField(max_length=1000)
+    user = models.ForeignKey(Dojo_User, null=True, blank=True, editable=False, on_delete=models.SET_NULL)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    # the current step of the plan and the highest id deleted in this step
+    step = models.IntegerField(default=0)
+    last_id = models.IntegerField(default=0)
+    deleted = models.IntegerField(default=0)
+    # number of objects to delete, counted once when the job starts
+    total = models.IntegerField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '%s %s: %s' % (self.object_model, self.object_id, self.status)
+
+
 # ==========================
 # Defect Dojo Engaegment Surveys
 # ==============================
@@ -4220,7 +4314,7 @@ def enable_disable_auditlog(enable=True):
         auditlog.unregister(Cred_User)
 
 
-from dojo.utils import calculate_grade, get_system_setting, to_str_typed
+from dojo.utils import perform_product_grading, get_system_setting, to_str_typed
 enable_disable_auditlog(enable=get_system_setting('enable_auditlog'))  # on startup choose safe to retrieve system settiung)
 
 tagulous.admin.register(Product.tags)
@@ -4323,3 +4417,5 @@ admin.site.register(General_Survey)
 admin.site.register(Test_Import)
 admin.site.register(Test_Import_Finding_Action)
 admin.site.register(Finding_Group)
+admin.site.register(Product_Metrics_Rollup)
+admin.site.register(Async_Delete_Job)
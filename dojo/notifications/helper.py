@@ -1,7 +1,15 @@
+import json
 import logging
+import threading
+import time
+from contextlib import contextmanager
+
 import requests
 
+from django.conf import settings
+from django.core.cache import cache
 from django.core.mail import EmailMessage
+from django.db import models
 from django.db.models import Q, Count, Prefetch
 from django.template import TemplateDoesNotExist
 from django.template.loader import render_to_string
@@ -11,7 +19,8 @@ from django.utils.translation import gettext as _
 from dojo.authorization.roles_permissions import Permissions
 from dojo.celery import app
 from dojo.decorators import dojo_async_task, we_want_async
-from dojo.models import Notifications, Dojo_User, Alerts, UserContactInfo, System_Settings
+from dojo.models import Notifications, Dojo_User, Alerts, UserContactInfo, System_Settings, User, Dojo_Group_Member, \
+    Global_Role, Product, Product_Member, Product_Group, Product_Type_Member, Product_Type_Group
 from dojo.user.queries import get_authorized_users_for_product_and_product_type, get_authorized_users_for_product_type
 
 logger = logging.getLogger(__name__)
@@ -61,58 +70,139 @@ def create_notification(event=None, **kwargs):
             product = get_product(kwargs['obj'])
             logger.debug("Defined product of obj %s", product)
 
-        # System notifications
-        try:
-            system_notifications = Notifications.objects.get(user=None, template=False)
-        except Exception:
-            system_notifications = Notifications()
+        system_notifications, users_notifications = NotificationRecipientCache.get_recipients(
+            event, product, product_type, no_users=kwargs.get('no_users') is True)
 
         # System notifications are sent one with user=None, which will trigger email to configured system email, to global slack channel, etc.
         process_notifications(event, system_notifications, **kwargs)
 
         # All admins will also receive system notifications, but as part of the person global notifications section below
         # This time user is set, so will trigger email to personal email, to personal slack channel (mention), etc.
-        # only retrieve users which have at least one notification type enabled for this event type.
         logger.debug('creating personal notifications for event: %s', event)
+        for notifications_set in users_notifications:
+            process_notifications(event, notifications_set, **kwargs)
 
-        # There are notification like deleting a product type that shall not be sent to users.
-        # These notifications will have the parameter no_users=True
-        if not ('no_users' in kwargs and kwargs['no_users'] is True):
-            # get users with either global notifications, or a product specific noditiciation
-            # and all admin/superuser, they will always be notified
-            users = Dojo_User.objects.filter(is_active=True).prefetch_related(Prefetch(
-                "notifications_set",
-                queryset=Notifications.objects.filter(Q(product_id=product) | Q(product__isnull=True)),
-                to_attr="applicable_notifications"
-            )).annotate(applicable_notifications_count=Count('notifications__id', filter=Q(notifications__product_id=product) | Q(notifications__product__isnull=True)))\
-                .filter((Q(applicable_notifications_count__gt=0) | Q(is_superuser=True)))
-
-            # only send to authorized users or admin/superusers
-            logger.debug('Filtering users for the product %s', product)
-
-            if product:
-                users = get_authorized_users_for_product_and_product_type(users, product, Permissions.Product_View)
-
-            elif product_type:
-                users = get_authorized_users_for_product_type(users, product_type, Permissions.Product_Type_View)
-            else:
-                # nor product_type nor product defined, we should not make noise and send only notifications to admins
-                logger.debug('Product is not specified, making it silent')
-                users = users.filter(is_superuser=True)
 
-            for user in users:
-                logger.debug("Authorized user for the product %s", user)
-                # send notifications to user after merging possible multiple notifications records (i.e. personal global + personal product)
-                # kwargs.update({'user': user})
-                applicable_notifications = user.applicable_notifications
-                if user.is_superuser:
-                    logger.debug("User %s is superuser", user)
-                    # admin users get all system notifications
-                    applicable_notifications.append(system_notifications)
+def get_recipients(event, product=None, product_type=None, no_users=False):
+    """
+    Returns the system notifications and the merged personal notifications of the users that are notified of the event
+    for the product or product type.
+    """
+    # System notifications
+    try:
+        system_notifications = Notifications.objects.get(user=None, template=False)
+    except Exception:
+        system_notifications = Notifications()
+
+    # There are notification like deleting a product type that shall not be sent to users.
+    # These notifications will have the parameter no_users=True
+    if no_users:
+        return system_notifications, []
+
+    # get users with either global notifications, or a product specific noditiciation
+    # and all admin/superuser, they will always be notified
+    users = Dojo_User.objects.filter(is_active=True).prefetch_related(Prefetch(
+        "notifications_set",
+        queryset=Notifications.objects.filter(Q(product_id=product) | Q(product__isnull=True)),
+        to_attr="applicable_notifications"
+    )).annotate(applicable_notifications_count=Count('notifications__id', filter=Q(notifications__product_id=product) | Q(notifications__product__isnull=True)))\
+        .filter((Q(applicable_notifications_count__gt=0) | Q(is_superuser=True)))
+
+    # only send to authorized users or admin/superusers
+    logger.debug('Filtering users for the product %s', product)
+
+    if product:
+        users = get_authorized_users_for_product_and_product_type(users, product, Permissions.Product_View)
+
+    elif product_type:
+        users = get_authorized_users_for_product_type(users, product_type, Permissions.Product_Type_View)
+    else:
+        # nor product_type nor product defined, we should not make noise and send only notifications to admins
+        logger.debug('Product is not specified, making it silent')
+        users = users.filter(is_superuser=True)
+
+    users_notifications = []
+    for user in users.select_related('usercontactinfo'):
+        logger.debug("Authorized user for the product %s", user)
+        # send notifications to user after merging possible multiple notifications records (i.e. personal global + personal product)
+        applicable_notifications = user.applicable_notifications
+        if user.is_superuser:
+            logger.debug("User %s is superuser", user)
+            # admin users get all system notifications
+            applicable_notifications.append(system_notifications)
+
+        notifications_set = Notifications.merge_notifications_list(applicable_notifications)
+        notifications_set.user = user
+        # users without any channel for the event don't need to be processed
+        if getattr(notifications_set, event, None):
+            users_notifications.append(notifications_set)
+    return system_notifications, users_notifications
+
+
+class NotificationRecipientCache(object):
+    """
+    Process wide cache of the recipients of the notifications per event and product (or product type), which are the
+    same for all notifications of an import or an SLA run. The recipients are valid for
+    NOTIFICATION_RECIPIENT_CACHE_TTL seconds and as long as the version counter in the django cache is unchanged.
+    Changes to users, memberships, roles and notification settings increment the version, so all processes resolve the
+    recipients again. The recipients follow from the authorization of the users, so they are only cached when the
+    django cache is shared by the processes (DD_CACHE_URL): with a cache per process, the other processes would keep
+    notifying a user that lost access to the product.
+    """
+    VERSION_KEY = 'dojo_notification_recipients_version'
+    # the django cache backends that only exist in the process, the version counter doesn't reach the other processes
+    LOCAL_CACHE_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache')
+
+    _lock = threading.Lock()
+    _recipients = {}
+    _version = None
+
+    @classmethod
+    def get_recipients(cls, event, product=None, product_type=None, no_users=False):
+        ttl = getattr(settings, 'NOTIFICATION_RECIPIENT_CACHE_TTL', 0)
+        if ttl <= 0 or settings.CACHES['default']['BACKEND'] in cls.LOCAL_CACHE_BACKENDS:
+            return get_recipients(event, product, product_type, no_users)
+
+        key = (event, getattr(product, 'id', product), getattr(product_type, 'id', product_type), no_users)
+        version = cache.get(cls.VERSION_KEY, 0)
+        with cls._lock:
+            if cls._version != version:
+                cls._recipients = {}
+                cls._version = version
+            cached = cls._recipients.get(key)
+            if cached is not None and time.monotonic() < cached[0]:
+                return cached[1]
+
+        recipients = get_recipients(event, product, product_type, no_users)
+        with cls._lock:
+            if cls._version == version:
+                cls._recipients[key] = (time.monotonic() + ttl, recipients)
+        return recipients
+
+    @classmethod
+    def invalidate_product(cls, *args, **kwargs):
+        # the product type of a product determines who is authorized, not e.g. its grade
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'prod_type' in update_fields:
+            cls.invalidate()
+
+    @classmethod
+    def invalidate(cls, *args, **kwargs):
+        with cls._lock:
+            cls._recipients = {}
+        try:
+            cache.incr(cls.VERSION_KEY)
+        except ValueError:
+            # the key doesn't exist (yet)
+            cache.set(cls.VERSION_KEY, 1, timeout=None)
+
 
-                notifications_set = Notifications.merge_notifications_list(applicable_notifications)
-                notifications_set.user = user
-                process_notifications(event, notifications_set, **kwargs)
+for model in [Notifications, User, Dojo_User, UserContactInfo, Dojo_Group_Member, Global_Role, Product_Member,
+              Product_Group, Product_Type_Member, Product_Type_Group]:
+    models.signals.post_save.connect(NotificationRecipientCache.invalidate, sender=model)
+    models.signals.post_delete.connect(NotificationRecipientCache.invalidate, sender=model)
+models.signals.post_save.connect(NotificationRecipientCache.invalidate_product, sender=Product)
+models.signals.post_delete.connect(NotificationRecipientCache.invalidate, sender=Product)
 
 
 def create_description(event, *args, **kwargs):
@@ -164,79 +254,159 @@ def process_notifications(event, notifications=None, **kwargs):
 
     if slack_enabled and 'slack' in getattr(notifications, event):
         logger.debug('Sending Slack Notification')
-        send_slack_notification(event, notifications.user, **kwargs)
+        dispatch_notification('slack', event, notifications.user, **kwargs)
 
     if msteams_enabled and 'msteams' in getattr(notifications, event):
         logger.debug('Sending MSTeams Notification')
-        send_msteams_notification(event, notifications.user, **kwargs)
+        dispatch_notification('msteams', event, notifications.user, **kwargs)
 
     if mail_enabled and 'mail' in getattr(notifications, event):
         logger.debug('Sending Mail Notification')
-        send_mail_notification(event, notifications.user, **kwargs)
+        dispatch_notification('mail', event, notifications.user, **kwargs)
 
     if 'alert' in getattr(notifications, event, None):
         logger.debug('Sending Alert')
-        send_alert_notification(event, notifications.user, **kwargs)
+        dispatch_notification('alert', event, notifications.user, **kwargs)
 
 
-@dojo_async_task
-@app.task
-def send_slack_notification(event, user=None, *args, **kwargs):
-    from dojo.utils import get_system_setting
+# the notifications collected by batch_notifications in the current thread
+_batch = threading.local()
 
-    def _post_slack_message(channel):
-        res = requests.request(
-            method='POST',
-            url='https://slack.com/api/chat.postMessage',
-            data={
-                'token': get_system_setting('slack_token'),
-                'channel': channel,
-                'username': get_system_setting('slack_username'),
-                'text': create_notification_message(event, user, 'slack', *args, **kwargs)
-            })
-
-        if 'error' in res.text:
-            logger.error("Slack is complaining. See raw text below.")
-            logger.error(res.text)
-            raise RuntimeError('Error posting message to Slack: ' + res.text)
 
+@contextmanager
+def batch_notifications():
+    """
+    Collects the notifications created in the block and sends them when the block ends, grouped per channel and user:
+    all notifications of a user (or the system channel) are sent as one Slack message, one MS Teams card, one email
+    and one bulk insert of alerts. Nested blocks are part of the outermost block. The SLA notification run and the
+    imports and reimports use it.
+    """
+    if getattr(_batch, 'notifications', None) is not None:
+        yield
+        return
+
+    _batch.notifications = []
     try:
-        # If the user has slack information on profile and chooses to receive slack notifications
-        # Will receive a DM
-        if user is not None:
-            logger.debug('personal notification to slack for user %s', user)
-            if hasattr(user, 'usercontactinfo') and user.usercontactinfo.slack_username is not None:
-                slack_user_id = user.usercontactinfo.slack_user_id
-                if not slack_user_id:
-                    # Lookup the slack userid the first time, then save it.
-                    slack_user_id = get_slack_user_id(
-                        user.usercontactinfo.slack_username)
-
-                    if slack_user_id:
-                        slack_user_save = UserContactInfo.objects.get(user_id=user.id)
-                        slack_user_save.slack_user_id = slack_user_id
-                        slack_user_save.save()
-
-                # only send notification if we managed to find the slack_user_id
-                if slack_user_id:
-                    channel = '@{}'.format(slack_user_id)
-                    _post_slack_message(channel)
+        yield
+    finally:
+        pending, _batch.notifications = _batch.notifications, None
+        send_batched_notifications(pending)
+
+
+def dispatch_notification(channel, event, user=None, **kwargs):
+    pending = getattr(_batch, 'notifications', None)
+    if pending is not None:
+        pending.append((channel, user, event, kwargs))
+    else:
+        NOTIFICATION_SENDERS[channel][0](event, user, **kwargs)
+
+
+def send_batched_notifications(pending):
+    groups = {}
+    for channel, user, event, kwargs in pending:
+        groups.setdefault((channel, user.id if user else None), (user, []))[1].append((event, kwargs))
+
+    batch_size = max(settings.NOTIFICATION_BATCH_SIZE, 1)
+    for (channel, user_id), (user, notifications) in groups.items():
+        logger.debug('sending %i batched %s notifications to %s', len(notifications), channel, user)
+        send_notification, send_notifications = NOTIFICATION_SENDERS[channel]
+        for index in range(0, len(notifications), batch_size):
+            chunk = notifications[index:index + batch_size]
+            if len(chunk) == 1:
+                event, kwargs = chunk[0]
+                send_notification(event, user, **kwargs)
             else:
-                logger.info("The user %s does not have a email address informed for Slack in profile.", user)
+                send_notifications(chunk, user)
+
+
+def get_batch_title(notifications):
+    return _('%(count)s notifications') % {'count': len(notifications)}
+
+
+def get_slack_channel(user):
+    """The channel of the personal or, without user, the system notifications on slack"""
+    from dojo.utils import get_system_setting
+
+    # If the user has slack information on profile and chooses to receive slack notifications
+    # Will receive a DM
+    if user is not None:
+        logger.debug('personal notification to slack for user %s', user)
+        if hasattr(user, 'usercontactinfo') and user.usercontactinfo.slack_username is not None:
+            slack_user_id = user.usercontactinfo.slack_user_id
+            if not slack_user_id:
+                # Lookup the slack userid the first time, then save it.
+                slack_user_id = get_slack_user_id(
+                    user.usercontactinfo.slack_username)
+
+                if slack_user_id:
+                    slack_user_save = UserContactInfo.objects.get(user_id=user.id)
+                    slack_user_save.slack_user_id = slack_user_id
+                    slack_user_save.save()
+
+            # only send notification if we managed to find the slack_user_id
+            if slack_user_id:
+                return '@{}'.format(slack_user_id)
         else:
-            # System scope slack notifications, and not personal would still see this go through
-            if get_system_setting('slack_channel') is not None:
-                channel = get_system_setting('slack_channel')
-                logger.info("Sending system notification to system channel {}.".format(channel))
-                _post_slack_message(channel)
-            else:
-                logger.debug('slack_channel not configured: skipping system notification')
+            logger.info("The user %s does not have a email address informed for Slack in profile.", user)
+    else:
+        # System scope slack notifications, and not personal would still see this go through
+        if get_system_setting('slack_channel') is not None:
+            channel = get_system_setting('slack_channel')
+            logger.info("Sending system notification to system channel {}.".format(channel))
+            return channel
+        else:
+            logger.debug('slack_channel not configured: skipping system notification')
+    return None
+
+
+def post_slack_message(channel, text):
+    from dojo.utils import get_system_setting
+
+    res = requests.request(
+        method='POST',
+        url='https://slack.com/api/chat.postMessage',
+        data={
+            'token': get_system_setting('slack_token'),
+            'channel': channel,
+            'username': get_system_setting('slack_username'),
+            'text': text
+        })
+
+    if 'error' in res.text:
+        logger.error("Slack is complaining. See raw text below.")
+        logger.error(res.text)
+        raise RuntimeError('Error posting message to Slack: ' + res.text)
+
+
+@dojo_async_task
+@app.task
+def send_slack_notification(event, user=None, *args, **kwargs):
+    try:
+        channel = get_slack_channel(user)
+        if channel:
+            post_slack_message(channel, create_notification_message(event, user, 'slack', *args, **kwargs))
 
     except Exception as e:
         logger.exception(e)
         log_alert(e, 'Slack Notification', title=kwargs['title'], description=str(e), url=kwargs.get('url', None))
 
 
+@dojo_async_task
+@app.task
+def send_slack_notifications(notifications, user=None, *args, **kwargs):
+    """Sends a batch of (event, kwargs) notifications as one Slack message"""
+    try:
+        channel = get_slack_channel(user)
+        if channel:
+            post_slack_message(channel, '\n\n'.join(
+                create_notification_message(event, user, 'slack', **notification_kwargs).strip()
+                for event, notification_kwargs in notifications))
+
+    except Exception as e:
+        logger.exception(e)
+        log_alert(e, 'Slack Notification', title=get_batch_title(notifications), description=str(e))
+
+
 @dojo_async_task
 @app.task
 def send_msteams_notification(event, user=None, *args, **kwargs):
@@ -264,6 +434,37 @@ def send_msteams_notification(event, user=None, *args, **kwargs):
         pass
 
 
+@dojo_async_task
+@app.task
+def send_msteams_notifications(notifications, user=None, *args, **kwargs):
+    """Sends a batch of (event, kwargs) notifications as one MS Teams card with the sections of all cards"""
+    from dojo.utils import get_system_setting
+
+    try:
+        if user is None:
+            if get_system_setting('msteams_url') is not None:
+                cards = [json.loads(create_notification_message(event, None, 'msteams', **notification_kwargs))
+                         for event, notification_kwargs in notifications]
+                title = get_batch_title(notifications)
+                card = dict(cards[0], title=title, summary=title, sections=[], potentialAction=[])
+                for event_card in cards:
+                    card['sections'].append({'activityTitle': event_card.get('title')})
+                    card['sections'] += event_card.get('sections', [])
+                    card['potentialAction'] += event_card.get('potentialAction', [])
+                logger.debug('sending MSTeams message')
+                res = requests.request(method='POST', url=get_system_setting('msteams_url'), data=json.dumps(card))
+                if res.status_code != 200:
+                    logger.error("Error when sending message to Microsoft Teams")
+                    logger.error(res.status_code)
+                    logger.error(res.text)
+                    raise RuntimeError('Error posting message to Microsoft Teams: ' + res.text)
+            else:
+                logger.info('Webhook URL for Microsoft Teams not configured: skipping system notification')
+    except Exception as e:
+        logger.exception(e)
+        log_alert(e, "Microsoft Teams Notification", title=get_batch_title(notifications), description=str(e))
+
+
 @dojo_async_task
 @app.task
 def send_mail_notification(event, user=None, *args, **kwargs):
@@ -299,28 +500,76 @@ def send_mail_notification(event, user=None, *args, **kwargs):
         pass
 
 
+@dojo_async_task
+@app.task
+def send_mail_notifications(notifications, user=None, *args, **kwargs):
+    """Sends a batch of (event, kwargs) notifications as one email"""
+    from dojo.utils import get_system_setting
+
+    if user:
+        address = user.email
+    else:
+        address = get_system_setting('mail_notifications_to')
+
+    logger.debug('batched notification email for user %s to %s', user, address)
+
+    try:
+        subject = '%s notification: %s' % (get_system_setting('team_name'), get_batch_title(notifications))
+        email = EmailMessage(
+            subject,
+            '<hr/>'.join(create_notification_message(event, user, 'mail', **notification_kwargs)
+                         for event, notification_kwargs in notifications),
+            get_system_setting('email_from'),
+            [address],
+            headers={"From": "{}".format(get_system_setting('email_from'))}
+        )
+        email.content_subtype = 'html'
+        email.send(fail_silently=False)
+
+    except Exception as e:
+        logger.exception(e)
+        log_alert(e, "Email Notification", title=get_batch_title(notifications), description=str(e))
+
+
 def send_alert_notification(event, user=None, *args, **kwargs):
     logger.debug('sending alert notification to %s', user)
     try:
-        # no need to differentiate between user/no user
-        icon = kwargs.get('icon', 'info-circle')
-        alert = Alerts(
-            user_id=user,
-            title=kwargs.get('title')[:250],
-            description=create_notification_message(event, user, 'alert', *args, **kwargs)[:2000],
-            url=kwargs.get('url', reverse('alerts')),
-            icon=icon[:25],
-            source=Notifications._meta.get_field(event).verbose_name.title()[:100]
-        )
-        # relative urls will fail validation
-        alert.clean_fields(exclude=['url'])
-        alert.save()
+        create_alert(event, user, *args, **kwargs).save()
     except Exception as e:
         logger.exception(e)
         log_alert(e, "Alert Notification", title=kwargs['title'], description=str(e), url=kwargs['url'])
         pass
 
 
+def create_alert(event, user=None, *args, **kwargs):
+    # no need to differentiate between user/no user
+    icon = kwargs.get('icon', 'info-circle')
+    alert = Alerts(
+        user_id=user,
+        title=kwargs.get('title')[:250],
+        description=create_notification_message(event, user, 'alert', *args, **kwargs)[:2000],
+        url=kwargs.get('url', reverse('alerts')),
+        icon=icon[:25],
+        source=Notifications._meta.get_field(event).verbose_name.title()[:100]
+    )
+    # relative urls will fail validation
+    alert.clean_fields(exclude=['url'])
+    return alert
+
+
+def send_alert_notifications(notifications, user=None, *args, **kwargs):
+    """Creates the alerts of a batch of (event, kwargs) notifications with one insert"""
+    logger.debug('sending %i alert notifications to %s', len(notifications), user)
+    alerts = []
+    for event, notification_kwargs in notifications:
+        try:
+            alerts.append(create_alert(event, user, **notification_kwargs))
+        except Exception as e:
+            logger.exception(e)
+            log_alert(e, "Alert Notification", title=notification_kwargs['title'], description=str(e), url=notification_kwargs['url'])
+    Alerts.objects.bulk_create(alerts)
+
+
 def get_slack_user_id(user_email):
     from dojo.utils import get_system_setting
     import json
@@ -373,6 +622,15 @@ def log_alert(e, notification_type=None, *args, **kwargs):
         alert.save()
 
 
+# the senders of a single and of a batch of notifications per channel
+NOTIFICATION_SENDERS = {
+    'slack': (send_slack_notification, send_slack_notifications),
+    'msteams': (send_msteams_notification, send_msteams_notifications),
+    'mail': (send_mail_notification, send_mail_notifications),
+    'alert': (send_alert_notification, send_alert_notifications),
+}
+
+
 def notify_test_created(test):
     title = 'Test created for ' + str(test.engagement.product) + ': ' + str(test.engagement.name) + ': ' + str(test)
     create_notification(event='test_added', title=title, test=test, engagement=test.engagement, product=test.engagement.product,
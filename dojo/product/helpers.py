@@ -8,7 +8,7 @@ from dojo.decorators import dojo_async_task
 logger = get_task_logger(__name__)
 
 
-@dojo_async_task
+@dojo_async_task(coalesce_key=0)
 @app.task
 def propagate_tags_on_product(product_id, *args, **kwargs):
     with contextlib.suppress(Product.DoesNotExist):
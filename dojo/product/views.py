@@ -52,6 +52,7 @@ from dojo.product_type.queries import get_authorized_members_for_product_type, g
     get_authorized_product_types
 from dojo.tool_config.factory import create_API
 from dojo.tools.factory import get_api_scan_configuration_hints
+from dojo.metrics.helper import get_product_rollup_by_severity, use_metrics_rollup
 
 import dojo.finding.helper as finding_helper
 import dojo.jira_link.helper as jira_helper
@@ -632,6 +633,14 @@ def view_product_metrics(request, pid):
 
     open_objs_by_age = {x: len([_ for _ in filters.get('open') if _.age == x]) for x in set([_.age for _ in filters.get('open')])}
 
+    counted = ['verified', 'inactive', 'closed', 'false_positive', 'out_of_scope', 'new_verified', 'all']
+    if view == 'Finding' and use_metrics_rollup(request):
+        objs_by_severity = get_product_rollup_by_severity(prod, week_date, request)
+        objs_count = {key: sum(objs_by_severity[key].values()) for key in counted}
+    else:
+        objs_by_severity = {key: sum_by_severity_level(filters.get(key)) for key in counted}
+        objs_count = {key: len(filters.get(key)) for key in counted}
+
     return render(request, 'dojo/product_metrics.html', {
         'prod': prod,
         'product_tab': product_tab,
@@ -639,24 +648,31 @@ def view_product_metrics(request, pid):
         'inactive_engs': inactive_engs_page,
         'view': view,
         'verified_objs': filters.get('verified', None),
-        'verified_objs_by_severity': sum_by_severity_level(filters.get('verified')),
+        'verified_objs_by_severity': objs_by_severity['verified'],
+        'verified_objs_count': objs_count['verified'],
         'open_objs': filters.get('open', None),
         'open_objs_by_severity': open_objs_by_severity,
         'open_objs_by_age': open_objs_by_age,
         'inactive_objs': filters.get('inactive', None),
-        'inactive_objs_by_severity': sum_by_severity_level(filters.get('inactive')),
+        'inactive_objs_by_severity': objs_by_severity['inactive'],
+        'inactive_objs_count': objs_count['inactive'],
         'closed_objs': filters.get('closed', None),
-        'closed_objs_by_severity': sum_by_severity_level(filters.get('closed')),
+        'closed_objs_by_severity': objs_by_severity['closed'],
+        'closed_objs_count': objs_count['closed'],
         'false_positive_objs': filters.get('false_positive', None),
-        'false_positive_objs_by_severity': sum_by_severity_level(filters.get('false_positive')),
+        'false_positive_objs_by_severity': objs_by_severity['false_positive'],
+        'false_positive_objs_count': objs_count['false_positive'],
         'out_of_scope_objs': filters.get('out_of_scope', None),
-        'out_of_scope_objs_by_severity': sum_by_severity_level(filters.get('out_of_scope')),
+        'out_of_scope_objs_by_severity': objs_by_severity['out_of_scope'],
+        'out_of_scope_objs_count': objs_count['out_of_scope'],
         'accepted_objs': filters.get('accepted', None),
         'accepted_objs_by_severity': accepted_objs_by_severity,
         'new_objs': filters.get('new_verified', None),
-        'new_objs_by_severity': sum_by_severity_level(filters.get('new_verified')),
+        'new_objs_by_severity': objs_by_severity['new_verified'],
+        'new_objs_count': objs_count['new_verified'],
         'all_objs': filters.get('all', None),
-        'all_objs_by_severity': sum_by_severity_level(filters.get('all')),
+        'all_objs_by_severity': objs_by_severity['all'],
+        'all_objs_count': objs_count['all'],
         'form': filters.get('form', None),
         'reset_link': reverse('view_product_metrics', args=(prod.id,)) + '?type=' + view,
         'open_vulnerabilities': open_vulnerabilities,
@@ -941,8 +957,9 @@ def delete_product(request, pid):
                 product_type = product.prod_type
                 if get_setting("ASYNC_OBJECT_DELETE"):
                     async_del = async_delete()
-                    async_del.delete(product)
-                    message = _('Product and relationships will be removed in the background.')
+                    job = async_del.delete(product)
+                    message = _('Product and relationships will be removed in the background, see %(url)s for the progress.') \
+                        % {'url': reverse('async_delete_job_status', args=(job.id,))}
                 else:
                     message = _('Product and relationships removed.')
                     product.delete()
@@ -127,8 +127,9 @@ def delete_product_type(request, ptid):
             if form.is_valid():
                 if get_setting("ASYNC_OBJECT_DELETE"):
                     async_del = async_delete()
-                    async_del.delete(product_type)
-                    message = 'Product Type and relationships will be removed in the background.'
+                    job = async_del.delete(product_type)
+                    message = 'Product Type and relationships will be removed in the background, see %s for the progress.' \
+                        % reverse('async_delete_job_status', args=(job.id,))
                 else:
                     message = 'Product Type and relationships removed.'
                     product_type.delete()
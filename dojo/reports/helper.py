@@ -0,0 +1,196 @@
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+from crum import impersonate
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Count, Max
+from django.http import HttpRequest, HttpResponse, QueryDict
+from django.utils import timezone
+
+from dojo import __version__
+from dojo.authorization.roles_permissions import Permissions
+from dojo.celery import app
+from dojo.decorators import dojo_async_task
+from dojo.finding.queries import get_authorized_findings
+from dojo.models import Dojo_User, Endpoint, Engagement, Finding, Product, Product_Type, Test
+
+logger = logging.getLogger(__name__)
+
+# increment when a change of the report templates must invalidate the generated reports
+REPORT_TEMPLATE_VERSION = 1
+REPORT_ARTIFACT_DIR = 'reports'
+# a job that didn't finish in this time is considered lost and is queued again
+REPORT_JOB_TIMEOUT = 3600
+# the request headers used by report_url_resolver to build the links in the report
+REPORT_REQUEST_META = ('HTTP_X_FORWARDED_PROTO', 'HTTP_X_FORWARDED_FOR', 'HTTP_HOST', 'SERVER_NAME', 'SERVER_PORT',
+                       'wsgi.url_scheme')
+REPORT_OBJECT_TYPES = {
+    'Product_Type': Product_Type,
+    'Product': Product,
+    'Engagement': Engagement,
+    'Test': Test,
+    'Endpoint': Endpoint,
+}
+
+
+class ReportRequest(HttpRequest):
+    """The request of the user, rebuilt in the celery worker to render the report exactly like the view does"""
+
+    def __init__(self, user, path, query_string, meta):
+        super().__init__()
+        self.method = 'GET'
+        self.path = self.path_info = path
+        self.GET = QueryDict(query_string)
+        self.META = dict(meta)
+        self.user = user
+        self.session = {}
+
+    def _get_scheme(self):
+        return self.META.get('wsgi.url_scheme', 'http')
+
+
+def get_report_kind(obj):
+    if type(obj).__name__ in ["QuerySet", "CastTaggedQuerySet", "TagulousCastTaggedQuerySet"]:
+        return 'Finding'
+    return type(obj).__name__
+
+
+def get_report_object(kind, obj_id):
+    if kind == 'Finding':
+        # the findings report contains all findings the user is authorized for
+        return get_authorized_findings(Permissions.Finding_View)
+    return REPORT_OBJECT_TYPES[kind].objects.get(id=obj_id)
+
+
+def get_report_findings(obj, host_view=False):
+    """The findings a report is generated from, before the filters of the report options are applied"""
+    kind = get_report_kind(obj)
+    if kind == 'Product_Type':
+        return Finding.objects.filter(test__engagement__product__prod_type=obj)
+    elif kind == 'Product':
+        return Finding.objects.filter(test__engagement__product=obj)
+    elif kind == 'Engagement':
+        return Finding.objects.filter(test__engagement=obj)
+    elif kind == 'Test':
+        return Finding.objects.filter(test=obj)
+    elif kind == 'Endpoint':
+        if host_view:
+            return Finding.objects.filter(endpoints__host=obj.host, endpoints__product=obj.product)
+        return Finding.objects.filter(endpoints=obj)
+    return obj
+
+
+def get_report_fingerprint(request, obj, host_view=False, host=''):
+    """
+    The id of the report job: a hash of everything the rendered report depends on. Adding, deleting or changing the
+    status of one of its findings changes the fingerprint, so a new report is generated.
+    """
+    kind = get_report_kind(obj)
+    findings = get_report_findings(obj, host_view).order_by().aggregate(
+        count=Count('id', distinct=True), last_id=Max('id'), last_status_update=Max('last_status_update'))
+    inputs = {
+        'kind': kind,
+        'id': None if kind == 'Finding' else obj.id,
+        'host_view': host_view,
+        'user_id': request.user.id,
+        'params': sorted((key, sorted(values)) for key, values in request.GET.lists()),
+        'host': host,
+        'findings': findings,
+        'template_version': REPORT_TEMPLATE_VERSION,
+        'version': __version__,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def get_report_artifact_path(user_id, job_id, suffix='html'):
+    return f'{REPORT_ARTIFACT_DIR}/{user_id}/{job_id}.{suffix}'
+
+
+def is_fresh(path, max_age):
+    return default_storage.exists(path) and \
+        timezone.now() - default_storage.get_modified_time(path) < timedelta(seconds=max_age)
+
+
+def get_report_job_status(user_id, job_id):
+    """Return done, failed or pending, or None if there is no (unexpired) job for this id"""
+    if is_fresh(get_report_artifact_path(user_id, job_id), settings.REPORT_ARTIFACT_TTL):
+        return 'done'
+    if default_storage.exists(get_report_artifact_path(user_id, job_id, 'error')):
+        return 'failed'
+    if is_fresh(get_report_artifact_path(user_id, job_id, 'pending'), REPORT_JOB_TIMEOUT):
+        return 'pending'
+    return None
+
+
+def get_report_job_error(user_id, job_id):
+    path = get_report_artifact_path(user_id, job_id, 'error')
+    if not default_storage.exists(path):
+        return None
+    with default_storage.open(path) as error_file:
+        return error_file.read().decode('utf-8')
+
+
+def save_report_artifact(user_id, job_id, suffix, content):
+    path = get_report_artifact_path(user_id, job_id, suffix)
+    # storages don't overwrite, they rename the new file instead
+    default_storage.delete(path)
+    default_storage.save(path, ContentFile(content.encode('utf-8') if isinstance(content, str) else content))
+
+
+def delete_report_artifacts(user_id, job_id, suffixes):
+    for suffix in suffixes:
+        default_storage.delete(get_report_artifact_path(user_id, job_id, suffix))
+
+
+def delete_expired_report_artifacts(user_id):
+    directory = f'{REPORT_ARTIFACT_DIR}/{user_id}'
+    _, file_names = default_storage.listdir(directory)
+    for file_name in file_names:
+        path = f'{directory}/{file_name}'
+        if not is_fresh(path, max(settings.REPORT_ARTIFACT_TTL, REPORT_JOB_TIMEOUT)):
+            default_storage.delete(path)
+
+
+def get_report_artifact_response(user_id, job_id):
+    with default_storage.open(get_report_artifact_path(user_id, job_id)) as artifact:
+        return HttpResponse(artifact.read(), content_type='text/html; charset=utf-8')
+
+
+def queue_report_job(request, obj, host_view, job_id):
+    """Queue the generation of the report unless it is already queued, returns the status of the job afterwards"""
+    user_id = request.user.id
+    status = get_report_job_status(user_id, job_id)
+    if status in [None, 'failed']:
+        delete_report_artifacts(user_id, job_id, ['error'])
+        save_report_artifact(user_id, job_id, 'pending', '')
+        kind = get_report_kind(obj)
+        meta = {key: request.META[key] for key in REPORT_REQUEST_META if key in request.META}
+        generate_report_artifact(user_id, kind, None if kind == 'Finding' else obj.id, host_view,
+                                 request.path, request.GET.urlencode(), meta, job_id)
+        # block_execution users got their report generated in the foreground
+        status = get_report_job_status(user_id, job_id)
+    return status
+
+
+@dojo_async_task
+@app.task
+def generate_report_artifact(user_id, kind, obj_id, host_view, path, query_string, meta, job_id, *args, **kwargs):
+    from dojo.reports.views import generate_report
+
+    logger.debug('generating %s report %s for user %i', kind, job_id, user_id)
+    try:
+        user = Dojo_User.objects.get(id=user_id)
+        with impersonate(user):
+            request = ReportRequest(user, path, query_string, meta)
+            response = generate_report(request, get_report_object(kind, obj_id), host_view, use_artifacts=False)
+        save_report_artifact(user_id, job_id, 'html', response.content)
+    except Exception as e:
+        logger.exception('error generating %s report %s', kind, job_id)
+        save_report_artifact(user_id, job_id, 'error', str(e))
+    finally:
+        delete_report_artifacts(user_id, job_id, ['pending'])
+    delete_expired_report_artifacts(user_id)
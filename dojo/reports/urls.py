@@ -20,6 +20,10 @@ urlpatterns = [
         name='endpoint_host_report'),
     re_path(r'^product/report$',
         views.product_findings_report, name='product_findings_report'),
+    re_path(r'^reports/job/(?P<job_id>[0-9a-f]{64})$',
+        views.report_job_status, name='report_job_status'),
+    re_path(r'^reports/job/(?P<job_id>[0-9a-f]{64})/report$',
+        views.report_artifact, name='report_artifact'),
     re_path(r'^reports/cover$',
         views.report_cover_page, name='report_cover_page'),
     re_path(r'^reports/builder$',
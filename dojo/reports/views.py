@@ -2,6 +2,7 @@ import logging
 import re
 import csv
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font
 from tempfile import NamedTemporaryFile
 
@@ -10,9 +11,12 @@ from datetime import datetime
 
 from dateutil.relativedelta import relativedelta
 from django.conf import settings
-from django.http import Http404, HttpResponse, QueryDict
+from django.db.models import prefetch_related_objects
+from django.http import FileResponse, Http404, JsonResponse, QueryDict, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django.core.exceptions import PermissionDenied
 
 from dojo.filters import ReportFindingFilter, EndpointReportFilter, \
@@ -20,6 +24,8 @@ from dojo.filters import ReportFindingFilter, EndpointReportFilter, \
 from dojo.forms import ReportOptionsForm
 from dojo.models import Product_Type, Finding, Product, Engagement, Test, \
     Dojo_User, Endpoint, Risk_Acceptance
+from dojo.reports.helper import get_report_artifact_response, get_report_fingerprint, get_report_job_error, \
+    get_report_job_status, queue_report_job
 from dojo.reports.widgets import CoverPage, PageBreak, TableOfContents, WYSIWYGContent, FindingList, EndpointList, \
     CustomReportJsonForm, ReportOptions, report_widget_factory
 from dojo.utils import get_page_items, add_breadcrumb, get_system_setting, get_period_counts_legacy, Product_Tab, \
@@ -346,7 +352,7 @@ def product_endpoint_report(request, pid):
                    })
 
 
-def generate_report(request, obj, host_view=False):
+def generate_report(request, obj, host_view=False, use_artifacts=True):
     user = Dojo_User.objects.get(id=request.user.id)
     product_type = None
     product = None
@@ -392,6 +398,8 @@ def generate_report(request, obj, host_view=False):
     if include_disclaimer and len(disclaimer) == 0:
         disclaimer = 'Please configure in System Settings.'
     generate = "_generate" in request.GET
+    if generate and use_artifacts and settings.ASYNC_REPORT_GENERATION and report_format in ['AsciiDoc', 'HTML']:
+        return generate_report_job(request, obj, host_view)
     report_name = str(obj)
     report_type = type(obj).__name__
     add_breadcrumb(title="Generate Report", top_level=False, request=request)
@@ -676,6 +684,40 @@ def generate_report(request, obj, host_view=False):
                    })
 
 
+def generate_report_job(request, obj, host_view=False):
+    """Serve the report from its artifact or queue a job to generate it in the background"""
+    job_id = get_report_fingerprint(request, obj, host_view, report_url_resolver(request))
+    status = queue_report_job(request, obj, host_view, job_id)
+    if status == 'done':
+        return get_report_artifact_response(request.user.id, job_id)
+    add_breadcrumb(title="Generate Report", top_level=False, request=request)
+    return render(request, 'dojo/report_job.html',
+                  {'job_id': job_id,
+                   'status': status,
+                   'error': get_report_job_error(request.user.id, job_id),
+                   'status_url': reverse('report_job_status', args=(job_id, ))},
+                  status=202)
+
+
+def report_job_status(request, job_id):
+    status = get_report_job_status(request.user.id, job_id)
+    if status is None:
+        raise Http404()
+    response = {'job_id': job_id, 'status': status}
+    if status == 'done':
+        response['url'] = reverse('report_artifact', args=(job_id, ))
+    elif status == 'failed':
+        response['error'] = get_report_job_error(request.user.id, job_id)
+    return JsonResponse(response)
+
+
+def report_artifact(request, job_id):
+    # the artifacts are stored per user, so users can only access the reports they generated themselves
+    if get_report_job_status(request.user.id, job_id) != 'done':
+        raise Http404()
+    return get_report_artifact_response(request.user.id, job_id)
+
+
 def prefetch_related_findings_for_report(findings):
     return findings.prefetch_related('test',
                                      'test__engagement__product',
@@ -830,21 +872,94 @@ def get_foreign_keys():
         'mitigated_by', 'reporter', 'review_requested_by', 'sonarqube_issue', 'test']
 
 
-def csv_export(request):
-    findings, obj = get_findings(request)
+# number of findings loaded per query by the csv and excel exports
+EXPORT_CHUNK_SIZE = 1000
 
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename=findings.csv'
 
-    writer = csv.writer(response)
+def get_export_columns(finding):
+    """
+    Returns the attribute columns of the findings export with a function returning their value. The columns are
+    determined once on the first finding, the values are read from the fields loaded from the database, from the
+    selected related objects and from the cached properties computed from the data prefetched per chunk.
+    """
+    columns = []
+    for key in dir(finding):
+        if key not in get_excludes() and not callable(getattr(finding, key)) and not key.startswith('_'):
+            columns.append((key, get_export_value_function(key)))
+    return columns
+
 
-    first_row = True
+def get_export_value_function(key):
+    if key in get_foreign_keys():
+        def get_value(finding):
+            related = getattr(finding, key)
+            return str(related) if related else None
+    elif isinstance(getattr(Finding, key, None), cached_property):
+        def get_value(finding):
+            return getattr(finding, key)
+    else:
+        def get_value(finding):
+            return finding.__dict__.get(key)
+    return get_value
+
+
+def iter_findings_for_export(findings, chunk_size=None):
+    """
+    Iterates over the findings chunk by chunk so the memory doesn't grow with the number of exported findings.
+    The related objects are selected with the findings, the endpoints, vulnerability ids and finding groups
+    are fetched with one query per chunk.
+    """
+    chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+    findings = findings.select_related('test__test_type', 'test__engagement__product', 'reporter', 'mitigated_by',
+                                       'last_reviewed_by', 'review_requested_by', 'defect_review_requested_by',
+                                       'duplicate_finding', 'sonarqube_issue').prefetch_related(None)
+    chunk = []
+    for finding in findings.iterator(chunk_size=chunk_size):
+        chunk.append(finding)
+        if len(chunk) >= chunk_size:
+            yield from prefetch_findings_chunk_for_export(chunk)
+            chunk = []
+    yield from prefetch_findings_chunk_for_export(chunk)
+
+
+def prefetch_findings_chunk_for_export(findings):
+    prefetch_related_objects(findings, 'endpoints', 'vulnerability_id_set', 'finding_group_set__jira_issue')
     for finding in findings:
-        if first_row:
-            fields = []
-            for key in dir(finding):
-                if key not in get_excludes() and not callable(getattr(finding, key)) and not key.startswith('_'):
-                    fields.append(key)
+        # same as the finding_group property, without a query per finding
+        finding_groups = sorted(finding.finding_group_set.all(), key=lambda finding_group: finding_group.id)
+        finding.finding_group = finding_groups[0] if finding_groups else None
+    return findings
+
+
+def join_export_values(values, separator, cve=None):
+    value = ''
+    num_values = 0
+    for item in values:
+        num_values += 1
+        if num_values > 5:
+            value += '...'
+            break
+        value += f'{str(item)}{separator}'
+    if cve and value.find(cve) < 0:
+        value += cve
+    if value.endswith(separator):
+        value = value[:-len(separator)]
+    return value
+
+
+class Echo:
+    """A file like object that returns what is written, to stream the rows of a csv writer"""
+    def write(self, value):
+        return value
+
+
+def iter_csv_export(findings):
+    writer = csv.writer(Echo())
+    columns = None
+    for finding in iter_findings_for_export(findings):
+        if columns is None:
+            columns = get_export_columns(finding)
+            fields = [key for key, get_value in columns]
             fields.append('test')
             fields.append('found_by')
             fields.append('engagement_id')
@@ -854,156 +969,79 @@ def csv_export(request):
             fields.append('endpoints')
             fields.append('vulnerability_ids')
 
-            writer.writerow(fields)
-
-            first_row = False
-        if not first_row:
-            fields = []
-            for key in dir(finding):
-                if key not in get_excludes() and not callable(getattr(finding, key)) and not key.startswith('_'):
-                    value = finding.__dict__.get(key)
-                    if key in get_foreign_keys() and getattr(finding, key):
-                        value = str(getattr(finding, key))
-                    if value and isinstance(value, str):
-                        value = value.replace('\n', ' NEWLINE ').replace('\r', '')
-                    fields.append(value)
-            fields.append(finding.test.title)
-            fields.append(finding.test.test_type.name)
-            fields.append(finding.test.engagement.id)
-            fields.append(finding.test.engagement.name)
-            fields.append(finding.test.engagement.product.id)
-            fields.append(finding.test.engagement.product.name)
-
-            endpoint_value = ''
-            num_endpoints = 0
-            for endpoint in finding.endpoints.all():
-                num_endpoints += 1
-                if num_endpoints > 5:
-                    endpoint_value += '...'
-                    break
-                endpoint_value += f'{str(endpoint)}; '
-            if endpoint_value.endswith('; '):
-                endpoint_value = endpoint_value[:-2]
-            fields.append(endpoint_value)
-
-            vulnerability_ids_value = ''
-            num_vulnerability_ids = 0
-            for vulnerability_id in finding.vulnerability_ids:
-                num_vulnerability_ids += 1
-                if num_vulnerability_ids > 5:
-                    vulnerability_ids_value += '...'
-                    break
-                vulnerability_ids_value += f'{str(vulnerability_id)}; '
-            if finding.cve and vulnerability_ids_value.find(finding.cve) < 0:
-                vulnerability_ids_value += finding.cve
-            if vulnerability_ids_value.endswith('; '):
-                vulnerability_ids_value = vulnerability_ids_value[:-2]
-            fields.append(vulnerability_ids_value)
-
-            writer.writerow(fields)
+            yield writer.writerow(fields)
+
+        fields = []
+        for key, get_value in columns:
+            value = get_value(finding)
+            if value and isinstance(value, str):
+                value = value.replace('\n', ' NEWLINE ').replace('\r', '')
+            fields.append(value)
+        fields.append(finding.test.title)
+        fields.append(finding.test.test_type.name)
+        fields.append(finding.test.engagement.id)
+        fields.append(finding.test.engagement.name)
+        fields.append(finding.test.engagement.product.id)
+        fields.append(finding.test.engagement.product.name)
+        fields.append(join_export_values(finding.endpoints.all(), '; '))
+        fields.append(join_export_values(finding.vulnerability_ids, '; ', cve=finding.cve))
+
+        yield writer.writerow(fields)
+
 
+def csv_export(request):
+    findings, obj = get_findings(request)
+
+    response = StreamingHttpResponse(iter_csv_export(findings), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename=findings.csv'
     return response
 
 
 def excel_export(request):
     findings, obj = get_findings(request)
 
-    workbook = Workbook()
+    # in write-only mode the rows are written to a temporary file instead of being kept in memory
+    workbook = Workbook(write_only=True)
     workbook.iso_dates = True
-    worksheet = workbook.active
-    worksheet.title = 'Findings'
+    worksheet = workbook.create_sheet('Findings')
 
     font_bold = Font(bold=True)
 
-    row_num = 1
-    for finding in findings:
-        if row_num == 1:
-            col_num = 1
-            for key in dir(finding):
-                if key not in get_excludes() and not callable(getattr(finding, key)) and not key.startswith('_'):
-                    cell = worksheet.cell(row=row_num, column=col_num, value=key)
-                    cell.font = font_bold
-                    col_num += 1
-            cell = worksheet.cell(row=row_num, column=col_num, value='found_by')
-            cell.font = font_bold
-            col_num += 1
-            worksheet.cell(row=row_num, column=col_num, value='engagement_id')
-            cell = cell.font = font_bold
-            col_num += 1
-            cell = worksheet.cell(row=row_num, column=col_num, value='engagement')
-            cell.font = font_bold
-            col_num += 1
-            cell = worksheet.cell(row=row_num, column=col_num, value='product_id')
-            cell.font = font_bold
-            col_num += 1
-            cell = worksheet.cell(row=row_num, column=col_num, value='product')
-            cell.font = font_bold
-            col_num += 1
-            cell = worksheet.cell(row=row_num, column=col_num, value='endpoints')
-            cell.font = font_bold
-            col_num += 1
-            cell = worksheet.cell(row=row_num, column=col_num, value='vulnerability_ids')
-            cell.font = font_bold
-
-            row_num = 2
-        if row_num > 1:
-            col_num = 1
-            for key in dir(finding):
-                if key not in get_excludes() and not callable(getattr(finding, key)) and not key.startswith('_'):
-                    value = finding.__dict__.get(key)
-                    if key in get_foreign_keys() and getattr(finding, key):
-                        value = str(getattr(finding, key))
-                    if value and isinstance(value, datetime):
-                        value = value.replace(tzinfo=None)
-                    worksheet.cell(row=row_num, column=col_num, value=value)
-                    col_num += 1
-            worksheet.cell(row=row_num, column=col_num, value=finding.test.test_type.name)
-            col_num += 1
-            worksheet.cell(row=row_num, column=col_num, value=finding.test.engagement.id)
-            col_num += 1
-            worksheet.cell(row=row_num, column=col_num, value=finding.test.engagement.name)
-            col_num += 1
-            worksheet.cell(row=row_num, column=col_num, value=finding.test.engagement.product.id)
-            col_num += 1
-            worksheet.cell(row=row_num, column=col_num, value=finding.test.engagement.product.name)
-            col_num += 1
-
-            endpoint_value = ''
-            num_endpoints = 0
-            for endpoint in finding.endpoints.all():
-                num_endpoints += 1
-                if num_endpoints > 5:
-                    endpoint_value += '...'
-                    break
-                endpoint_value += f'{str(endpoint)}; \n'
-            if endpoint_value.endswith('; \n'):
-                endpoint_value = endpoint_value[:-3]
-            worksheet.cell(row=row_num, column=col_num, value=endpoint_value)
-            col_num += 1
-
-            vulnerability_ids_value = ''
-            num_vulnerability_ids = 0
-            for vulnerability_id in finding.vulnerability_ids:
-                num_vulnerability_ids += 1
-                if num_vulnerability_ids > 5:
-                    vulnerability_ids_value += '...'
-                    break
-                vulnerability_ids_value += f'{str(vulnerability_id)}; \n'
-            if finding.cve and vulnerability_ids_value.find(finding.cve) < 0:
-                vulnerability_ids_value += finding.cve
-            if vulnerability_ids_value.endswith('; \n'):
-                vulnerability_ids_value = vulnerability_ids_value[:-3]
-            worksheet.cell(row=row_num, column=col_num, value=vulnerability_ids_value)
-
-        row_num += 1
-
-    with NamedTemporaryFile() as tmp:
-        workbook.save(tmp.name)
-        tmp.seek(0)
-        stream = tmp.read()
-
-    response = HttpResponse(
-        content=stream,
+    columns = None
+    for finding in iter_findings_for_export(findings):
+        if columns is None:
+            columns = get_export_columns(finding)
+            header = [key for key, get_value in columns]
+            header += ['found_by', 'engagement_id', 'engagement', 'product_id', 'product', 'endpoints', 'vulnerability_ids']
+            cells = []
+            for value in header:
+                cell = WriteOnlyCell(worksheet, value=value)
+                cell.font = font_bold
+                cells.append(cell)
+            worksheet.append(cells)
+
+        row = []
+        for key, get_value in columns:
+            value = get_value(finding)
+            if value and isinstance(value, datetime):
+                value = value.replace(tzinfo=None)
+            row.append(value)
+        row.append(finding.test.test_type.name)
+        row.append(finding.test.engagement.id)
+        row.append(finding.test.engagement.name)
+        row.append(finding.test.engagement.product.id)
+        row.append(finding.test.engagement.product.name)
+        row.append(join_export_values(finding.endpoints.all(), '; \n'))
+        row.append(join_export_values(finding.vulnerability_ids, '; \n', cve=finding.cve))
+        worksheet.append(row)
+
+    # the temporary file is deleted when the response is closed
+    tmp = NamedTemporaryFile()
+    workbook.save(tmp.name)
+    tmp.seek(0)
+
+    response = FileResponse(
+        tmp,
         content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     )
     response['Content-Disposition'] = 'attachment; filename=findings.xlsx'
@@ -259,7 +259,9 @@ def prefetch_for_expiration(risk_acceptances):
                                              )
 
 
-def simple_risk_accept(finding, perform_save=True):
+# bulk edits save the findings themselves and post the comments in the background with post_comments=False,
+# and also remove the findings from the risk acceptances at once with remove_from_risk_acceptances=False
+def simple_risk_accept(finding, perform_save=True, post_comments=True):
     if not finding.test.engagement.product.enable_simple_risk_acceptance:
         raise PermissionDenied()
 
@@ -271,17 +273,17 @@ def simple_risk_accept(finding, perform_save=True):
         finding.save(dedupe_option=False)
     # post_jira_comment might reload from database so see unaccepted finding. but the comment
     # only contains some text so that's ok
-    post_jira_comment(finding, accepted_message_creator)
+    if post_comments:
+        post_jira_comment(finding, accepted_message_creator)
 
 
-def risk_unaccept(finding, perform_save=True):
+def risk_unaccept(finding, perform_save=True, post_comments=True, remove_from_risk_acceptances=True):
     logger.debug('unaccepting finding %i:%s if it is currently risk accepted', finding.id, finding)
     if finding.risk_accepted:
         logger.debug('unaccepting finding %i:%s', finding.id, finding)
-        # keep reference to ra to for posting comments later
-        risk_acceptance = finding.risk_acceptance
         # removing from ManyToMany will not fail for non-existing entries
-        remove_from_any_risk_acceptance(finding)
+        if remove_from_risk_acceptances:
+            remove_from_any_risk_acceptance(finding)
         if not finding.mitigated and not finding.false_p and not finding.out_of_scope:
             finding.active = True
         finding.risk_accepted = False
@@ -291,9 +293,15 @@ def risk_unaccept(finding, perform_save=True):
 
         # post_jira_comment might reload from database so see unaccepted finding. but the comment
         # only contains some text so that's ok
-        post_jira_comment(finding, unaccepted_message_creator)
+        if post_comments:
+            post_jira_comment(finding, unaccepted_message_creator)
 
 
 def remove_from_any_risk_acceptance(finding):
     for r in finding.risk_acceptance_set.all():
         r.accepted_findings.remove(finding)
+
+
+def remove_findings_from_any_risk_acceptance(finding_ids):
+    # same as remove_from_any_risk_acceptance, with one query for all findings
+    Risk_Acceptance.accepted_findings.through.objects.filter(finding_id__in=finding_ids).delete()
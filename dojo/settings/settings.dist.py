@@ -71,6 +71,12 @@ env = environ.Env(
     DD_CELERY_BEAT_SCHEDULE_FILENAME=(str, root('dojo.celery.beat.db')),
     DD_CELERY_TASK_SERIALIZER=(str, 'pickle'),
     DD_CELERY_PASS_MODEL_BY_ID=(str, True),
+    # The classes of tasks which are sent to their own queue instead of the default "celery" queue, any of "import",
+    # "dedupe", "integration", "notification" and "maintenance". The queue has the name of the class.
+    DD_CELERY_ROUTED_TASK_CLASSES=(list, []),
+    # When enabled, the calls of the coalescing celery tasks (product grading, jira issue updates, ...) within a transaction,
+    # an import or a bulk edit are buffered and merged per product, finding or finding group into one task per object
+    DD_ASYNC_TASK_COALESCING=(bool, False),
     DD_FOOTER_VERSION=(str, ''),
     # models should be passed to celery by ID, default is False (for now)
     DD_FORCE_LOWERCASE_TAGS=(bool, True),
@@ -245,14 +251,69 @@ env = environ.Env(
     DD_ASYNC_FINDING_IMPORT=(bool, False),
     # The number of findings to be processed per celeryworker
     DD_ASYNC_FINDING_IMPORT_CHUNK_SIZE=(int, 100),
+    # When enabled, new findings of an import are inserted with bulk_create() in batches instead of being saved one by one.
+    # Dependent rows (vulnerability ids, request/response pairs, tags) are also bulk inserted and the post processing
+    # (deduplication, product grading, ...) runs once per batch. Only used on databases that return ids of bulk inserted rows.
+    DD_IMPORT_BULK_CREATE=(bool, False),
+    # The number of findings inserted per batch when DD_IMPORT_BULK_CREATE is enabled
+    DD_IMPORT_BULK_CREATE_BATCH_SIZE=(int, 1000),
+    # The number of findings processed per batch when importing a report with a parser that parses it incrementally
+    DD_IMPORT_STREAMING_BATCH_SIZE=(int, 1000),
     # When enabled, deleting objects will be occur from the bottom up. In the example of deleting an engagement
     # The objects will be deleted as follows Endpoints -> Findings -> Tests -> Engagement
     DD_ASYNC_OBJECT_DELETE=(bool, False),
     # The number of objects to be deleted per celeryworker
     DD_ASYNC_OBEJECT_DELETE_CHUNK_SIZE=(int, 100),
+    # Number of minutes after which a deletion that made no progress is resumed, i.e. after a restart of the celery worker
+    DD_ASYNC_OBJECT_DELETE_RESUME_MINUTES=(int, 10),
     # When enabled, display the preview of objects to be deleted. This can take a long time to render
     # for very large objects
     DD_DELETE_PREVIEW=(bool, True),
+    # URL of the django cache, like redis://redis:6379/1. The default local memory cache is per process: a change to
+    # the cached system settings, parsers, SLA configurations or notification recipients then only reaches the other
+    # web and celery processes after the cache TTLs below, and the debouncing of the product grading and the metrics
+    # rollup is per process. Configure a cache that all processes share to invalidate and debounce across them.
+    DD_CACHE_URL=(str, 'locmemcache://'),
+    # Number of seconds the system settings are cached per process (web, celery, commands). Saving the system settings
+    # invalidates the cached copies through a version counter in the django cache. Set to 0 to disable the cache.
+    DD_SYSTEM_SETTINGS_CACHE_TTL=(int, 30),
+    # Number of seconds the active flags of the Test_Types (the active parsers) are cached per process. Saving a Test_Type
+    # invalidates the cached flags through a version counter in the django cache. Set to 0 to disable the cache.
+    DD_PARSER_ACTIVATION_CACHE_TTL=(int, 60),
+    # Number of seconds the SLA configurations are cached per process, to compute the SLA of findings without a query per
+    # finding. Saving an SLA configuration invalidates the cached copies. Set to 0 to disable the cache.
+    DD_SLA_CONFIGURATION_CACHE_TTL=(int, 60),
+    # Maximum number of characters of rendered markdown (descriptions, mitigations, notes, ...) kept per process. The
+    # renderings are keyed by the hash of the text, so they never have to be invalidated. Set to 0 to disable it.
+    DD_MARKDOWN_RENDER_CACHE_SIZE=(int, 20000000),
+    # Number of seconds rendered markdown is kept in the django cache, which is shared by the processes when a shared
+    # cache backend is configured. Set to 0 to not use the django cache.
+    DD_MARKDOWN_RENDER_CACHE_TTL=(int, 86400),
+    # When enabled, the markdown of new findings is rendered into the django cache by a celery task after an import. Only
+    # useful with a cache backend that is shared by the web and celery processes.
+    DD_MARKDOWN_RENDER_CACHE_WARM=(bool, False),
+    # Number of seconds a product grade recalculation is deferred after a finding changed. All changes to the findings of
+    # a product in this window are handled by one background task. Set to 0 to recalculate the grade on every change.
+    DD_PRODUCT_GRADE_DEBOUNCE_SECONDS=(int, 10),
+    # When enabled, the HTML and AsciiDoc reports are generated by a celery task and stored in the media storage. The
+    # stored report is served again as long as its findings, the report options and the templates are unchanged.
+    DD_ASYNC_REPORT_GENERATION=(bool, True),
+    # Number of seconds a generated report is served again before it is regenerated
+    DD_REPORT_ARTIFACT_TTL=(int, 86400),
+    # When enabled, the number of findings per product, date and severity is maintained in a rollup table that the
+    # metrics pages read when no filters are applied. Run "./manage.py metrics_rollup" once before enabling it.
+    DD_METRICS_ROLLUP_ENABLED=(bool, False),
+    # Number of seconds the update of the rollup of a product is deferred after a finding changed. All changes to the
+    # findings of a product in this window are handled by one background task. Set to 0 to update on every change,
+    # imports and bulk operations still update the rollup once per product at their end.
+    DD_METRICS_ROLLUP_DEBOUNCE_SECONDS=(int, 10),
+    # Number of seconds the recipients of a notification event are cached per process and product. Changes to users,
+    # memberships and notification settings invalidate the cached recipients. Only used when DD_CACHE_URL is a cache
+    # shared by the processes, as the invalidation has to reach all of them. Set to 0 to disable the cache.
+    DD_NOTIFICATION_RECIPIENT_CACHE_TTL=(int, 60),
+    # The maximum number of notifications that are sent as one Slack message, MS Teams card or email when the
+    # notifications of a bulk operation (like the SLA notifications) are batched per channel and user
+    DD_NOTIFICATION_BATCH_SIZE=(int, 50),
     # List of acceptable file types that can be uploaded to a given object via arbitrary file upload
     DD_FILE_UPLOAD_TYPES=(list, ['.txt', '.pdf', '.json', '.xml', '.csv', '.yml', '.png', '.jpeg',
                                  '.sarif', '.xslx', '.doc', '.html', '.js', '.nessus', '.zip']),
@@ -380,6 +441,15 @@ if env('DD_TRACK_MIGRATIONS'):
 # see https://docs.djangoproject.com/en/3.2/releases/3.2/#customizing-type-of-auto-created-primary-keys
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
+# ------------------------------------------------------------------------------
+# CACHE
+# ------------------------------------------------------------------------------
+
+# Parse cache connection url strings like redis://redis:6379/1, the default is a local memory cache per process
+CACHES = {
+    'default': env.cache('DD_CACHE_URL')
+}
+
 # ------------------------------------------------------------------------------
 # MEDIA
 # ------------------------------------------------------------------------------
@@ -1099,11 +1169,16 @@ CELERY_BEAT_SCHEDULE_FILENAME = env('DD_CELERY_BEAT_SCHEDULE_FILENAME')
 CELERY_ACCEPT_CONTENT = ['pickle', 'json', 'msgpack', 'yaml']
 CELERY_TASK_SERIALIZER = env('DD_CELERY_TASK_SERIALIZER')
 CELERY_PASS_MODEL_BY_ID = env('DD_CELERY_PASS_MODEL_BY_ID')
+# The classes of tasks which are sent to the queue with the name of the class, see dojo.celery.TASK_ROUTING_CLASSES
+CELERY_ROUTED_TASK_CLASSES = env('DD_CELERY_ROUTED_TASK_CLASSES')
+CELERY_TASK_ROUTES = ('dojo.celery.route_task', )
+# Merge the calls of the coalescing tasks within a transaction, an import or a bulk edit into one task per object
+ASYNC_TASK_COALESCING = env('DD_ASYNC_TASK_COALESCING')
 
 if len(env('DD_CELERY_BROKER_TRANSPORT_OPTIONS')) > 0:
     CELERY_BROKER_TRANSPORT_OPTIONS = json.loads(env('DD_CELERY_BROKER_TRANSPORT_OPTIONS'))
 
-CELERY_IMPORTS = ('dojo.tools.tool_issue_updater', )
+CELERY_IMPORTS = ('dojo.tools.tool_issue_updater', 'dojo.reports.helper', )
 
 # Celery beat scheduled tasks
 CELERY_BEAT_SCHEDULE = {
@@ -1133,6 +1208,14 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'dojo.risk_acceptance.helper.expiration_handler',
         'schedule': crontab(minute=0, hour='*/3'),  # every 3 hours
     },
+    'resume-async-delete-jobs': {
+        'task': 'dojo.tasks.resume_async_delete_jobs',
+        'schedule': timedelta(minutes=5),
+    },
+    'reconcile-metrics-rollup': {
+        'task': 'dojo.metrics.helper.reconcile_metrics_rollup',
+        'schedule': crontab(hour=2, minute=0),
+    },
     # 'jira_status_reconciliation': {
     #     'task': 'dojo.tasks.jira_status_reconciliation_task',
     #     'schedule': timedelta(hours=12),
@@ -1652,14 +1735,48 @@ SONARQUBE_API_PARSER_HOTSPOTS = env("DD_SONARQUBE_API_PARSER_HOTSPOTS")
 ASYNC_FINDING_IMPORT = env("DD_ASYNC_FINDING_IMPORT")
 # The number of findings to be processed per celeryworker
 ASYNC_FINDING_IMPORT_CHUNK_SIZE = env("DD_ASYNC_FINDING_IMPORT_CHUNK_SIZE")
+# When enabled, new findings of an import are inserted in batches using bulk_create()
+IMPORT_BULK_CREATE = env("DD_IMPORT_BULK_CREATE")
+# The number of findings inserted per batch when IMPORT_BULK_CREATE is enabled
+IMPORT_BULK_CREATE_BATCH_SIZE = env("DD_IMPORT_BULK_CREATE_BATCH_SIZE")
+# The number of findings processed per batch when importing a report with a parser that parses it incrementally
+IMPORT_STREAMING_BATCH_SIZE = env("DD_IMPORT_STREAMING_BATCH_SIZE")
 # When enabled, deleting objects will be occur from the bottom up. In the example of deleting an engagement
 # The objects will be deleted as follows Endpoints -> Findings -> Tests -> Engagement
 ASYNC_OBJECT_DELETE = env("DD_ASYNC_OBJECT_DELETE")
 # The number of objects to be deleted per celeryworker
 ASYNC_OBEJECT_DELETE_CHUNK_SIZE = env("DD_ASYNC_OBEJECT_DELETE_CHUNK_SIZE")
+# Number of minutes after which a deletion that made no progress is resumed
+ASYNC_OBJECT_DELETE_RESUME_MINUTES = env("DD_ASYNC_OBJECT_DELETE_RESUME_MINUTES")
 # When enabled, display the preview of objects to be deleted. This can take a long time to render
 # for very large objects
 DELETE_PREVIEW = env("DD_DELETE_PREVIEW")
+# Number of seconds the system settings are cached per process, 0 disables the cache
+SYSTEM_SETTINGS_CACHE_TTL = env("DD_SYSTEM_SETTINGS_CACHE_TTL")
+# Number of seconds the active flags of the Test_Types are cached per process, 0 disables the cache
+PARSER_ACTIVATION_CACHE_TTL = env("DD_PARSER_ACTIVATION_CACHE_TTL")
+# Number of seconds the SLA configurations are cached per process, 0 disables the cache
+SLA_CONFIGURATION_CACHE_TTL = env("DD_SLA_CONFIGURATION_CACHE_TTL")
+# Maximum number of characters of rendered markdown kept per process, 0 disables it
+MARKDOWN_RENDER_CACHE_SIZE = env("DD_MARKDOWN_RENDER_CACHE_SIZE")
+# Number of seconds rendered markdown is kept in the django cache, 0 disables it
+MARKDOWN_RENDER_CACHE_TTL = env("DD_MARKDOWN_RENDER_CACHE_TTL")
+# Render the markdown of new findings into the django cache after an import
+MARKDOWN_RENDER_CACHE_WARM = env("DD_MARKDOWN_RENDER_CACHE_WARM")
+# Number of seconds a product grade recalculation is deferred to handle all changes in that window at once, 0 disables it
+PRODUCT_GRADE_DEBOUNCE_SECONDS = env("DD_PRODUCT_GRADE_DEBOUNCE_SECONDS")
+# Generate the reports in the background and serve them from the media storage until their inputs change
+ASYNC_REPORT_GENERATION = env("DD_ASYNC_REPORT_GENERATION")
+# Number of seconds a generated report is served again before it is regenerated
+REPORT_ARTIFACT_TTL = env("DD_REPORT_ARTIFACT_TTL")
+# Read the metrics pages from the rollup of the findings per product, date and severity
+METRICS_ROLLUP_ENABLED = env("DD_METRICS_ROLLUP_ENABLED")
+# Number of seconds the update of the rollup of a product is deferred to handle all changes in that window at once
+METRICS_ROLLUP_DEBOUNCE_SECONDS = env("DD_METRICS_ROLLUP_DEBOUNCE_SECONDS")
+# Number of seconds the recipients of a notification event are cached per process, 0 disables the cache
+NOTIFICATION_RECIPIENT_CACHE_TTL = env("DD_NOTIFICATION_RECIPIENT_CACHE_TTL")
+# The maximum number of batched notifications sent as one message per channel and user
+NOTIFICATION_BATCH_SIZE = env("DD_NOTIFICATION_BATCH_SIZE")
 
 # django-auditlog imports django-jsonfield-backport raises a warning that can be ignored,
 # see https://github.com/laymonage/django-jsonfield-backport
@@ -6,6 +6,13 @@ from .settings import *
 
 DEBUG = True
 
+# the test database is rolled back after each test, which doesn't invalidate cached system settings, test types,
+# SLA configurations and notification recipients
+SYSTEM_SETTINGS_CACHE_TTL = 0
+PARSER_ACTIVATION_CACHE_TTL = 0
+SLA_CONFIGURATION_CACHE_TTL = 0
+NOTIFICATION_RECIPIENT_CACHE_TTL = 0
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
@@ -0,0 +1,88 @@
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+from django.db.models import F
+from django.db.models.query import QuerySet
+from dojo.models import SLA_Configuration, Test
+
+logger = logging.getLogger(__name__)
+
+
+class SLAConfigurationCache(object):
+    """
+    Process wide cache of the SLA configurations by id, which the SLA of every finding of a list, an API response or an
+    SLA notification run is computed from. All configurations are loaded with a single query and are valid for
+    SLA_CONFIGURATION_CACHE_TTL seconds and as long as the version counter in the django cache is unchanged. Saving or
+    deleting an SLA configuration increments the version, so the other processes reload them when they share the django
+    cache (DD_CACHE_URL), otherwise when their copy expires.
+    """
+    VERSION_KEY = 'dojo_sla_configuration_version'
+
+    _lock = threading.Lock()
+    _configurations = None
+    _version = None
+    _expires = 0
+
+    @classmethod
+    def get_all(cls):
+        ttl = getattr(settings, 'SLA_CONFIGURATION_CACHE_TTL', 0)
+        if ttl <= 0:
+            return {sla_configuration.id: sla_configuration for sla_configuration in SLA_Configuration.objects.all()}
+
+        version = cache.get(cls.VERSION_KEY, 0)
+        with cls._lock:
+            if cls._configurations is not None and cls._version == version and time.monotonic() < cls._expires:
+                return cls._configurations
+
+        configurations = {sla_configuration.id: sla_configuration for sla_configuration in SLA_Configuration.objects.all()}
+        with cls._lock:
+            cls._configurations = configurations
+            cls._version = version
+            cls._expires = time.monotonic() + ttl
+        return configurations
+
+    @classmethod
+    def get(cls, sla_configuration_id):
+        if getattr(settings, 'SLA_CONFIGURATION_CACHE_TTL', 0) <= 0:
+            return SLA_Configuration.objects.filter(id=sla_configuration_id).first()
+        sla_configuration = cls.get_all().get(sla_configuration_id)
+        if sla_configuration is None and sla_configuration_id is not None:
+            # created in another process since the configurations were loaded, which without a shared django cache
+            # doesn't change the version this process sees
+            with cls._lock:
+                cls._configurations = None
+            sla_configuration = cls.get_all().get(sla_configuration_id)
+        return sla_configuration
+
+    @classmethod
+    def invalidate(cls, *args, **kwargs):
+        with cls._lock:
+            cls._configurations = None
+        try:
+            cache.incr(cls.VERSION_KEY)
+        except ValueError:
+            # the key doesn't exist (yet)
+            cache.set(cls.VERSION_KEY, 1, timeout=None)
+
+
+models.signals.post_save.connect(SLAConfigurationCache.invalidate, sender=SLA_Configuration)
+models.signals.post_delete.connect(SLAConfigurationCache.invalidate, sender=SLA_Configuration)
+
+
+def annotate_sla_configuration(findings):
+    """
+    Sets the id of the SLA configuration of the product on the findings, so the SLA of a page of findings is computed
+    without loading the test, engagement and product of each finding. A queryset is annotated, a list of findings is
+    set with one query.
+    """
+    if isinstance(findings, QuerySet):
+        return findings.annotate(sla_configuration_id=F('test__engagement__product__sla_configuration_id'))
+
+    test_ids = {finding.test_id for finding in findings}
+    sla_configuration_ids = dict(Test.objects.filter(id__in=test_ids).values_list('id', 'engagement__product__sla_configuration_id'))
+    for finding in findings:
+        finding.sla_configuration_id = sla_configuration_ids.get(finding.test_id)
+    return findings
@@ -5,9 +5,9 @@ from django.conf import settings
 from django.urls import reverse
 from dojo.celery import app
 from celery.utils.log import get_task_logger
-from dojo.models import Alerts, Product, Engagement, Finding, System_Settings, User
+from dojo.models import Alerts, Async_Delete_Job, Product, Engagement, Finding, System_Settings, User
 from django.utils import timezone
-from dojo.utils import calculate_grade
+from dojo.utils import calculate_grade, run_async_delete_job
 from dojo.utils import sla_compute_and_notify
 from dojo.notifications.helper import create_notification
 
@@ -168,3 +168,14 @@ def jira_status_reconciliation_task(*args, **kwargs):
 def fix_loop_duplicates_task(*args, **kwargs):
     from dojo.finding.helper import fix_loop_duplicates
     return fix_loop_duplicates()
+
+
+@app.task
+def resume_async_delete_jobs(*args, **kwargs):
+    # a running job is saved with every batch, when it isn't the worker running it has most likely been restarted
+    stale = timezone.now() - timedelta(minutes=settings.ASYNC_OBJECT_DELETE_RESUME_MINUTES)
+    for job_id in Async_Delete_Job.objects.filter(status__in=[Async_Delete_Job.PENDING, Async_Delete_Job.RUNNING],
+                                                  updated__lt=stale).values_list('id', flat=True):
+        logger.info('resuming deletion job %d', job_id)
+        Async_Delete_Job.objects.filter(id=job_id).update(updated=timezone.now())
+        run_async_delete_job(job_id)
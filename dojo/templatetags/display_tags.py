@@ -13,11 +13,10 @@ from django.contrib.auth.models import User
 from dojo.utils import prepare_for_view, get_system_setting, get_full_url, get_file_images
 import dojo.utils
 from dojo.models import Check_List, FileAccessToken, Finding, System_Settings, Product, Dojo_User, Benchmark_Product
-import markdown
+from dojo.markdown_cache import MarkdownRenderCache
 from django.db.models import Sum, Case, When, IntegerField, Value
 import dateutil.relativedelta
 import datetime
-import bleach
 import git
 from django.conf import settings
 import dojo.jira_link.helper as jira_helper
@@ -27,34 +26,6 @@ logger = logging.getLogger(__name__)
 
 register = template.Library()
 
-# Tags suitable for rendering markdown
-markdown_tags = {
-    "h1", "h2", "h3", "h4", "h5", "h6",
-    "b", "i", "strong", "em", "tt",
-    "table", "thead", "th", "tbody", "tr", "td",  # enables markdown.extensions.tables
-    "p", "br",
-    "pre", "div",  # used for code highlighting
-    "span", "blockquote", "code", "hr",
-    "ul", "ol", "li", "dd", "dt",
-    "img",
-    "a",
-    "sub", "sup",
-    "center",
-}
-
-markdown_attrs = {
-    "*": ["id"],
-    "img": ["src", "alt", "title", "width", "height", "style"],
-    "a": ["href", "alt", "target", "title"],
-    "span": ["class"],  # used for code highlighting
-    "pre": ["class"],  # used for code highlighting
-    "div": ["class"],  # used for code highlighting
-}
-
-markdown_styles = [
-    "background-color"
-]
-
 finding_related_action_classes_dict = {
     'reset_finding_duplicate_status': 'fa-solid fa-eraser',
     'set_finding_as_original': 'fa-brands fa-superpowers',
@@ -77,14 +48,7 @@ supported_file_formats = [
 @register.filter
 def markdown_render(value):
     if value:
-        markdown_text = markdown.markdown(value,
-                                          extensions=['markdown.extensions.nl2br',
-                                                      'markdown.extensions.sane_lists',
-                                                      'markdown.extensions.codehilite',
-                                                      'markdown.extensions.fenced_code',
-                                                      'markdown.extensions.toc',
-                                                      'markdown.extensions.tables'])
-        return mark_safe(bleach.clean(markdown_text, tags=markdown_tags, attributes=markdown_attrs, css_sanitizer=markdown_styles))
+        return mark_safe(MarkdownRenderCache.render(str(value)))
 
 
 @register.filter(name='url_shortner')
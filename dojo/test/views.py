@@ -233,8 +233,9 @@ def delete_test(request, tid):
                 product = test.engagement.product
                 if get_setting("ASYNC_OBJECT_DELETE"):
                     async_del = async_delete()
-                    async_del.delete(test)
-                    message = _('Test and relationships will be removed in the background.')
+                    job = async_del.delete(test)
+                    message = _('Test and relationships will be removed in the background, see %(url)s for the progress.') \
+                        % {'url': reverse('async_delete_job_status', args=(job.id,))}
                 else:
                     message = _('Test and relationships removed.')
                     test.delete()
@@ -740,5 +741,5 @@ def re_import_scan_results(request, tid):
                    'eid': engagement.id,
                    'additional_message': additional_message,
                    'jform': jform,
-                   'scan_types': get_scan_types_sorted(),
+                   'scan_types': get_scan_types_sorted(active_only=True),
                    })
@@ -33,6 +33,22 @@ class CheckmarxParser(object):
         self.mode = mode
 
     def _get_findings_xml(self, filename, test):
+        return list(self._iter_findings_xml(filename, test))
+
+    def _iter_queries_xml(self, filename):
+        """
+        Parse the xml report incrementally and yield the root element with each Query,
+        dropping every Query from the tree once it has been processed
+        """
+        root = None
+        for event, elem in ElementTree.iterparse(filename, events=("start", "end")):
+            if root is None:
+                root = elem
+            elif event == "end" and elem.tag == "Query":
+                yield root, elem
+                elem.clear()
+
+    def _iter_findings_xml(self, filename, test):
         """
         ----------------------------------------
         Structure of the checkmarx xml report:
@@ -44,16 +60,13 @@ class CheckmarxParser(object):
         - Path: There should be only one.Parent tag of Pathnodes
         - Pathnode: all the calls from the source (start) to the sink (end) of the attack vector
         """
-        cxscan = ElementTree.parse(filename)
-        root = cxscan.getroot()
-
         dupes = dict()
         language_list = dict()
         #  Dictionary to hold the vuln_id_from_tool values:
         #  - key: the concatenated aggregate keys
         #  - value: a list of vuln_id_from_tool
         vuln_ids_from_tool = dict()
-        for query in root.findall("Query"):
+        for root, query in self._iter_queries_xml(filename):
             name, cwe, categories, queryId = self.getQueryElements(query)
             language = ""
             findingdetail = ""
@@ -126,7 +139,7 @@ class CheckmarxParser(object):
                 test.engagement.product, lang, files=language_list[lang]
             )
 
-        return list(dupes.values())
+        yield from dupes.values()
 
     def _process_result_file_name_aggregated(
         self,
@@ -387,6 +400,12 @@ class CheckmarxParser(object):
         else:
             return self._get_findings_xml(file, test)
 
+    def iter_findings(self, file, test):
+        if file.name.strip().lower().endswith(".json"):
+            return iter(self._get_findings_json(file, test))
+        else:
+            return self._iter_findings_xml(file, test)
+
     def _parse_date(self, value):
         if isinstance(value, str):
             return parser.parse(value)
@@ -260,50 +260,55 @@ class DependencyCheckParser(object):
         return "OWASP Dependency Check output can be imported in Xml format."
 
     def get_findings(self, filename, test):
+        return list(self.iter_findings(filename, test))
+
+    def iter_findings(self, filename, test):
+        # the report is parsed incrementally and every dependency is dropped from the tree once
+        # its findings are built. Findings are deduplicated over the report, so they are yielded at the end.
         dupes = dict()
         namespace = ''
-        content = filename.read()
-
-        scan = ElementTree.fromstring(content)
-        regex = r"{.*}"
-        matches = re.match(regex, scan.tag)
-        try:
-            namespace = matches.group(0)
-        except:
-            namespace = ""
-
-        dependencies = scan.find(namespace + 'dependencies')
         scan_date = None
-        if scan.find(f"{namespace}projectInfo"):
-            projectInfo_node = scan.find(f"{namespace}projectInfo")
-            if projectInfo_node.findtext(f"{namespace}reportDate"):
-                scan_date = dateutil.parser.parse(projectInfo_node.findtext(f"{namespace}reportDate"))
-
-        if dependencies:
-            for dependency in dependencies.findall(namespace + 'dependency'):
-                vulnerabilities = dependency.find(namespace + 'vulnerabilities')
-                if vulnerabilities is not None:
-                    for vulnerability in vulnerabilities.findall(namespace + 'vulnerability'):
-                        if vulnerability:
-                            finding = self.get_finding_from_vulnerability(dependency, None, vulnerability, test, namespace)
-                            if scan_date:
-                                finding.date = scan_date
-                            self.add_finding(finding, dupes)
-
-                            relatedDependencies = dependency.find(namespace + 'relatedDependencies')
-                            if relatedDependencies:
-                                for relatedDependency in relatedDependencies.findall(namespace + 'relatedDependency'):
-                                    finding = self.get_finding_from_vulnerability(dependency, relatedDependency, vulnerability, test, namespace)
-                                    if finding:  # could be None
-                                        if scan_date:
-                                            finding.date = scan_date
-                                        self.add_finding(finding, dupes)
-
-                    for suppressedVulnerability in vulnerabilities.findall(namespace + 'suppressedVulnerability'):
-                        if suppressedVulnerability:
-                            finding = self.get_finding_from_vulnerability(dependency, None, suppressedVulnerability, test, namespace)
-                            if scan_date:
-                                finding.date = scan_date
-                            self.add_finding(finding, dupes)
-
-        return list(dupes.values())
+        root = None
+        for event, elem in ElementTree.iterparse(filename, events=("start", "end")):
+            if root is None:
+                root = elem
+                regex = r"{.*}"
+                matches = re.match(regex, root.tag)
+                try:
+                    namespace = matches.group(0)
+                except:
+                    namespace = ""
+            elif event == "end" and elem.tag == f"{namespace}projectInfo":
+                if elem.findtext(f"{namespace}reportDate"):
+                    scan_date = dateutil.parser.parse(elem.findtext(f"{namespace}reportDate"))
+            elif event == "end" and elem.tag == f"{namespace}dependency":
+                self.add_findings_from_dependency(elem, test, namespace, scan_date, dupes)
+                elem.clear()
+
+        yield from dupes.values()
+
+    def add_findings_from_dependency(self, dependency, test, namespace, scan_date, dupes):
+        vulnerabilities = dependency.find(namespace + 'vulnerabilities')
+        if vulnerabilities is not None:
+            for vulnerability in vulnerabilities.findall(namespace + 'vulnerability'):
+                if vulnerability:
+                    finding = self.get_finding_from_vulnerability(dependency, None, vulnerability, test, namespace)
+                    if scan_date:
+                        finding.date = scan_date
+                    self.add_finding(finding, dupes)
+
+                    relatedDependencies = dependency.find(namespace + 'relatedDependencies')
+                    if relatedDependencies:
+                        for relatedDependency in relatedDependencies.findall(namespace + 'relatedDependency'):
+                            finding = self.get_finding_from_vulnerability(dependency, relatedDependency, vulnerability, test, namespace)
+                            if finding:  # could be None
+                                if scan_date:
+                                    finding.date = scan_date
+                                self.add_finding(finding, dupes)
+
+            for suppressedVulnerability in vulnerabilities.findall(namespace + 'suppressedVulnerability'):
+                if suppressedVulnerability:
+                    finding = self.get_finding_from_vulnerability(dependency, None, suppressedVulnerability, test, namespace)
+                    if scan_date:
+                        finding.date = scan_date
+                    self.add_finding(finding, dupes)
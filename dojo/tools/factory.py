@@ -1,9 +1,25 @@
+import json
+import os
 import re
 import logging
+import threading
+import time
+from importlib import import_module
+from importlib.util import find_spec
+from inspect import isclass
+from pathlib import Path
 from django.conf import settings
+from django.core.cache import cache
+from django.db import models
 from dojo.models import Test_Type, Tool_Type, Tool_Configuration
 
+# the parsers that have been imported so far, by scan type
 PARSERS = {}
+# all the parsers of the package by scan type, see generate_parser_manifest
+# parser modules are only imported the first time their parser is needed
+PARSER_MANIFEST = {}
+PARSER_MANIFEST_PATH = os.path.join(str(Path(__file__).resolve().parent), "parser_manifest.json")
+parsers_lock = threading.RLock()
 
 logger = logging.getLogger(__name__)
 
@@ -24,90 +40,247 @@ def register_parser(scan_type, parser):
     PARSERS[scan_type] = parser
 
 
+def load_parser(scan_type):
+    """Return the registered parser of a scan type, importing its module the first time it is needed"""
+    if scan_type not in PARSERS and scan_type in PARSER_MANIFEST:
+        with parsers_lock:
+            if scan_type not in PARSERS:
+                entry = PARSER_MANIFEST[scan_type]
+                logger.debug(f"loading {entry['class']} from {entry['module']} for scan_type:{scan_type}")
+                register(getattr(import_module(entry["module"]), entry["class"]))
+    return PARSERS.get(scan_type)
+
+
+def load_all_parsers():
+    """Import all parsers of the manifest and return the registry"""
+    for scan_type in PARSER_MANIFEST:
+        load_parser(scan_type)
+    return PARSERS
+
+
+def get_scan_types():
+    return set(PARSER_MANIFEST) | set(PARSERS)
+
+
+def get_parser_info(scan_type):
+    """Return the manifest entry of a scan type without importing its parser if possible"""
+    if scan_type in PARSER_MANIFEST:
+        return PARSER_MANIFEST[scan_type]
+    if scan_type in PARSERS:
+        return get_parser_manifest_entry(scan_type, PARSERS[scan_type])
+    return None
+
+
+class ParserActivationCache(object):
+    """
+    Process wide cache of the activation state of the scan types: the compiled PARSER_EXCLUDE regex and the active flag
+    of the Test_Type of each scan type. The flags of all Test_Types are loaded with a single query and are valid for
+    PARSER_ACTIVATION_CACHE_TTL seconds and as long as the version counter in the django cache is unchanged. Saving or
+    deleting a Test_Type increments the version, so the other processes reload the flags when they share the django cache
+    (DD_CACHE_URL), otherwise when their copy expires.
+    """
+    VERSION_KEY = 'dojo_parser_activation_version'
+
+    _lock = threading.Lock()
+    _exclude = None
+    _active_flags = None
+    _version = None
+    _expires = 0
+
+    @classmethod
+    def is_excluded(cls, scan_type):
+        parser_exclude = settings.PARSER_EXCLUDE
+        if parser_exclude.strip() == "":
+            return False
+        exclude = cls._exclude
+        if exclude is None or exclude[0] != parser_exclude:
+            exclude = cls._exclude = (parser_exclude, re.compile(parser_exclude))
+        return exclude[1].match(scan_type) is not None
+
+    @classmethod
+    def get_active_flags(cls, scan_types):
+        ttl = getattr(settings, 'PARSER_ACTIVATION_CACHE_TTL', 0)
+        if ttl <= 0:
+            return dict(Test_Type.objects.filter(name__in=scan_types).values_list('name', 'active'))
+
+        version = cache.get(cls.VERSION_KEY, 0)
+        with cls._lock:
+            if cls._active_flags is not None and cls._version == version and time.monotonic() < cls._expires:
+                return cls._active_flags
+
+        active_flags = dict(Test_Type.objects.values_list('name', 'active'))
+        with cls._lock:
+            cls._active_flags = active_flags
+            cls._version = version
+            cls._expires = time.monotonic() + ttl
+        return active_flags
+
+    @classmethod
+    def get_active_scan_types(cls, scan_types):
+        """Return the scan types of the list that are active, creating the missing Test_Types like get_parser does"""
+        scan_types = [scan_type for scan_type in scan_types if not cls.is_excluded(scan_type)]
+        active_flags = cls.get_active_flags(scan_types)
+        missing = [scan_type for scan_type in scan_types if scan_type not in active_flags]
+        if missing:
+            # update DB dynamicaly, new Test_Types are active
+            Test_Type.objects.bulk_create([Test_Type(name=scan_type) for scan_type in missing], ignore_conflicts=True)
+            with cls._lock:
+                active_flags.update((scan_type, True) for scan_type in missing)
+        return [scan_type for scan_type in scan_types if active_flags[scan_type]]
+
+    @classmethod
+    def is_active(cls, scan_type):
+        return len(cls.get_active_scan_types([scan_type])) > 0
+
+    @classmethod
+    def warm(cls):
+        try:
+            cls.get_active_scan_types(get_scan_types())
+        except Exception:
+            # the database may not be available, e.g. in a docker build
+            logger.warning("unable to load the active scan types", exc_info=True)
+
+    @classmethod
+    def invalidate(cls, *args, **kwargs):
+        with cls._lock:
+            cls._active_flags = None
+        try:
+            cache.incr(cls.VERSION_KEY)
+        except ValueError:
+            # the key doesn't exist (yet)
+            cache.set(cls.VERSION_KEY, 1, timeout=None)
+
+
+models.signals.post_save.connect(ParserActivationCache.invalidate, sender=Test_Type)
+models.signals.post_delete.connect(ParserActivationCache.invalidate, sender=Test_Type)
+
+
 def get_parser(scan_type):
     """Return a parser by the scan type"""
-    if scan_type not in PARSERS:
+    if scan_type not in get_scan_types():
         raise ValueError(f"Parser '{scan_type}' does not exists")
-    rg = re.compile(settings.PARSER_EXCLUDE)
-    if not rg.match(scan_type) or settings.PARSER_EXCLUDE.strip() == "":
-        # update DB dynamicaly
-        test_type, _ = Test_Type.objects.get_or_create(name=scan_type)
-        if test_type.active:
-            return PARSERS[scan_type]
+    if ParserActivationCache.is_active(scan_type):
+        return load_parser(scan_type)
     raise ValueError(f"Parser {scan_type} is not active")
 
 
-def get_scan_types_sorted():
+def get_scan_types_sorted(active_only=False):
     res = list()
-    for key in PARSERS:
-        res.append((key, PARSERS[key].get_description_for_scan_types(key)))
+    scan_types = ParserActivationCache.get_active_scan_types(get_scan_types()) if active_only else get_scan_types()
+    for key in scan_types:
+        res.append((key, get_parser_info(key)["description"]))
     return sorted(tuple(res), key=lambda x: x[0].lower())
 
 
-def get_choices_sorted():
+def get_choices_sorted(active_only=False):
     res = list()
-    for key in PARSERS:
+    scan_types = ParserActivationCache.get_active_scan_types(get_scan_types()) if active_only else get_scan_types()
+    for key in scan_types:
         res.append((key, key))
     return sorted(tuple(res), key=lambda x: x[1].lower())
 
 
+def get_active_choices_sorted():
+    return get_choices_sorted(active_only=True)
+
+
 def requires_file(scan_type):
-    if scan_type not in PARSERS:
+    if scan_type not in get_scan_types():
         return False
-    parser = PARSERS[scan_type]
-    if hasattr(parser, "requires_file"):
-        return parser.requires_file(scan_type)
-    # Set a sane default to require files since it is the
-    # more commen scenario.
-    return True
+    return get_parser_info(scan_type)["requires_file"]
+
+
+def supports_iter_findings(parser):
+    """Parsers can implement an optional iter_findings(file, test) generator to parse big reports incrementally"""
+    return hasattr(parser, "iter_findings")
+
+
+def iter_findings(parser, file, test):
+    """Return an iterator over the findings of a report, falling back to get_findings for parsers without iter_findings"""
+    if supports_iter_findings(parser):
+        return parser.iter_findings(file, test)
+    return iter(parser.get_findings(file, test))
 
 
 def get_api_scan_configuration_hints():
     res = list()
-    for name, parser in PARSERS.items():
-        if hasattr(parser, "api_scan_configuration_hint"):
-            scan_types = parser.get_scan_types()
-            for scan_type in scan_types:
-                tool_type = parser.requires_tool_type(scan_type)
-                res.append({
-                    'name': name,
-                    'id': name.lower().replace(' ', '_').replace('.', ''),
-                    'tool_type_name': tool_type,
-                    'tool_types': Tool_Type.objects.filter(name=tool_type),
-                    'tool_configurations': Tool_Configuration.objects.filter(tool_type__name=tool_type),
-                    'hint': parser.api_scan_configuration_hint(),
-                })
+    for name in get_scan_types():
+        info = get_parser_info(name)
+        if info["api_scan_configuration_hint"] is not None:
+            tool_type = info["requires_tool_type"]
+            res.append({
+                'name': name,
+                'id': name.lower().replace(' ', '_').replace('.', ''),
+                'tool_type_name': tool_type,
+                'tool_types': Tool_Type.objects.filter(name=tool_type),
+                'tool_configurations': Tool_Configuration.objects.filter(tool_type__name=tool_type),
+                'hint': info["api_scan_configuration_hint"],
+            })
     return sorted(res, key=lambda x: x['name'].lower())
 
 
 def requires_tool_type(scan_type):
-    if scan_type not in PARSERS:
+    if scan_type not in get_scan_types():
         return None
-    parser = PARSERS[scan_type]
-    if hasattr(parser, "requires_tool_type"):
-        return parser.requires_tool_type(scan_type)
-    return None
+    return get_parser_info(scan_type)["requires_tool_type"]
 
 
-import os
-from inspect import isclass
-from pathlib import Path
-from importlib import import_module
-from importlib.util import find_spec
+def discover_parser_types():
+    """Import all the parser modules of the package and yield their parser classes"""
+    # iterate through the modules in the current package
+    package_dir = str(Path(__file__).resolve().parent)
+    for module_name in sorted(os.listdir(package_dir)):
+        # check if it's dir
+        if os.path.isdir(os.path.join(package_dir, module_name)):
+            try:
+                # check if it's a Python module
+                if find_spec(f"dojo.tools.{module_name}.parser"):
+                    # import the module and iterate through its attributes
+                    module = import_module(f"dojo.tools.{module_name}.parser")
+                    for attribute_name in dir(module):
+                        attribute = getattr(module, attribute_name)
+                        if isclass(attribute) and attribute_name.lower() == module_name.replace("_", "") + "parser":
+                            yield attribute
+            except:
+                logger.exception(f"failed to load {module_name}")
 
-# iterate through the modules in the current package
-package_dir = str(Path(__file__).resolve().parent)
-for module_name in os.listdir(package_dir):
-    # check if it's dir
-    if os.path.isdir(os.path.join(package_dir, module_name)):
-        try:
-            # check if it's a Python module
-            if find_spec(f"dojo.tools.{module_name}.parser"):
-                # import the module and iterate through its attributes
-                module = import_module(f"dojo.tools.{module_name}.parser")
-                for attribute_name in dir(module):
-                    attribute = getattr(module, attribute_name)
-                    if isclass(attribute) and attribute_name.lower() == module_name.replace("_", "") + "parser":
-                        register(attribute)
-        except:
-            logger.exception(f"failed to load {module_name}")
+
+def get_parser_manifest_entry(scan_type, parser):
+    return {
+        "module": parser.__class__.__module__,
+        "class": parser.__class__.__name__,
+        "description": parser.get_description_for_scan_types(scan_type),
+        # Set a sane default to require files since it is the
+        # more commen scenario.
+        "requires_file": parser.requires_file(scan_type) if hasattr(parser, "requires_file") else True,
+        "requires_tool_type": parser.requires_tool_type(scan_type) if hasattr(parser, "requires_tool_type") else None,
+        "api_scan_configuration_hint": parser.api_scan_configuration_hint() if hasattr(parser, "api_scan_configuration_hint") else None,
+    }
+
+
+def generate_parser_manifest():
+    """Build the manifest of all the parsers of the package, this imports every parser module"""
+    manifest = {}
+    for parser_type in discover_parser_types():
+        for scan_type in parser_type().get_scan_types():
+            if scan_type in manifest:
+                raise ValueError(f"Try to register an existing parser '{scan_type}'")
+            parser = parser_type()
+            if scan_type.endswith("detailed"):
+                parser.set_mode("detailed")
+            manifest[scan_type] = get_parser_manifest_entry(scan_type, parser)
+    return dict(sorted(manifest.items()))
+
+
+def load_parser_manifest():
+    try:
+        with open(PARSER_MANIFEST_PATH) as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        logger.warning(f"{PARSER_MANIFEST_PATH} not found, importing all parsers")
+        for parser_type in discover_parser_types():
+            register(parser_type)
+        return {}
+
+
+PARSER_MANIFEST.update(load_parser_manifest())
@@ -19,3 +19,8 @@ class TenableParser(object):
             return TenableCSVParser().get_findings(filename, test)
         else:
             raise ValueError("Filename extension not recognized. Use .xml, .nessus or .csv")
+
+    def iter_findings(self, filename, test):
+        if filename.name.lower().endswith(".xml") or filename.name.lower().endswith(".nessus"):
+            return TenableXMLParser().iter_findings(filename, test)
+        return iter(self.get_findings(filename, test))
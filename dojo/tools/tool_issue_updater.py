@@ -16,7 +16,7 @@ def is_tool_issue_updater_needed(finding, *args, **kwargs):
 
 
 @dojo_model_to_id
-@dojo_async_task
+@dojo_async_task(coalesce_key=0)
 @app.task
 @dojo_model_from_id
 def tool_issue_updater(finding, *args, **kwargs):
@@ -2,6 +2,9 @@ from dojo.authorization.roles_permissions import Permissions
 from dojo.finding.queries import get_authorized_findings
 import re
 import binascii
+import bisect
+import functools
+import threading
 import os
 import hashlib
 import bleach
@@ -15,10 +18,13 @@ from math import pi, sqrt
 import vobject
 from dateutil.relativedelta import relativedelta, MO, SU
 from django.conf import settings
+from django.core.cache import cache
 from django.core.mail import send_mail
 from django.core.paginator import Paginator
 from django.urls import get_resolver, reverse
-from django.db.models import Q, Sum, Case, When, IntegerField, Value, Count
+from django.db import DatabaseError, transaction
+from django.db.models import Q, Sum, Case, When, IntegerField, Value, Count, F
+from django.db.models.functions import Coalesce, TruncDate
 from django.utils import timezone
 from django.utils.translation import gettext as _
 from django.dispatch import receiver
@@ -26,18 +32,19 @@ from django.db.models.signals import post_save
 from django.db.models.query import QuerySet
 import calendar as tcalendar
 from dojo.github import add_external_issue_github, update_external_issue_github, close_external_issue_github, reopen_external_issue_github
-from dojo.models import Finding, Engagement, Finding_Group, Finding_Template, Product, \
-    Test, User, Dojo_User, System_Settings, Notifications, Endpoint, Benchmark_Type, \
-    Language_Type, Languages, Dojo_Group_Member, NOTIFICATION_CHOICES
+from dojo.models import Finding, Engagement, Finding_Group, Finding_Template, Product, Product_Type, \
+    Async_Delete_Job, Test, User, Dojo_User, System_Settings, Notifications, Endpoint, Endpoint_Status, Benchmark_Type, \
+    Language_Type, Languages, Dojo_Group_Member, NOTIFICATION_CHOICES, get_current_date
 from asteval import Interpreter
-from dojo.notifications.helper import create_notification
+from dojo.notifications.helper import batch_notifications, create_notification
+from dojo.sla_config.helpers import SLAConfigurationCache
 import logging
 import itertools
 from django.contrib import messages
 from django.http import HttpResponseRedirect
 import crum
 from dojo.celery import app
-from dojo.decorators import dojo_async_task, dojo_model_from_id, dojo_model_to_id
+from dojo.decorators import dojo_async_task, dojo_model_from_id, dojo_model_to_id, we_want_async
 from django.contrib.auth.signals import user_logged_in, user_logged_out, user_login_failed
 
 
@@ -272,7 +279,7 @@ def do_dedupe_finding_task(new_finding, *args, **kwargs):
     return do_dedupe_finding(new_finding, *args, **kwargs)
 
 
-def do_dedupe_finding(new_finding, *args, **kwargs):
+def do_dedupe_finding(new_finding, *args, only_older=False, dedupe_session=None, **kwargs):
     try:
         enabled = System_Settings.objects.get(no_cache=True).enable_deduplication
     except System_Settings.DoesNotExist:
@@ -283,20 +290,22 @@ def do_dedupe_finding(new_finding, *args, **kwargs):
                     ":" + str(new_finding.title))
         deduplicationAlgorithm = new_finding.test.deduplication_algorithm
         deduplicationLogger.debug('deduplication algorithm: ' + deduplicationAlgorithm)
-        if deduplicationAlgorithm == settings.DEDUPE_ALGO_UNIQUE_ID_FROM_TOOL:
-            deduplicate_unique_id_from_tool(new_finding)
+        if dedupe_session is not None and deduplicationAlgorithm in DedupeSession.ALGORITHMS:
+            dedupe_session.deduplicate(new_finding, deduplicationAlgorithm, only_older=only_older)
+        elif deduplicationAlgorithm == settings.DEDUPE_ALGO_UNIQUE_ID_FROM_TOOL:
+            deduplicate_unique_id_from_tool(new_finding, only_older=only_older)
         elif deduplicationAlgorithm == settings.DEDUPE_ALGO_HASH_CODE:
-            deduplicate_hash_code(new_finding)
+            deduplicate_hash_code(new_finding, only_older=only_older)
         elif deduplicationAlgorithm == settings.DEDUPE_ALGO_UNIQUE_ID_FROM_TOOL_OR_HASH_CODE:
-            deduplicate_uid_or_hash_code(new_finding)
+            deduplicate_uid_or_hash_code(new_finding, only_older=only_older)
         else:
             deduplicationLogger.debug("no configuration per parser found; using legacy algorithm")
-            deduplicate_legacy(new_finding)
+            deduplicate_legacy(new_finding, only_older=only_older)
     else:
         deduplicationLogger.debug("dedupe: skipping dedupe because it's disabled in system settings get()")
 
 
-def deduplicate_legacy(new_finding):
+def deduplicate_legacy(new_finding, only_older=False):
     # ---------------------------------------------------------
     # 1) Collects all the findings that have the same:
     #      (title  and static_finding and dynamic_finding)
@@ -320,6 +329,8 @@ def deduplicate_legacy(new_finding):
             title=new_finding.title).exclude(id=new_finding.id).exclude(duplicate=True).values('id')
 
     total_findings = Finding.objects.filter(Q(id__in=eng_findings_cwe) | Q(id__in=eng_findings_title)).prefetch_related('endpoints', 'test', 'test__engagement', 'found_by', 'original_finding', 'test__test_type')
+    if only_older:
+        total_findings = total_findings.filter(id__lt=new_finding.id)
     deduplicationLogger.debug("Found " +
         str(len(eng_findings_cwe)) + " findings with same cwe, " +
         str(len(eng_findings_title)) + " findings with same title: " +
@@ -384,7 +395,7 @@ def deduplicate_legacy(new_finding):
             break
 
 
-def deduplicate_unique_id_from_tool(new_finding):
+def deduplicate_unique_id_from_tool(new_finding, only_older=False):
     if new_finding.test.engagement.deduplication_on_engagement:
         existing_findings = Finding.objects.filter(
             test__engagement=new_finding.test.engagement,
@@ -402,6 +413,9 @@ def deduplicate_unique_id_from_tool(new_finding):
                     unique_id_from_tool=None).exclude(
                         duplicate=True).order_by('id')
 
+    if only_older:
+        existing_findings = existing_findings.filter(id__lt=new_finding.id)
+
     deduplicationLogger.debug("Found " +
         str(len(existing_findings)) + " findings with same unique_id_from_tool")
     for find in existing_findings:
@@ -417,7 +431,7 @@ def deduplicate_unique_id_from_tool(new_finding):
             continue
 
 
-def deduplicate_hash_code(new_finding):
+def deduplicate_hash_code(new_finding, only_older=False):
     if new_finding.test.engagement.deduplication_on_engagement:
         existing_findings = Finding.objects.filter(
             test__engagement=new_finding.test.engagement,
@@ -433,6 +447,9 @@ def deduplicate_hash_code(new_finding):
                     hash_code=None).exclude(
                         duplicate=True).order_by('id')
 
+    if only_older:
+        existing_findings = existing_findings.filter(id__lt=new_finding.id)
+
     deduplicationLogger.debug("Found " +
         str(len(existing_findings)) + " findings with same hash_code")
     for find in existing_findings:
@@ -449,7 +466,7 @@ def deduplicate_hash_code(new_finding):
             continue
 
 
-def deduplicate_uid_or_hash_code(new_finding):
+def deduplicate_uid_or_hash_code(new_finding, only_older=False):
     if new_finding.test.engagement.deduplication_on_engagement:
         existing_findings = Finding.objects.filter(
             (Q(hash_code__isnull=False) & Q(hash_code=new_finding.hash_code)) |
@@ -466,6 +483,9 @@ def deduplicate_uid_or_hash_code(new_finding):
             test__engagement__product=new_finding.test.engagement.product).exclude(
                 id=new_finding.id).exclude(
                         duplicate=True).order_by('id')
+    if only_older:
+        existing_findings = existing_findings.filter(id__lt=new_finding.id)
+
     deduplicationLogger.debug("Found " +
         str(len(existing_findings)) + " findings with either the same unique_id_from_tool or hash_code")
     for find in existing_findings:
@@ -527,6 +547,117 @@ def set_duplicate_reopen(new_finding, existing_finding):
     existing_finding.save()
 
 
+class DedupeSession(object):
+    """
+    Deduplicates a batch of new findings of the same product against an in memory index of the candidate findings, used by
+    post_process_findings_batch. Single findings are still deduplicated by the deduplicate_* functions, as loading the index
+    costs more than their queries.
+    The ids and hash codes of the non duplicate findings of the product are loaded once, the lookups follow the rules of
+    deduplicate_unique_id_from_tool, deduplicate_hash_code and deduplicate_uid_or_hash_code. The candidates that match a new
+    finding are fetched at once, together with their endpoints. Findings marked as duplicate are only saved by flush(), in one bulk update.
+    Findings that are created by others after the session is started are not considered as candidates.
+    """
+
+    ALGORITHMS = [settings.DEDUPE_ALGO_UNIQUE_ID_FROM_TOOL, settings.DEDUPE_ALGO_HASH_CODE, settings.DEDUPE_ALGO_UNIQUE_ID_FROM_TOOL_OR_HASH_CODE]
+
+    def __init__(self, product):
+        self.product = product
+        self.candidates = {}
+        self.by_hash_code = {}
+        self.by_unique_id_from_tool = {}
+        self.duplicates = {}
+        self.found_by = set()
+
+        for id, hash_code, unique_id_from_tool, test_type_id, engagement_id, deduplication_on_engagement in Finding.objects.filter(
+                test__engagement__product=product).exclude(duplicate=True).order_by('id').values_list(
+                'id', 'hash_code', 'unique_id_from_tool', 'test__test_type_id', 'test__engagement_id', 'test__engagement__deduplication_on_engagement'):
+            self.candidates[id] = (test_type_id, engagement_id, deduplication_on_engagement)
+            if hash_code is not None:
+                self.by_hash_code.setdefault(hash_code, []).append(id)
+            if unique_id_from_tool is not None:
+                self.by_unique_id_from_tool.setdefault(unique_id_from_tool, []).append(id)
+        deduplicationLogger.debug('dedupe session: loaded %i candidate findings for product %s', len(self.candidates), product)
+
+    def get_candidate_ids(self, new_finding, deduplication_algorithm, only_older=False):
+        test_type_id = new_finding.test.test_type_id
+        ids = set()
+        if deduplication_algorithm in [settings.DEDUPE_ALGO_HASH_CODE, settings.DEDUPE_ALGO_UNIQUE_ID_FROM_TOOL_OR_HASH_CODE]:
+            if new_finding.hash_code is not None:
+                ids.update(self.by_hash_code.get(new_finding.hash_code, []))
+        if deduplication_algorithm in [settings.DEDUPE_ALGO_UNIQUE_ID_FROM_TOOL, settings.DEDUPE_ALGO_UNIQUE_ID_FROM_TOOL_OR_HASH_CODE]:
+            if new_finding.unique_id_from_tool is not None:
+                for id in self.by_unique_id_from_tool.get(new_finding.unique_id_from_tool, []):
+                    # the unique_id_from_tool is unique for a given tool: do not compare with other tools,
+                    # except for deduplicate_unique_id_from_tool on engagement level
+                    if self.candidates[id][0] == test_type_id or \
+                            (deduplication_algorithm == settings.DEDUPE_ALGO_UNIQUE_ID_FROM_TOOL and new_finding.test.engagement.deduplication_on_engagement):
+                        ids.add(id)
+
+        if new_finding.test.engagement.deduplication_on_engagement:
+            ids = {id for id in ids if self.candidates[id][1] == new_finding.test.engagement_id}
+        ids.discard(new_finding.id)
+        return sorted(id for id in ids if id not in self.duplicates and not (only_older and id >= new_finding.id))
+
+    def deduplicate(self, new_finding, deduplication_algorithm, only_older=False):
+        candidate_ids = self.get_candidate_ids(new_finding, deduplication_algorithm, only_older=only_older)
+        deduplicationLogger.debug("dedupe session: found %i candidate findings for finding %i", len(candidate_ids), new_finding.id)
+        if not new_finding.test.engagement.deduplication_on_engagement:
+            for id in candidate_ids:
+                if self.candidates[id][2]:
+                    deduplicationLogger.debug('deduplication_on_engagement_mismatch, skipping dedupe.')
+            candidate_ids = [id for id in candidate_ids if not self.candidates[id][2]]
+        if not candidate_ids:
+            return
+
+        candidates = Finding.objects.filter(id__in=candidate_ids).select_related('test__engagement').prefetch_related('endpoints').in_bulk()
+        for id in candidate_ids:
+            find = candidates.get(id)
+            if find is None:
+                # deleted since the session was started
+                continue
+            try:
+                is_duplicate = deduplication_algorithm == settings.DEDUPE_ALGO_UNIQUE_ID_FROM_TOOL or are_endpoints_duplicates(new_finding, find)
+                if is_duplicate:
+                    self.set_duplicate(new_finding, find)
+            except Exception as e:
+                deduplicationLogger.debug(str(e))
+                continue
+            # deduplicate_uid_or_hash_code only looks at the first candidate
+            if is_duplicate or deduplication_algorithm == settings.DEDUPE_ALGO_UNIQUE_ID_FROM_TOOL_OR_HASH_CODE:
+                break
+
+    def set_duplicate(self, new_finding, existing_finding):
+        # same as set_duplicate, but the changes to the findings are saved by flush()
+        if existing_finding.duplicate or existing_finding.id in self.duplicates:
+            raise Exception("Existing finding is a duplicate")
+        if existing_finding.id == new_finding.id:
+            raise Exception("Can not add duplicate to itself")
+        deduplicationLogger.debug('Setting new finding ' + str(new_finding.id) + ' as a duplicate of existing finding ' + str(existing_finding.id))
+        if is_duplicate_reopen(new_finding, existing_finding):
+            set_duplicate_reopen(new_finding, existing_finding)
+        new_finding.duplicate = True
+        new_finding.active = False
+        new_finding.verified = False
+        new_finding.duplicate_finding = existing_finding
+        # normally set by update_finding_status when the finding is saved
+        new_finding.last_status_update = timezone.now()
+        self.duplicates[new_finding.id] = new_finding
+
+        for find in new_finding.original_finding.all().order_by('-id'):
+            new_finding.original_finding.remove(find)
+            self.set_duplicate(find, existing_finding)
+        self.found_by.add((existing_finding.id, new_finding.test.test_type_id))
+
+    def flush(self):
+        Finding.objects.bulk_update(self.duplicates.values(), ['duplicate', 'active', 'verified', 'duplicate_finding', 'last_status_update'])
+        found_by = Finding.found_by.through
+        found_by.objects.bulk_create([found_by(finding_id=finding_id, test_type_id=test_type_id) for finding_id, test_type_id in self.found_by],
+                                     ignore_conflicts=True)
+        deduplicationLogger.debug('dedupe session: saved %i duplicates', len(self.duplicates))
+        self.duplicates = {}
+        self.found_by = set()
+
+
 def count_findings(findings):
     product_count = {}
     finding_count = {'low': 0, 'med': 0, 'high': 0, 'crit': 0}
@@ -948,17 +1079,86 @@ def get_period_counts_legacy(findings,
     }
 
 
+def get_period_boundaries(period_interval, start_date, relative_delta='months'):
+    """Yield the start and end of the periods of the metrics charts, starting with the period before start_date"""
+    for x in range(-1, period_interval):
+        if relative_delta == 'months':
+            # make interval the first through last of month
+            end_date = (start_date + relativedelta(months=x)) + relativedelta(
+                day=1, months=+1, days=-1)
+            new_date = (
+                start_date + relativedelta(months=x)) + relativedelta(day=1)
+        else:
+            # week starts the monday before
+            new_date = start_date + relativedelta(weeks=x, weekday=MO(1))
+            end_date = new_date + relativedelta(weeks=1, weekday=MO(1))
+        yield new_date, end_date
+
+
+def get_range_sums(counts, field):
+    """
+    Returns a function that sums the counts of a field per severity between two dates (inclusive), from the prefix
+    sums of the counts over the sorted dates so that each sum is two lookups. Rows without a severity are summed
+    under None.
+    """
+    dates = sorted(set(row['date'] for row in counts))
+    date_index = {day: index for index, day in enumerate(dates)}
+    per_date = {}
+    for row in counts:
+        per_date.setdefault(row.get('severity'), [0] * len(dates))[date_index[row['date']]] += row[field]
+    prefix_sums = {severity: list(itertools.accumulate(values, initial=0)) for severity, values in per_date.items()}
+
+    def sum_range(severity, first, last):
+        if first > last or severity not in prefix_sums:
+            return 0
+        return prefix_sums[severity][bisect.bisect_right(dates, last)] - prefix_sums[severity][bisect.bisect_left(dates, first)]
+    return sum_range
+
+
 def get_period_counts(findings,
                       findings_closed,
                       accepted_findings,
                       period_interval,
                       start_date,
                       relative_delta='months'):
-
+    """
+    Counts the opened, active, closed and accepted findings (or endpoint statuses) per period for the metrics charts.
+    Each series is counted with one query grouped by day and severity, which are summed per period afterwards. The
+    counts are distinct, as the querysets can be joined, e.g. the findings of the endpoints of a host.
+    """
     tz = timezone.get_current_timezone()
 
     start_date = datetime(start_date.year, start_date.month, start_date.day, tzinfo=tz)
 
+    if findings.model is Endpoint_Status:
+        opened_counts = findings.order_by().values('date', severity=F('finding__severity')).annotate(
+            count=Count('id', distinct=True), active_count=Count('id', distinct=True, filter=Q(finding__active=True)))
+    else:
+        opened_counts = findings.order_by().values('date', 'severity').annotate(
+            count=Count('id', distinct=True), active_count=Count('id', distinct=True, filter=Q(active=True)))
+    opened_sum = get_range_sums(opened_counts, 'count')
+    active_sum = get_range_sums(opened_counts, 'active_count')
+
+    # endpoint statuses are closed in a period by time, findings by date
+    closed_counts = findings_closed.order_by().annotate(
+        closed_date=TruncDate('mitigated_time' if findings_closed.model is Endpoint_Status else 'mitigated')
+    ).values('closed_date').annotate(count=Count('id', distinct=True))
+    closed_sum = get_range_sums([{'date': row['closed_date'], 'count': row['count']} for row in closed_counts
+                                 if row['closed_date']], 'count')
+
+    accepted_sum = get_range_sums([], 'count')
+    if accepted_findings is not None:
+        if accepted_findings.model is Endpoint_Status:
+            accepted_counts = accepted_findings.order_by().values('date', severity=F('finding__severity')).annotate(
+                count=Count('id', distinct=True))
+        else:
+            accepted_counts = accepted_findings.order_by().annotate(
+                accepted_date=TruncDate('risk_acceptance__created')
+            ).values('accepted_date', 'severity').annotate(count=Count('id', distinct=True))
+            accepted_counts = [{'date': row['accepted_date'], 'severity': row['severity'], 'count': row['count']}
+                               for row in accepted_counts if row['accepted_date']]
+        accepted_sum = get_range_sums(accepted_counts, 'count')
+
     opened_in_period = list()
     active_in_period = list()
     accepted_in_period = list()
@@ -969,114 +1169,23 @@ def get_period_counts(findings,
     accepted_in_period.append(
         ['Timestamp', 'Date', 'S0', 'S1', 'S2', 'S3', 'Total', 'Closed'])
 
-    for x in range(-1, period_interval):
-        if relative_delta == 'months':
-            # make interval the first through last of month
-            end_date = (start_date + relativedelta(months=x)) + relativedelta(
-                day=1, months=+1, days=-1)
-            new_date = (
-                start_date + relativedelta(months=x)) + relativedelta(day=1)
+    severities = ('Critical', 'High', 'Medium', 'Low')
+    for new_date, end_date in get_period_boundaries(period_interval, start_date, relative_delta):
+        period_start, period_end = new_date.date(), end_date.date()
+        if findings_closed.model is Endpoint_Status:
+            # the time range ends at the start of the last day
+            closed_in_range_count = closed_sum(None, period_start, period_end - relativedelta(days=1))
         else:
-            # week starts the monday before
-            new_date = start_date + relativedelta(weeks=x, weekday=MO(1))
-            end_date = new_date + relativedelta(weeks=1, weekday=MO(1))
-
-        try:
-            closed_in_range_count = findings_closed.filter(
-                mitigated__date__range=[new_date, end_date]).count()
-        except:
-            closed_in_range_count = findings_closed.filter(
-                mitigated_time__range=[new_date, end_date]).count()
-
-        if accepted_findings:
-            date_range = [
-                datetime(new_date.year, new_date.month, new_date.day, tzinfo=tz),
-                datetime(end_date.year, end_date.month, end_date.day, tzinfo=tz)
-            ]
-            try:
-                risks_a = accepted_findings.filter(risk_acceptance__created__date__range=date_range)
-            except:
-                risks_a = accepted_findings.filter(date__range=date_range)
-        else:
-            risks_a = None
-
-        f_crit_count, f_high_count, f_med_count, f_low_count, f_closed_count = [
-            0, 0, 0, 0, 0
-        ]
-        ra_crit_count, ra_high_count, ra_med_count, ra_low_count, ra_closed_count = [
-            0, 0, 0, 0, 0
-        ]
-        active_crit_count, active_high_count, active_med_count, active_low_count, active_closed_count = [
-            0, 0, 0, 0, 0
-        ]
-
-        for finding in findings:
-            try:
-                severity = finding.severity
-                active = finding.active
-#                risk_accepted = finding.risk_accepted TODO: in future release
-            except:
-                severity = finding.finding.severity
-                active = finding.finding.active
-#                risk_accepted = finding.finding.risk_accepted
+            closed_in_range_count = closed_sum(None, period_start, period_end)
 
-            try:
-                f_time = datetime.combine(finding.date, datetime.min.time()).replace(tzinfo=tz)
-            except:
-                f_time = finding.date
-
-            if f_time <= end_date:
-                if severity == 'Critical':
-                    if new_date <= f_time:
-                        f_crit_count += 1
-                    if active:
-                        active_crit_count += 1
-                elif severity == 'High':
-                    if new_date <= f_time:
-                        f_high_count += 1
-                    if active:
-                        active_high_count += 1
-                elif severity == 'Medium':
-                    if new_date <= f_time:
-                        f_med_count += 1
-                    if active:
-                        active_med_count += 1
-                elif severity == 'Low':
-                    if new_date <= f_time:
-                        f_low_count += 1
-                    if active:
-                        active_low_count += 1
+        opened = [opened_sum(s, period_start, period_end) for s in severities]
+        accepted = [accepted_sum(s, period_start, period_end) for s in severities]
+        active_counts = [active_sum(s, date.min, period_end) for s in severities]
 
-        if risks_a is not None:
-            for finding in risks_a:
-                try:
-                    severity = finding.severity
-                except:
-                    severity = finding.finding.severity
-                if severity == 'Critical':
-                    ra_crit_count += 1
-                elif severity == 'High':
-                    ra_high_count += 1
-                elif severity == 'Medium':
-                    ra_med_count += 1
-                elif severity == 'Low':
-                    ra_low_count += 1
-
-        total = f_crit_count + f_high_count + f_med_count + f_low_count
-        opened_in_period.append(
-            [(tcalendar.timegm(new_date.timetuple()) * 1000), new_date,
-             f_crit_count, f_high_count, f_med_count, f_low_count, total,
-             closed_in_range_count])
-
-        total = ra_crit_count + ra_high_count + ra_med_count + ra_low_count
-        accepted_in_period.append(
-            [(tcalendar.timegm(new_date.timetuple()) * 1000), new_date,
-             ra_crit_count, ra_high_count, ra_med_count, ra_low_count, total])
-
-        total = active_crit_count + active_high_count + active_med_count + active_low_count
-        active_in_period.append(
-            [(tcalendar.timegm(new_date.timetuple()) * 1000), new_date,
-             active_crit_count, active_high_count, active_med_count, active_low_count, total])
+        timestamp = tcalendar.timegm(new_date.timetuple()) * 1000
+        opened_in_period.append([timestamp, new_date] + opened + [sum(opened), closed_in_range_count])
+        accepted_in_period.append([timestamp, new_date] + accepted + [sum(accepted)])
+        active_in_period.append([timestamp, new_date] + active_counts + [sum(active_counts)])
 
     return {
         'opened_per_period': opened_in_period,
@@ -1513,8 +1622,50 @@ def get_setting(setting):
     return getattr(settings, setting)
 
 
+def get_product_grading_cache_key(product):
+    return 'dojo_product_grading_pending_%s' % (product.id if isinstance(product, Product) else product)
+
+
+def perform_product_grading(product):
+    """
+    Marks the grade of the product as outdated. The grade is recalculated by one calculate_grade task per product,
+    which is deferred by PRODUCT_GRADE_DEBOUNCE_SECONDS so all changes within that window are handled at once. The
+    pending task is tracked in the django cache, so changes from different processes only share a task when the
+    processes share the cache (DD_CACHE_URL).
+    When the task can't run in the background (sync / block_execution) the grade is calculated immediately.
+    """
+    if not product:
+        return
+    if not System_Settings.objects.get().enable_product_grade:
+        logger.debug("skipping product grading because it's disabled in system settings")
+        return
+
+    debounce_seconds = settings.PRODUCT_GRADE_DEBOUNCE_SECONDS
+    if debounce_seconds <= 0 or not we_want_async(func=calculate_grade):
+        calculate_grade(product)
+        return
+
+    # the marker expires when the task is due, changes after that schedule a new task
+    if cache.add(get_product_grading_cache_key(product), True, timeout=debounce_seconds):
+        logger.debug('scheduling product grading for %s in %ss', product, debounce_seconds)
+        calculate_grade(product, countdown=debounce_seconds)
+    else:
+        logger.debug('product grading for %s already scheduled', product)
+
+
+@functools.lru_cache(maxsize=8)
+def get_product_grade_interpreter(product_grade):
+    # the grade_product function only has to be compiled again when the product_grade system setting changes
+    aeval = Interpreter()
+    aeval(product_grade)
+    return aeval
+
+
+product_grade_lock = threading.Lock()
+
+
 @dojo_model_to_id
-@dojo_async_task
+@dojo_async_task(coalesce_key=0)
 @app.task
 @dojo_model_from_id(model=Product)
 def calculate_grade(product, *args, **kwargs):
@@ -1547,12 +1698,19 @@ def calculate_grade(product, *args, **kwargs):
                 medium = severity_count['numerical_severity__count']
             elif severity_count['severity'] == "Low":
                 low = severity_count['numerical_severity__count']
-        aeval = Interpreter()
-        aeval(system_settings.product_grade)
         grade_product = "grade_product(%s, %s, %s, %s)" % (
             critical, high, medium, low)
-        product.prod_numeric_grade = aeval(grade_product)
-        product.save()
+        # the interpreter is shared by all threads of the process
+        with product_grade_lock:
+            product.prod_numeric_grade = get_product_grade_interpreter(system_settings.product_grade)(grade_product)
+        # only the grade is saved, so the grading doesn't invalidate the cached notification recipients
+        try:
+            # in a savepoint, as the failed save marks the transaction for rollback
+            with transaction.atomic():
+                product.save(update_fields=['prod_numeric_grade', 'updated'])
+        except DatabaseError:
+            # the product has been deleted since the grading was scheduled, the save didn't update any rows
+            logger.debug('not saving the grade of product %s, it has been deleted', product.id)
 
 
 def get_celery_worker_status():
@@ -1855,6 +2013,78 @@ def queryset_check(query):
     return query if isinstance(query, QuerySet) else query.qs
 
 
+def get_sla_days_remaining(sla_days, start_date, today):
+    """The days remaining of a finding like Finding.sla_days_remaining, from the SLA days of its severity"""
+    if not sla_days:
+        # no SLA, which is notified as breaching today
+        return 0
+    if settings.SLA_BUSINESS_DAYS:
+        age = get_work_days(start_date, today)
+    else:
+        age = (today - start_date).days
+    return sla_days - (age if age > 0 else 0)
+
+
+def is_sla_notified(sla_days_remaining, exponential_backoff):
+    """Findings are notified in the pre-breach period, on the day of the breach and for some days after the breach"""
+    if sla_days_remaining < 0:
+        overdue = abs(sla_days_remaining)
+        if overdue > settings.SLA_NOTIFY_POST_BREACH:
+            return False
+        # with the exponential backoff only after 1, 2, 4, 8, ... days
+        return not exponential_backoff or overdue & (overdue - 1) == 0
+    return sla_days_remaining <= settings.SLA_NOTIFY_PRE_BREACH
+
+
+def get_sla_notification_query(start_field, sla_days, today, exponential_backoff):
+    """
+    The findings of an SLA are notified when their SLA started on one of a few days, so instead of computing the days
+    remaining of every finding, the start dates that are notified today are matched as ranges of consecutive days.
+    """
+    if not sla_days:
+        return Q()
+
+    # the age of findings that start in the future is 0
+    query = Q(**{'%s__gt' % start_field: today}) if is_sla_notified(sla_days, exponential_backoff) else Q(pk__in=[])
+    range_start = None
+    # business days make the notified start dates span more calendar days
+    for days in range((sla_days + settings.SLA_NOTIFY_POST_BREACH) * 2 + 7, -1, -1):
+        start_date = today - relativedelta(days=days)
+        if is_sla_notified(get_sla_days_remaining(sla_days, start_date, today), exponential_backoff):
+            if range_start is None:
+                range_start = start_date
+            range_end = start_date
+        elif range_start is not None:
+            query |= Q(**{'%s__range' % start_field: (range_start, range_end)})
+            range_start = None
+    if range_start is not None:
+        query |= Q(**{'%s__range' % start_field: (range_start, range_end)})
+    return query
+
+
+def get_sla_notification_findings(findings, exponential_backoff):
+    """
+    Selects the findings that are notified today from the SLA configurations of their products, annotated with the
+    SLA days of their severity and the start date of their SLA.
+    """
+    today = get_current_date()
+    severities = ('Critical', 'High', 'Medium', 'Low')
+    # like Finding._age, the age in business days doesn't use the SLA start date
+    start = F('date') if settings.SLA_BUSINESS_DAYS else Coalesce('sla_start_date', 'date')
+
+    query = Q(pk__in=[])
+    for sla_configuration in SLAConfigurationCache.get_all().values():
+        for severity in severities:
+            query |= Q(test__engagement__product__sla_configuration=sla_configuration, severity=severity) & \
+                get_sla_notification_query('sla_start', getattr(sla_configuration, severity.lower()), today, exponential_backoff)
+
+    return findings.filter(severity__in=severities).annotate(
+        sla_start=start,
+        sla_days=Case(*[When(severity=severity, then=F('test__engagement__product__sla_configuration__' + severity.lower()))
+                        for severity in severities], output_field=IntegerField()),
+    ).filter(query)
+
+
 def sla_compute_and_notify(*args, **kwargs):
     """
     The SLA computation and notification will be disabled if the user opts out
@@ -1877,7 +2107,9 @@ def sla_compute_and_notify(*args, **kwargs):
 
             if do_jira_sla_comment:
                 logger.info("Creating JIRA comment to notify of SLA breach information.")
-                jira_helper.add_simple_jira_comment(jira_instance, jira_issue, title)
+                if jira_instance.id not in jira_connections:
+                    jira_connections[jira_instance.id] = jira_helper.get_jira_connection(jira_instance)
+                jira_helper.add_simple_jira_comment(jira_instance, jira_issue, title, jira=jira_connections[jira_instance.id])
 
     # exit early on flags
     system_settings = System_Settings.objects.get()
@@ -1905,100 +2137,82 @@ def sla_compute_and_notify(*args, **kwargs):
                 query = Q(active=True, is_mitigated=False, duplicate=False)
             logger.debug("My query: {}".format(query))
 
-            no_jira_findings = {}
+            findings = Finding.objects.filter(query)
             if system_settings.enable_notify_sla_jira_only:
                 logger.debug("Ignoring findings that are not linked to a JIRA issue")
-                no_jira_findings = Finding.objects.exclude(jira_issue__isnull=False)
+                findings = findings.filter(jira_issue__isnull=False)
 
-            total_count = 0
             pre_breach_count = 0
             post_breach_count = 0
-            post_breach_no_notify_count = 0
             jira_count = 0
             at_breach_count = 0
 
-            # Taking away for now, since the prefetch is not efficient
-            # .select_related('jira_issue') \
-            # .prefetch_related(Prefetch('test__engagement__product__jira_project_set__jira_instance')) \
             # A finding with 'Info' severity will not be considered for SLA notifications (not in model)
-            findings = Finding.objects \
-                .filter(query) \
-                .exclude(severity='Info') \
-                .exclude(id__in=no_jira_findings)
-
-            for finding in findings:
-                total_count += 1
-                sla_age = finding.sla_days_remaining()
-                # if SLA is set to 0 in settings, it's a null. And setting at 0 means no SLA apparently.
-                if sla_age is None:
-                    sla_age = 0
-
-                if (sla_age < 0) and (settings.SLA_NOTIFY_POST_BREACH < abs(sla_age)):
-                    post_breach_no_notify_count += 1
-                    # Skip finding notification if breached for too long
-                    logger.debug("Finding {} breached the SLA {} days ago. Skipping notifications.".format(finding.id, abs(sla_age)))
-                    continue
-
-                do_jira_sla_comment = False
-                jira_issue = None
-                if finding.has_jira_issue:
-                    jira_issue = finding.jira_issue
-                elif finding.has_jira_group_issue:
-                    jira_issue = finding.finding_group.jira_issue
-
-                if jira_issue:
-                    jira_count += 1
-                    jira_instance = jira_helper.get_jira_instance(finding)
-                    if jira_instance is not None:
-                        logger.debug("JIRA config for finding is {}".format(jira_instance))
-                        # global config or product config set, product level takes precedence
-                        try:
-                            # TODO: see new property from #2649 to then replace, somehow not working with prefetching though.
-                            product_jira_sla_comment_enabled = jira_helper.get_jira_project(finding).product_jira_sla_notification
-                        except Exception as e:
-                            logger.error("The product is not linked to a JIRA configuration! Something is weird here.")
-                            logger.error("Error is: {}".format(e))
-
-                        jiraconfig_sla_notification_enabled = jira_instance.global_jira_sla_notification
-
-                        if jiraconfig_sla_notification_enabled or product_jira_sla_comment_enabled:
-                            logger.debug("Global setting {} -- Product setting {}".format(
-                                jiraconfig_sla_notification_enabled,
-                                product_jira_sla_comment_enabled
-                            ))
-                            do_jira_sla_comment = True
-                            logger.debug("JIRA issue is {}".format(jira_issue.jira_key))
-
-                logger.debug("Finding {} has {} days left to breach SLA.".format(finding.id, sla_age))
-                if (sla_age < 0):
-                    post_breach_count += 1
-                    logger.info("Finding {} has breached by {} days.".format(finding.id, abs(sla_age)))
-                    abs_sla_age = abs(sla_age)
-                    if not system_settings.enable_notify_sla_exponential_backoff or abs_sla_age == 1 or (abs_sla_age & (abs_sla_age - 1) == 0):
+            # The findings are notified per product, so that the JIRA configuration is resolved once per engagement
+            findings = get_sla_notification_findings(findings, system_settings.enable_notify_sla_exponential_backoff) \
+                .select_related('test__engagement__product') \
+                .order_by('test__engagement__product', 'test__engagement', 'id')
+
+            today = get_current_date()
+            jira_projects = {}
+            jira_connections = {}
+            # the notifications of all findings are sent per channel and user at the end of the run
+            with batch_notifications():
+                for finding in findings:
+                    sla_age = get_sla_days_remaining(finding.sla_days, finding.sla_start, today)
+
+                    do_jira_sla_comment = False
+                    jira_issue = None
+                    if finding.has_jira_issue:
+                        jira_issue = finding.jira_issue
+                    elif finding.has_jira_group_issue:
+                        jira_issue = finding.finding_group.jira_issue
+
+                    if jira_issue:
+                        jira_count += 1
+                        if finding.test.engagement_id not in jira_projects:
+                            jira_projects[finding.test.engagement_id] = jira_helper.get_jira_project(finding)
+                        jira_project = jira_projects[finding.test.engagement_id]
+                        jira_instance = jira_project.jira_instance if jira_project else None
+                        if jira_instance is not None:
+                            logger.debug("JIRA config for finding is {}".format(jira_instance))
+                            # global config or product config set, product level takes precedence
+                            product_jira_sla_comment_enabled = jira_project.product_jira_sla_notification
+                            jiraconfig_sla_notification_enabled = jira_instance.global_jira_sla_notification
+
+                            if jiraconfig_sla_notification_enabled or product_jira_sla_comment_enabled:
+                                logger.debug("Global setting {} -- Product setting {}".format(
+                                    jiraconfig_sla_notification_enabled,
+                                    product_jira_sla_comment_enabled
+                                ))
+                                do_jira_sla_comment = True
+                                logger.debug("JIRA issue is {}".format(jira_issue.jira_key))
+
+                    logger.debug("Finding {} has {} days left to breach SLA.".format(finding.id, sla_age))
+                    if (sla_age < 0):
+                        post_breach_count += 1
+                        logger.info("Finding {} has breached by {} days.".format(finding.id, abs(sla_age)))
+                        abs_sla_age = abs(sla_age)
                         period = "day"
                         if abs_sla_age > 1:
                             period = "days"
                         _notify(finding, 'Finding {} - SLA breached by {} {}! Overdue notice'.format(finding.id, abs_sla_age, period))
+                    # The finding is within the pre-breach period
+                    elif (sla_age > 0):
+                        pre_breach_count += 1
+                        logger.info("Security SLA pre-breach warning for finding ID {}. Days remaining: {}".format(finding.id, sla_age))
+                        _notify(finding, 'Finding {} - SLA pre-breach warning - {} day(s) left'.format(finding.id, sla_age))
+                    # The finding breaches the SLA today
                     else:
-                        logger.info("Skipping notification as exponential backoff is enabled and the SLA is not a power of two")
-                # The finding is within the pre-breach period
-                elif (sla_age > 0) and (sla_age <= settings.SLA_NOTIFY_PRE_BREACH):
-                    pre_breach_count += 1
-                    logger.info("Security SLA pre-breach warning for finding ID {}. Days remaining: {}".format(finding.id, sla_age))
-                    _notify(finding, 'Finding {} - SLA pre-breach warning - {} day(s) left'.format(finding.id, sla_age))
-                # The finding breaches the SLA today
-                elif (sla_age == 0):
-                    at_breach_count += 1
-                    logger.info("Security SLA breach warning. Finding ID {} breaching today ({})".format(finding.id, sla_age))
-                    _notify(finding, "Finding {} - SLA is breaching today".format(finding.id))
-
-            logger.info("SLA run results: Pre-breach: {}, at-breach: {}, post-breach: {}, post-breach-no-notify: {}, with-jira: {}, TOTAL: {}".format(
+                        at_breach_count += 1
+                        logger.info("Security SLA breach warning. Finding ID {} breaching today ({})".format(finding.id, sla_age))
+                        _notify(finding, "Finding {} - SLA is breaching today".format(finding.id))
+
+            logger.info("SLA run results: Pre-breach: {}, at-breach: {}, post-breach: {}, with-jira: {}".format(
                 pre_breach_count,
                 at_breach_count,
                 post_breach_count,
-                post_breach_no_notify_count,
                 jira_count,
-                total_count
             ))
 
     except System_Settings.DoesNotExist:
@@ -2249,6 +2463,13 @@ def is_finding_groups_enabled():
 
 
 class async_delete():
+    """
+    Deletes a product type, product, engagement or test in the background, bottom up so a single delete doesn't have to
+    collect the whole tree at once. The plan is the list of models below the object in the mapping, it is counted once
+    when the job starts. Per step the objects are deleted in batches of ASYNC_OBEJECT_DELETE_CHUNK_SIZE ordered by id and
+    the progress is saved in an Async_Delete_Job with each batch, so resume_async_delete_jobs can continue a deletion
+    interrupted by a restart of the worker.
+    """
     def __init__(self, *args, **kwargs):
         self.mapping = {
             'Product_Type': [
@@ -2267,55 +2488,81 @@ class async_delete():
                 (Test, 'engagement')],
             'Test': [(Finding, 'test')]
         }
+        self.models = {'Product_Type': Product_Type, 'Product': Product, 'Engagement': Engagement, 'Test': Test}
 
-    @dojo_async_task
-    @app.task
-    def delete_chunk(self, objects, **kwargs):
-        for object in objects:
-            try:
-                object.delete()
-            except AssertionError:
-                logger.debug('ASYNC_DELETE: object has already been deleted elsewhere. Skipping')
-                # The id must be None
-                # The object has already been deleted elsewhere
-                pass
-
-    @dojo_async_task
-    @app.task
     def delete(self, object, **kwargs):
         logger.debug('ASYNC_DELETE: Deleting ' + self.get_object_name(object) + ': ' + str(object))
-        model_list = self.mapping.get(self.get_object_name(object), None)
-        if model_list:
-            # The object to be deleted was found in the object list
-            self.crawl(object, model_list)
-        else:
+        if self.get_object_name(object) not in self.mapping:
             # The object is not supported in async delete, delete normally
             logger.debug('ASYNC_DELETE: ' + self.get_object_name(object) + ' async delete not supported. Deleteing normally: ' + str(object))
             object.delete()
+            return None
 
-    @dojo_async_task
-    @app.task
-    def crawl(self, object, model_list, **kwargs):
-        logger.debug('ASYNC_DELETE: Crawling ' + self.get_object_name(object) + ': ' + str(object))
-        for model_info in model_list:
-            model = model_info[0]
-            model_query = model_info[1]
-            filter_dict = {model_query: object}
-            objects_to_delete = model.objects.filter(**filter_dict)
-            logger.debug('ASYNC_DELETE: Deleting ' + str(len(objects_to_delete)) + ' ' + self.get_object_name(model) + 's in chunks')
-            chunks = self.chunk_list(model, objects_to_delete)
-            for chunk in chunks:
-                print('deleting', len(chunk), self.get_object_name(model))
-                self.delete_chunk(chunk)
-        self.delete_chunk([object])
-        logger.debug('ASYNC_DELETE: Successfully deleted ' + self.get_object_name(object) + ': ' + str(object))
-
-    def chunk_list(self, model, list):
-        chunk_size = get_setting("ASYNC_OBEJECT_DELETE_CHUNK_SIZE")
-        # Break the list of objects into "chunk_size" lists
-        chunk_list = [list[i:i + chunk_size] for i in range(0, len(list), chunk_size)]
-        logger.debug('ASYNC_DELETE: Split ' + self.get_object_name(model) + ' into ' + str(len(chunk_list)) + ' chunks of ' + str(chunk_size))
-        return chunk_list
+        job = Async_Delete_Job.objects.create(object_model=self.get_object_name(object), object_id=object.id,
+                                              object_name=str(object)[:1000], user_id=getattr(get_current_user(), 'id', None))
+        # start the job once the object is committed as being deleted, otherwise the worker may not see the job
+        transaction.on_commit(lambda: run_async_delete_job(job.id))
+        return job
+
+    def run(self, job_id):
+        logger.debug('ASYNC_DELETE: Running job %d', job_id)
+        while self.delete_batch(job_id):
+            pass
+
+    def get_queryset(self, job, step):
+        model, model_query = self.mapping[job.object_model][step]
+        return model.objects.filter(**{model_query: job.object_id})
+
+    def plan(self, job):
+        job.total = sum(self.get_queryset(job, step).count() for step in range(len(self.mapping[job.object_model]))) + 1
+        job.status = Async_Delete_Job.RUNNING
+        # the duplicate loops are fixed for the whole database, so once for all batches of findings
+        import dojo.finding.helper as finding_helper
+        finding_helper.fix_loop_duplicates()
+        logger.debug('ASYNC_DELETE: Planned deletion of %d objects for %s %d', job.total, job.object_model, job.object_id)
+
+    def delete_batch(self, job_id):
+        """Deletes the next batch of the job, returns False when the job is finished"""
+        from dojo.metrics.helper import defer_metrics_rollup
+        # the rollup is updated once per batch instead of for every deleted finding
+        with defer_metrics_rollup(), transaction.atomic():
+            # the lock makes a job that is resumed while it's still running wait for the current batch
+            job = Async_Delete_Job.objects.select_for_update().get(id=job_id)
+            if job.status in (Async_Delete_Job.DONE, Async_Delete_Job.FAILED):
+                return False
+            if job.total is None:
+                self.plan(job)
+
+            model_list = self.mapping[job.object_model]
+            if job.step < len(model_list):
+                ids = list(self.get_queryset(job, job.step).filter(id__gt=job.last_id).order_by('id')
+                           .values_list('id', flat=True)[:get_setting('ASYNC_OBEJECT_DELETE_CHUNK_SIZE')])
+                if ids:
+                    self.delete_objects(job, ids)
+                    job.last_id = ids[-1]
+                    job.deleted += len(ids)
+                else:
+                    job.step += 1
+                    job.last_id = 0
+            else:
+                # the object itself is deleted normally, to update the product grade and such
+                object = self.models[job.object_model].objects.filter(id=job.object_id).first()
+                if object:
+                    object.delete()
+                job.deleted += 1
+                job.status = Async_Delete_Job.DONE
+                logger.debug('ASYNC_DELETE: Successfully deleted ' + job.object_model + ': ' + job.object_name)
+            job.save()
+        return job.status != Async_Delete_Job.DONE
+
+    def delete_objects(self, job, ids):
+        model = self.mapping[job.object_model][job.step][0]
+        logger.debug('ASYNC_DELETE: Deleting %d %ss', len(ids), self.get_object_name(model))
+        if model is Finding:
+            # only the clusters of the originals in this batch, the duplicates within the object are reset
+            import dojo.finding.helper as finding_helper
+            finding_helper.prepare_duplicates_for_delete(findings=self.get_queryset(job, job.step), finding_ids=ids, fix_loops=False)
+        model.objects.filter(id__in=ids).delete()
 
     def get_object_name(self, object):
         if object.__class__.__name__ == 'ModelBase':
@@ -2323,6 +2570,17 @@ class async_delete():
         return object.__class__.__name__
 
 
+@dojo_async_task
+@app.task
+def run_async_delete_job(job_id, *args, **kwargs):
+    try:
+        async_delete().run(job_id)
+    except Exception as e:
+        # the failed batch has been rolled back, the objects deleted so far stay deleted
+        logger.exception('ASYNC_DELETE: job %d failed', job_id)
+        Async_Delete_Job.objects.filter(id=job_id).update(status=Async_Delete_Job.FAILED, error=str(e))
+
+
 @receiver(user_logged_in)
 def log_user_login(sender, request, user, **kwargs):
     # to cover more complex cases:
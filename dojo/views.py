@@ -4,13 +4,13 @@ from auditlog.models import LogEntry
 from django.contrib.contenttypes.models import ContentType
 from django.contrib import messages
 from django.core.exceptions import PermissionDenied, ObjectDoesNotExist
-from django.http import Http404, HttpResponseRedirect, FileResponse
+from django.http import Http404, HttpResponseRedirect, FileResponse, JsonResponse
 from django.conf import settings
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.views.static import serve
 from django.shortcuts import render, get_object_or_404
-from dojo.models import Engagement, Test, Finding, Endpoint, Product, FileUpload
+from dojo.models import Async_Delete_Job, Engagement, Test, Finding, Endpoint, Product, FileUpload
 from dojo.filters import LogEntryFilter
 from dojo.forms import ManageFileFormSet
 from dojo.utils import get_page_items, Product_Tab, get_system_setting
@@ -184,6 +184,21 @@ def manage_files(request, oid, obj_type):
         })
 
 
+def async_delete_job_status(request, job_id):
+    job = get_object_or_404(Async_Delete_Job, id=job_id)
+    # the object is gone once the job is done, so only the user who deleted it can follow the progress
+    if job.user_id != request.user.id and not request.user.is_superuser:
+        raise PermissionDenied()
+    return JsonResponse({
+        'job_id': job.id,
+        'object': '%s %s' % (job.object_model, job.object_name),
+        'status': job.status,
+        'deleted': job.deleted,
+        'total': job.total,
+        'error': job.error,
+    })
+
+
 # Serve the file only after verifying the user is supposed to see the file
 @login_required
 def protected_serve(request, path, document_root=None, show_indexes=False):
@@ -61,3 +61,10 @@ if os.environ.get("DD_DEBUG") == "True" and not os.getenv("RUN_MAIN") and is_deb
 from django.core.wsgi import get_wsgi_application
 
 application = get_wsgi_application()
+
+# load the active scan types at startup instead of on the first import request, the database connection
+# is closed afterwards so it isn't shared with the workers forked from this process
+from dojo.tools.factory import ParserActivationCache  # noqa: E402
+from django.db import connections  # noqa: E402
+ParserActivationCache.warm()
+connections.close_all()
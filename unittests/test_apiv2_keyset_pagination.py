@@ -0,0 +1,66 @@
+import datetime
+
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from dojo.models import Endpoint, Finding
+
+
+class KeysetPaginationTest(APITestCase):
+    """
+    Test the cursor mode of the pagination of the APIv2 list endpoints.
+    """
+    fixtures = ['dojo_testdata.json']
+
+    def setUp(self):
+        token = Token.objects.get(user__username='admin')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(200, response.status_code, response.content[:1000])
+            self.assertNotIn('count', response.json())
+            ids += [result['id'] for result in response.json()['results']]
+            url = response.json()['next']
+        return ids
+
+    def test_walk_findings(self):
+        ids = self.walk(reverse('finding-list') + '?cursor=0&limit=3')
+        self.assertEqual(list(Finding.objects.order_by('id').values_list('id', flat=True)), ids)
+
+        # filters still apply
+        ids = self.walk(reverse('finding-list') + '?cursor=0&limit=2&severity=High')
+        self.assertEqual(list(Finding.objects.filter(severity='High').order_by('id').values_list('id', flat=True)), ids)
+
+    def test_walk_endpoints(self):
+        ids = self.walk(reverse('endpoint-list') + '?cursor=0&limit=2')
+        self.assertEqual(list(Endpoint.objects.order_by('id').values_list('id', flat=True)), ids)
+
+    def test_next_page_starts_after_cursor(self):
+        finding_ids = list(Finding.objects.order_by('id').values_list('id', flat=True))
+        response = self.client.get(reverse('finding-list'), {'cursor': finding_ids[2], 'limit': 2})
+        self.assertEqual(finding_ids[3:5], [result['id'] for result in response.json()['results']])
+        self.assertIn('cursor=%d' % finding_ids[4], response.json()['next'])
+
+    def test_updated_since(self):
+        now = timezone.now()
+        Finding.objects.update(last_status_update=now - datetime.timedelta(days=10))
+        Finding.objects.filter(id__in=[3, 7]).update(last_status_update=now)
+
+        since = (now - datetime.timedelta(days=1)).isoformat()
+        self.assertEqual([3, 7], self.walk(reverse('finding-list') + '?' + 'cursor=0&updated_since=' + since.replace('+', '%2B')))
+
+        response = self.client.get(reverse('endpoint-list'), {'cursor': 0, 'updated_since': since})
+        self.assertEqual(400, response.status_code)
+        response = self.client.get(reverse('finding-list'), {'cursor': 0, 'updated_since': 'yesterday'})
+        self.assertEqual(400, response.status_code)
+
+    def test_offset_pagination_is_default(self):
+        response = self.client.get(reverse('finding-list'), {'limit': 2, 'offset': 2})
+        self.assertEqual(Finding.objects.count(), response.json()['count'])
+        self.assertEqual(2, len(response.json()['results']))
@@ -0,0 +1,50 @@
+from unittest.mock import patch
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from dojo.api_v2.serializers import TestSerializer
+from dojo.models import Finding
+
+
+class PrefetchTest(APITestCase):
+    """
+    Test that the prefetch parameter of the APIv2 fetches the related objects of a page at once.
+    """
+    fixtures = ['dojo_testdata.json']
+
+    def setUp(self):
+        token = Token.objects.get(user__username='admin')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+    def test_list_prefetch_once_per_relation(self):
+        findings = Finding.objects.select_related('test__engagement')
+        test_ids = {finding.test_id for finding in findings}
+        engagement_ids = {finding.test.engagement_id for finding in findings}
+
+        to_representation = TestSerializer.to_representation
+        with CaptureQueriesContext(connection) as queries, \
+                patch.object(TestSerializer, 'to_representation', autospec=True, side_effect=to_representation) as serialize:
+            response = self.client.get(reverse('finding-list'), {'limit': 100, 'fields': 'test',
+                                                                 'prefetch': 'test,test__engagement,reviewers'})
+        self.assertEqual(200, response.status_code, response.content[:1000])
+
+        prefetch = response.json()['prefetch']
+        self.assertEqual(test_ids, {int(id) for id in prefetch['test']})
+        self.assertEqual(engagement_ids, {int(id) for id in prefetch['test__engagement']})
+        self.assertEqual(len(test_ids), serialize.call_count)
+
+        sql = [query['sql'] for query in queries.captured_queries]
+        self.assertEqual(1, len([query for query in sql if 'FROM "dojo_test" ' in query]))
+        self.assertEqual(1, len([query for query in sql if 'FROM "dojo_engagement" ' in query]))
+
+    def test_retrieve_prefetch(self):
+        finding = Finding.objects.get(id=2)
+        response = self.client.get(reverse('finding-detail', args=(finding.id,)), {'prefetch': 'test,test__engagement'})
+        self.assertEqual(200, response.status_code, response.content[:1000])
+        self.assertEqual([str(finding.test_id)], list(response.json()['prefetch']['test']))
+        self.assertEqual([str(finding.test.engagement_id)], list(response.json()['prefetch']['test__engagement']))
@@ -0,0 +1,81 @@
+from unittest.mock import patch
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from dojo.api_v2.mixins import SparseFieldsetMixin
+from dojo.models import Finding
+
+
+class SparseFieldsetsTest(APITestCase):
+    """
+    Test the fields= and omit= parameters of the findings API.
+    """
+    fixtures = ['dojo_testdata.json']
+
+    def setUp(self):
+        token = Token.objects.get(user__username='admin')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+    def get(self, url, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(200, response.status_code, response.content[:1000])
+        return response.json(), [query['sql'] for query in queries.captured_queries]
+
+    def test_fields(self):
+        full, full_queries = self.get(reverse('finding-list'), {'limit': 100})
+        sparse, sparse_queries = self.get(reverse('finding-list'), {'limit': 100, 'fields': 'severity,title'})
+
+        self.assertEqual(Finding.objects.count(), len(sparse['results']))
+        for full_result, sparse_result in zip(full['results'], sparse['results']):
+            self.assertEqual({'id', 'severity', 'title'}, set(sparse_result))
+            self.assertEqual({key: full_result[key] for key in sparse_result}, sparse_result)
+
+        # none of the relations are prefetched and the large columns are not loaded
+        self.assertLess(len(sparse_queries), len(full_queries))
+        self.assertFalse([query for query in sparse_queries if 'dojo_notes' in query or 'dojo_test' in query])
+        self.assertFalse([query for query in sparse_queries if '"description"' in query])
+
+    def test_fields_with_relations(self):
+        response, queries = self.get(reverse('finding-list'), {'limit': 100, 'fields': 'notes,sla_days_remaining'})
+        for result in response['results']:
+            self.assertEqual({'id', 'notes', 'sla_days_remaining'}, set(result))
+        self.assertTrue([query for query in queries if 'dojo_notes' in query])
+
+    def test_sla_days_remaining(self):
+        full, _ = self.get(reverse('finding-list'), {'limit': 100})
+        sparse, queries = self.get(reverse('finding-list'), {'limit': 100, 'fields': 'sla_days_remaining'})
+        self.assertEqual([{'id': result['id'], 'sla_days_remaining': result['sla_days_remaining']} for result in full['results']],
+                         sparse['results'])
+        # the SLA configuration is annotated, the tests, engagements and products are not loaded
+        self.assertFalse([query for query in queries if query.startswith('SELECT') and ' FROM "dojo_product"' in query])
+        self.assertFalse([query for query in queries if ' FROM "dojo_test" ' in query])
+
+    def test_all_fields(self):
+        full, full_queries = self.get(reverse('finding-list'), {'limit': 100})
+        # every prefetch of the full response is needed by one of the fields
+        sparse, sparse_queries = self.get(reverse('finding-list'), {'limit': 100, 'fields': ','.join(full['results'][0])})
+        self.assertEqual(full['results'], sparse['results'])
+        self.assertEqual(len(full_queries), len(sparse_queries))
+
+    def test_fieldset_parsed_once(self):
+        with patch.object(SparseFieldsetMixin, 'parse_sparse_fieldset', autospec=True,
+                          side_effect=SparseFieldsetMixin.parse_sparse_fieldset) as parse:
+            self.get(reverse('finding-list'), {'limit': 100, 'fields': 'severity,title'})
+        parse.assert_called_once()
+
+    def test_omit(self):
+        full, _ = self.get(reverse('finding-detail', args=(2,)), {})
+        sparse, _ = self.get(reverse('finding-detail', args=(2,)), {'omit': 'description,notes,related_fields'})
+        self.assertEqual(set(full) - {'description', 'notes', 'related_fields'}, set(sparse))
+        self.assertEqual({key: full[key] for key in sparse}, sparse)
+
+    def test_unknown_field(self):
+        response = self.client.get(reverse('finding-list'), {'fields': 'severity,unknown'})
+        self.assertEqual(400, response.status_code)
+        self.assertIn('unknown', response.json()['fields'])
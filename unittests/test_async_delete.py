@@ -0,0 +1,109 @@
+import datetime
+from unittest.mock import patch
+
+import crum
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from dojo.models import Async_Delete_Job, Endpoint, Engagement, Finding, Product, User
+from dojo.tasks import resume_async_delete_jobs
+from dojo.utils import async_delete
+from .dojo_test_case import DojoTestCase
+
+
+@override_settings(ASYNC_OBJECT_DELETE=True, ASYNC_OBEJECT_DELETE_CHUNK_SIZE=2)
+class TestAsyncDelete(DojoTestCase):
+    fixtures = ['dojo_testdata.json']
+
+    def setUp(self):
+        self.user = User.objects.get(username='admin')
+        # run the deletion in the foreground
+        self.user.usercontactinfo.block_execution = True
+        self.user.usercontactinfo.save()
+        crum.set_current_user(self.user)
+        # False instead of None, crum would otherwise return None instead of the user of later requests
+        self.addCleanup(crum.set_current_user, False)
+
+    def delete(self, object):
+        with self.captureOnCommitCallbacks(execute=True):
+            return async_delete().delete(object)
+
+    def test_delete_engagement(self):
+        engagement = Engagement.objects.get(id=1)
+        finding_ids = list(Finding.objects.filter(test__engagement=engagement).values_list('id', flat=True))
+        # a duplicate outside the engagement of an original inside it
+        Finding.objects.filter(id=23).update(duplicate_finding_id=2)
+
+        job = self.delete(engagement)
+
+        job.refresh_from_db()
+        self.assertEqual(Async_Delete_Job.DONE, job.status)
+        # the findings, the tests 3 and 14 and the engagement
+        self.assertEqual((len(finding_ids) + 3, len(finding_ids) + 3), (job.total, job.deleted))
+        self.assertFalse(Engagement.objects.filter(id=1).exists())
+        self.assertFalse(Finding.objects.filter(id__in=finding_ids).exists())
+        # the duplicate outside is the new original
+        finding = Finding.objects.get(id=23)
+        self.assertEqual((False, None), (finding.duplicate, finding.duplicate_finding_id))
+        self.assertEqual(22, Finding.objects.get(id=24).duplicate_finding_id)
+
+    def test_delete_product(self):
+        with patch('dojo.finding.helper.fix_loop_duplicates') as fix_loop_duplicates:
+            job = self.delete(Product.objects.get(id=2))
+
+        job.refresh_from_db()
+        self.assertEqual(Async_Delete_Job.DONE, job.status)
+        # once when the job is planned, not for every batch of findings
+        self.assertGreater(job.total, 2 * 2)
+        fix_loop_duplicates.assert_called_once()
+        self.assertFalse(Product.objects.filter(id=2).exists())
+        self.assertFalse(Endpoint.objects.filter(product_id=2).exists())
+        self.assertFalse(Finding.objects.filter(test__engagement__product_id=2).exists())
+        self.assertTrue(Finding.objects.filter(test__engagement__product_id=1).exists())
+
+    def test_resume_interrupted_delete(self):
+        self.user.usercontactinfo.block_execution = False
+        self.user.usercontactinfo.save()
+        engagement = Engagement.objects.get(id=1)
+        job = Async_Delete_Job.objects.create(object_model='Engagement', object_id=engagement.id, object_name=str(engagement))
+
+        # the worker stops after two batches of findings
+        for _i in range(2):
+            async_delete().delete_batch(job.id)
+        job.refresh_from_db()
+        self.assertEqual((Async_Delete_Job.RUNNING, 0, 4), (job.status, job.step, job.deleted))
+        self.assertEqual(2, Finding.objects.filter(test__engagement=engagement).count())
+        self.assertEqual([6, 7], sorted(Finding.objects.filter(test__engagement=engagement).values_list('id', flat=True)))
+
+        # jobs that are still making progress aren't resumed
+        resume_async_delete_jobs()
+        self.assertEqual(2, Finding.objects.filter(test__engagement=engagement).count())
+
+        Async_Delete_Job.objects.filter(id=job.id).update(updated=timezone.now() - datetime.timedelta(hours=1))
+        self.user.usercontactinfo.block_execution = True
+        self.user.usercontactinfo.save()
+        resume_async_delete_jobs()
+        job.refresh_from_db()
+        self.assertEqual(Async_Delete_Job.DONE, job.status)
+        self.assertFalse(Engagement.objects.filter(id=1).exists())
+
+    def test_delete_job_status(self):
+        client = Client()
+        client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/test/3/delete', {'id': 3})
+        job = Async_Delete_Job.objects.get(object_model='Test', object_id=3)
+        messages = [str(message) for message in response.wsgi_request._messages]
+        self.assertTrue(any('/delete/job/%d' % job.id in message for message in messages), messages)
+        self.assertEqual(Async_Delete_Job.PENDING, job.status)
+
+        # the job is started after the request, without a user blocking execution
+        async_delete().run(job.id)
+        job.refresh_from_db()
+
+        response = client.get('/delete/job/%d' % job.id)
+        self.assertEqual({'job_id': job.id, 'object': 'Test ' + job.object_name, 'status': 'done', 'deleted': job.total,
+                          'total': job.total, 'error': None}, response.json())
+
+        client.force_login(User.objects.exclude(is_superuser=True).first())
+        self.assertEqual(403, client.get('/delete/job/%d' % job.id).status_code)
@@ -0,0 +1,64 @@
+from unittest.mock import patch
+
+from celery.app.task import Task
+from django.db import transaction
+from django.test import override_settings
+
+from dojo.decorators import coalesce_async_tasks, coalesced_task_counts
+from dojo.models import Product
+from dojo.utils import calculate_grade
+from .dojo_test_case import DojoTestCase
+
+
+@override_settings(ASYNC_TASK_COALESCING=True)
+class TestAsyncTaskCoalescing(DojoTestCase):
+    fixtures = ['dojo_testdata.json']
+
+    def setUp(self):
+        self.product1, self.product2 = Product.objects.get(id=1), Product.objects.get(id=2)
+        patcher = patch.object(Task, 'apply_async')
+        self.apply_async = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_submitted_products(self):
+        return sorted(call.kwargs['args'][0] for call in self.apply_async.call_args_list)
+
+    def test_calls_are_coalesced_in_block(self):
+        calls, submitted = coalesced_task_counts['dojo.utils.calculate_grade.calls'], coalesced_task_counts['dojo.utils.calculate_grade.submitted']
+        with self.captureOnCommitCallbacks(execute=True):
+            with coalesce_async_tasks():
+                for product in [self.product1, self.product2, self.product1, self.product1]:
+                    calculate_grade(product)
+                self.apply_async.assert_not_called()
+
+        self.assertEqual([1, 2], self.get_submitted_products())
+        self.assertEqual(calls + 4, coalesced_task_counts['dojo.utils.calculate_grade.calls'])
+        self.assertEqual(submitted + 2, coalesced_task_counts['dojo.utils.calculate_grade.submitted'])
+
+    def test_calls_are_coalesced_until_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            calculate_grade(self.product1)
+            calculate_grade(self.product1, countdown=10)
+            self.apply_async.assert_not_called()
+
+        self.apply_async.assert_called_once()
+        self.assertEqual(10, self.apply_async.call_args.kwargs['countdown'])
+
+    def test_rolled_back_calls_are_discarded(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    calculate_grade(self.product1)
+                    raise ValueError()
+            except ValueError:
+                pass
+            calculate_grade(self.product2)
+
+        self.assertEqual([2], self.get_submitted_products())
+
+    @override_settings(ASYNC_TASK_COALESCING=False)
+    def test_coalescing_disabled(self):
+        with coalesce_async_tasks():
+            calculate_grade(self.product1)
+            calculate_grade(self.product1)
+        self.assertEqual([1, 1], self.get_submitted_products())
@@ -0,0 +1,48 @@
+from django.test import override_settings
+from prometheus_client import REGISTRY
+
+from dojo.celery import app, get_task_routing_class, route_task
+from .dojo_test_case import DojoTestCase
+
+# the tasks that stay on the default queue
+UNROUTED_TASKS = ['dojo.celery.debug_task', 'dojo.importers.utils.update_test_progress', 'dojo.tasks.celery_status',
+                  'dojo.utils.crawl']
+
+
+class TestCeleryRouting(DojoTestCase):
+
+    def test_all_tasks_have_a_routing_class(self):
+        app.loader.import_default_modules()
+        tasks = [name for name in app.tasks if name.startswith('dojo.') and name not in UNROUTED_TASKS]
+        self.assertEqual([], [name for name in tasks if get_task_routing_class(name) is None])
+
+    @override_settings(CELERY_ROUTED_TASK_CLASSES=['import', 'notification'])
+    def test_route_task(self):
+        self.assertEqual({'queue': 'import'}, route_task('dojo.importers.reimporter.reimporter.process_parsed_findings', [], {}, {}))
+        self.assertEqual({'queue': 'notification'}, route_task('dojo.notifications.helper.send_mail_notification', [], {}, {}))
+        # the classes that aren't selected and unclassified tasks stay on the default queue
+        self.assertIsNone(route_task('dojo.jira_link.helper.update_jira_issue_for_finding', [], {}, {}))
+        self.assertIsNone(route_task('dojo.importers.utils.update_test_progress', [], {}, {}))
+
+    def test_no_routing_by_default(self):
+        self.assertIsNone(route_task('dojo.notifications.helper.send_mail_notification', [], {}, {}))
+
+
+class TestCeleryTaskMetrics(DojoTestCase):
+    fixtures = ['dojo_testdata.json']
+
+    def get_sample_value(self, name, labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    @override_settings(DJANGO_METRICS_ENABLED=True)
+    def test_task_metrics(self):
+        task = app.tasks['dojo.utils.calculate_grade']
+        runtime_labels = {'task': task.name, 'queue': 'celery', 'state': 'SUCCESS'}
+        query_labels = {'task': task.name, 'queue': 'celery'}
+        count = self.get_sample_value('dojo_celery_task_runtime_seconds_count', runtime_labels)
+        queries = self.get_sample_value('dojo_celery_task_queries_sum', query_labels)
+
+        task.apply(args=[1])
+
+        self.assertEqual(count + 1, self.get_sample_value('dojo_celery_task_runtime_seconds_count', runtime_labels))
+        self.assertGreater(self.get_sample_value('dojo_celery_task_queries_sum', query_labels), queries)
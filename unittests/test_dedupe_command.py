@@ -0,0 +1,40 @@
+from django.core.management import call_command
+from django.test import override_settings
+from dojo.finding.helper import bulk_update_hash_codes
+from dojo.management.commands.dedupe import split_id_range
+from dojo.models import Finding, Vulnerability_Id
+from .dojo_test_case import DojoTestCase
+
+
+class TestDedupeCommand(DojoTestCase):
+    fixtures = ['dojo_testdata.json']
+
+    def setUp(self):
+        finding = Finding.objects.filter(test__test_type__name='ZAP Scan').first()
+        Vulnerability_Id.objects.create(finding=finding, vulnerability_id='CVE-2021-1234')
+        Vulnerability_Id.objects.create(finding=finding, vulnerability_id='CVE-2020-1234')
+
+    @override_settings(HASHCODE_FIELDS_PER_SCANNER={
+        'ZAP Scan': ['title', 'cwe', 'endpoints', 'vulnerability_ids'],
+        'Checkmarx Scan detailed': ['title', 'file_path', 'line'],
+        'Veracode Scan': ['title', 'vulnerability_ids', 'severity'],
+    })
+    def test_hash_code_only(self):
+        Finding.objects.update(hash_code='outdated')
+
+        call_command('dedupe', '--hash_code_only')
+
+        for finding in Finding.objects.all():
+            self.assertNotEqual('outdated', finding.hash_code)
+            self.assertEqual(finding.compute_hash_code(), finding.hash_code, finding.id)
+
+    def test_bulk_update_hash_codes_only_writes_changes(self):
+        Finding.objects.update(hash_code='outdated')
+        finding_ids = list(Finding.objects.values_list('id', flat=True))
+        self.assertEqual(len(finding_ids), bulk_update_hash_codes(finding_ids))
+        self.assertEqual(0, bulk_update_hash_codes(finding_ids))
+
+    def test_split_id_range(self):
+        self.assertEqual([(1, 10)], split_id_range(1, 10, 1))
+        self.assertEqual([(1, 4), (5, 8), (9, 10)], split_id_range(1, 10, 3))
+        self.assertEqual([(5, 5)], split_id_range(5, 5, 4))
@@ -2,7 +2,10 @@ from .dojo_test_case import DojoTestCase
 from dojo.models import Finding, User, Product, Endpoint, Endpoint_Status, Test, Engagement
 from dojo.models import System_Settings
 from django.conf import settings
+from django.db import transaction
+from dojo.utils import DedupeSession, do_dedupe_finding, get_endpoints_as_url
 from crum import impersonate
+from unittest import mock
 import unittest
 import logging
 logger = logging.getLogger(__name__)
@@ -1123,6 +1126,67 @@ class TestDuplicationLogic(DojoTestCase):
         # by default hash_code should be generated
         self.assertTrue(finding_new.hash_code)
 
+    def test_dedupe_session(self):
+        # a dedupe session must give the same outcome as deduplicating the findings one by one
+        # 2 and 4: hash_code, 22: legacy (not handled by the session), 124: unique_id_from_tool, 224 and 225: unique_id_from_tool_or_hash_code
+        ids = [2, 4, 22, 124, 224, 225]
+
+        def create_copies():
+            copies = []
+            for id in ids:
+                finding_new, finding_org = self.copy_with_endpoints_without_dedupe_and_reset_finding(id=id)
+                finding_new.hash_code = finding_new.compute_hash_code()
+                finding_new.save(dedupe_option=False)
+                copies.append(finding_new)
+            return copies
+
+        def get_outcome(copies):
+            copy_ids = [copy.id for copy in copies]
+            outcome = []
+            for finding in Finding.objects.filter(id__in=copy_ids).order_by('id'):
+                duplicate_finding_id = finding.duplicate_finding_id
+                outcome.append((finding.duplicate, finding.active, copy_ids.index(duplicate_finding_id) if duplicate_finding_id in copy_ids else duplicate_finding_id))
+            return outcome
+
+        savepoint = transaction.savepoint()
+        copies = create_copies()
+        for finding in copies:
+            do_dedupe_finding(finding)
+        expected = get_outcome(copies)
+        transaction.savepoint_rollback(savepoint)
+
+        copies = create_copies()
+        dedupe_sessions = {}
+        for finding in copies:
+            product = finding.test.engagement.product
+            dedupe_session = dedupe_sessions.setdefault(product.id, DedupeSession(product))
+            do_dedupe_finding(finding, dedupe_session=dedupe_session)
+        # nothing is saved until the session is flushed
+        self.assertFalse(Finding.objects.filter(id__in=[copy.id for copy in copies if copy.id != copies[2].id], duplicate=True).exists())
+        for dedupe_session in dedupe_sessions.values():
+            dedupe_session.flush()
+
+        self.assertEqual(expected, get_outcome(copies))
+        self.assertTrue(any(duplicate for duplicate, active, duplicate_finding_id in expected))
+
+    def test_dedupe_session_fetches_candidates_at_once(self):
+        copies = []
+        for i in range(4):
+            finding_new, finding_org = self.copy_with_endpoints_without_dedupe_and_reset_finding(id=2)
+            finding_new.hash_code = finding_new.compute_hash_code()
+            finding_new.save(dedupe_option=False)
+            copies.append(finding_new.id)
+
+        dedupe_session = DedupeSession(Finding.objects.get(id=2).test.engagement.product)
+        finding = Finding.objects.select_related('test__engagement', 'test__test_type').prefetch_related('endpoints').get(id=copies[-1])
+        self.assertGreaterEqual(len(dedupe_session.get_candidate_ids(finding, settings.DEDUPE_ALGO_HASH_CODE)), 3)
+
+        # no candidate matches, so all of them are compared, with one query for the candidates and one for their endpoints
+        with mock.patch('dojo.utils.are_endpoints_duplicates', side_effect=lambda new_finding, find: not get_endpoints_as_url(find) and False) as compare, \
+                self.assertNumQueries(2):
+            dedupe_session.deduplicate(finding, settings.DEDUPE_ALGO_HASH_CODE)
+        self.assertGreaterEqual(compare.call_count, 3)
+
     # # utility methods
 
     def log_product(self, product):
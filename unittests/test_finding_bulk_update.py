@@ -0,0 +1,143 @@
+import uuid
+from unittest.mock import MagicMock, patch
+
+from auditlog.models import LogEntry
+from celery.result import AsyncResult, GroupResult
+from django.test import Client
+from django.urls import reverse
+
+from dojo.celery import app
+from dojo.finding.views import get_bulk_update_job_handle
+from dojo.models import Finding, Product, User
+from .dojo_test_case import DojoTestCase
+
+
+class TestFindingBulkUpdate(DojoTestCase):
+    fixtures = ['dojo_testdata.json']
+
+    def setUp(self):
+        self.user = User.objects.get(username='admin')
+        # run the follow-up work in the foreground
+        self.user.usercontactinfo.block_execution = True
+        self.user.usercontactinfo.save()
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.findings = Finding.objects.filter(test__engagement__product_id=2, duplicate=False).order_by('id')
+        self.finding_ids = list(self.findings.values_list('id', flat=True))
+
+    def bulk_update(self, **data):
+        data['finding_to_update'] = self.finding_ids
+        return self.client.post('/finding/bulk', data)
+
+    def test_bulk_status_update(self):
+        # the findings are saved with bulk updates
+        with patch.object(Finding, 'save', side_effect=AssertionError('save() called')):
+            self.assertEqual(302, self.bulk_update(status='on', is_mitigated='on', severity='Low').status_code)
+
+        for finding in self.findings.all():
+            self.assertEqual(('Low', 'S3'), (finding.severity, finding.numerical_severity))
+            self.assertTrue(finding.is_mitigated)
+            self.assertFalse(finding.active)
+            self.assertIsNotNone(finding.mitigated)
+            self.assertIsNotNone(finding.last_status_update)
+            self.assertEqual(self.user.id, finding.last_reviewed_by_id)
+
+        # reactivating resets the mitigation
+        self.bulk_update(status='on', active='on')
+        for finding in self.findings.all():
+            self.assertTrue(finding.active)
+            self.assertFalse(finding.is_mitigated)
+            self.assertIsNone(finding.mitigated)
+
+    def test_bulk_update_history(self):
+        self.bulk_update(severity='Low')
+        self.bulk_update(status='on', is_mitigated='on')
+
+        for finding in self.findings.all():
+            log_entries = LogEntry.objects.get_for_object(finding).filter(action=LogEntry.Action.UPDATE).order_by('id')
+            self.assertEqual(2, len(log_entries))
+            self.assertEqual('S3', log_entries[0].changes_dict['numerical_severity'][1])
+            self.assertEqual(['False', 'True'], log_entries[1].changes_dict['is_mitigated'])
+            self.assertEqual({self.user}, {log_entry.actor for log_entry in log_entries})
+
+    def test_bulk_notes_and_tags(self):
+        self.bulk_update(notes='bulk note', tags='bulk1,Bulk2')
+
+        tag_model = Finding.tags.tag_model
+        for finding in self.findings.all():
+            self.assertIn('bulk note', [note.entry for note in finding.notes.all()])
+            self.assertEqual(['bulk1', 'bulk2'], sorted(tag.name for tag in finding.tags.all()))
+        self.assertEqual(len(self.finding_ids), tag_model.objects.get(name='bulk1').count)
+
+        # the tags are replaced
+        self.bulk_update(tags='bulk3')
+        for finding in self.findings.all():
+            self.assertEqual(['bulk3'], [tag.name for tag in finding.tags.all()])
+        self.assertFalse(tag_model.objects.filter(name='bulk1').exists())
+
+    def test_bulk_tags_keep_inherited_tags(self):
+        finding = self.findings.first()
+        finding.tags.add('inherited')
+        finding.inherited_tags.add('inherited')
+
+        self.bulk_update(tags='bulk1')
+        self.assertEqual(['bulk1', 'inherited'], sorted(tag.name for tag in finding.tags.all()))
+        for finding in self.findings.exclude(id=finding.id):
+            self.assertEqual(['bulk1'], [tag.name for tag in finding.tags.all()])
+
+    def test_bulk_risk_acceptance(self):
+        Product.objects.filter(id=2).update(enable_simple_risk_acceptance=True)
+
+        # the JIRA comments are posted after the findings are saved
+        def assert_saved(finding, creator):
+            self.assertEqual(finding.risk_accepted, Finding.objects.get(id=finding.id).risk_accepted)
+
+        with patch('dojo.risk_acceptance.helper.post_jira_comment', side_effect=assert_saved) as post_jira_comment:
+            self.bulk_update(risk_acceptance='on', risk_accept='on')
+        self.assertEqual(len(self.finding_ids), post_jira_comment.call_count)
+        for finding in self.findings.all():
+            self.assertTrue(finding.risk_accepted)
+            self.assertFalse(finding.active)
+
+        with patch('dojo.risk_acceptance.helper.post_jira_comment', side_effect=assert_saved) as post_jira_comment:
+            self.bulk_update(risk_acceptance='on', risk_unaccept='on')
+        self.assertEqual(len(self.finding_ids), post_jira_comment.call_count)
+        for finding in self.findings.all():
+            self.assertFalse(finding.risk_accepted)
+            self.assertFalse(finding.risk_acceptance_set.exists())
+
+    def test_bulk_update_job(self):
+        self.user.usercontactinfo.block_execution = False
+        self.user.usercontactinfo.save()
+
+        job = MagicMock(id=str(uuid.uuid4()))
+        with patch('celery.group') as group:
+            group.return_value.apply_async.return_value = job
+            response = self.bulk_update(severity='Low')
+            group.assert_called_once()
+            job.save.assert_called_once()
+
+        messages = [str(message) for message in response.wsgi_request._messages]
+        self.assertTrue(any(reverse('finding_bulk_update_job_status', args=(get_bulk_update_job_handle(job.id, self.user),)) in message
+                            for message in messages), messages)
+
+    def test_bulk_update_job_status(self):
+        task_ids = [str(uuid.uuid4()), str(uuid.uuid4())]
+        job = GroupResult(str(uuid.uuid4()), [AsyncResult(task_id, app=app) for task_id in task_ids], app=app)
+        job.save()
+
+        url = reverse('finding_bulk_update_job_status', args=(get_bulk_update_job_handle(job.id, self.user),))
+        self.assertEqual({'job_id': job.id, 'status': 'pending', 'products': 2, 'completed': 0}, self.client.get(url).json())
+        for task_id in task_ids:
+            app.backend.store_result(task_id, None, 'SUCCESS')
+        self.assertEqual({'job_id': job.id, 'status': 'done', 'products': 2, 'completed': 2}, self.client.get(url).json())
+
+        # the handle can't be made up or taken from another user
+        self.assertEqual(404, self.client.get('/finding/bulk/job/' + job.id).status_code)
+        self.assertEqual(404, self.client.get(reverse('finding_bulk_update_job_status',
+                                                      args=(get_bulk_update_job_handle(str(uuid.uuid4()), self.user),))).status_code)
+        other_user = User.objects.get(username='user2')
+        self.client.force_login(other_user)
+        self.assertEqual(403, self.client.get(url).status_code)
+        self.assertEqual(200, self.client.get(reverse('finding_bulk_update_job_status',
+                                                      args=(get_bulk_update_job_handle(job.id, other_user),))).status_code)
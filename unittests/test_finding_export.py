@@ -0,0 +1,66 @@
+import csv
+import io
+
+from django.test import Client
+from openpyxl import load_workbook
+
+from dojo.models import Dojo_User, Endpoint, Finding, Finding_Group, User, Vulnerability_Id
+from dojo.reports import views as report_views
+from .dojo_test_case import DojoTestCase
+
+
+class TestFindingExport(DojoTestCase):
+    fixtures = ['dojo_testdata.json']
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(User.objects.get(username='admin'))
+        self.finding = Finding.objects.get(id=2)
+        for i in range(7):
+            self.finding.endpoints.add(Endpoint.objects.create(host=f'host{i}.example.com', product=self.finding.test.engagement.product))
+        Vulnerability_Id.objects.create(finding=self.finding, vulnerability_id='CVE-2020-1234')
+        finding_group = Finding_Group.objects.create(name='export group', test=self.finding.test, creator=Dojo_User.objects.get(username='admin'))
+        finding_group.findings.add(self.finding)
+
+    def get_csv_rows(self):
+        response = self.client.get('/reports/csv_export?url=/finding')
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.streaming)
+        self.assertEqual('attachment; filename=findings.csv', response['Content-Disposition'])
+        content = b''.join(response.streaming_content).decode('utf-8')
+        return list(csv.DictReader(io.StringIO(content)))
+
+    def test_csv_export(self):
+        rows = self.get_csv_rows()
+        self.assertEqual(Finding.objects.count(), len(rows))
+        row = [row for row in rows if row['id'] == str(self.finding.id)][0]
+        self.assertEqual(self.finding.title, row['title'])
+        self.assertEqual(self.finding.test.test_type.name, row['found_by'])
+        self.assertEqual('export group', row['finding_group'])
+        self.assertEqual('True', row['has_finding_group'])
+        self.assertEqual(5, len(row['endpoints'].split('; ')) - 1)
+        self.assertTrue(row['endpoints'].endswith('...'))
+        self.assertEqual('CVE-2020-1234', row['vulnerability_ids'])
+
+    def test_csv_export_chunks(self):
+        expected = self.get_csv_rows()
+        original_chunk_size = report_views.EXPORT_CHUNK_SIZE
+        report_views.EXPORT_CHUNK_SIZE = 3
+        try:
+            # the prefetched endpoints, vulnerability ids and finding groups don't depend on the chunk boundaries
+            self.assertEqual(expected, self.get_csv_rows())
+        finally:
+            report_views.EXPORT_CHUNK_SIZE = original_chunk_size
+
+    def test_excel_export(self):
+        response = self.client.get('/reports/excel_export?url=/finding')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('attachment; filename=findings.xlsx', response['Content-Disposition'])
+        workbook = load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+        rows = list(workbook['Findings'].iter_rows(values_only=True))
+        header = rows[0]
+        self.assertEqual(Finding.objects.count(), len(rows) - 1)
+        row = dict(zip(header, [row for row in rows[1:] if row[header.index('id')] == self.finding.id][0]))
+        self.assertEqual(self.finding.title, row['title'])
+        self.assertEqual('ZAP Scan', row['found_by'])
+        self.assertEqual('CVE-2020-1234', row['vulnerability_ids'])
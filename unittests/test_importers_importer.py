@@ -1,11 +1,16 @@
 from unittest.mock import patch
+from crum import impersonate
 import uuid
 from .dojo_test_case import DojoTestCase, get_unit_tests_path
+from django.test import override_settings
 from django.utils import timezone
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 from dojo.importers.importer.importer import DojoDefaultImporter as Importer
-from dojo.models import Development_Environment, Engagement, Finding, Product, Product_Type, Test, User
+from dojo.importers.reimporter import utils as reimporter_utils
+from dojo.importers.utils import EndpointResolver
+import dojo.notifications.helper as notifications_helper
+from dojo.models import Development_Environment, Endpoint, Endpoint_Status, Engagement, Finding, Finding_Group, Product, Product_Type, System_Settings, Test, User, UserContactInfo
 from dojo.tools.factory import get_parser
 from dojo.tools.sarif.parser import SarifParser
 from dojo.tools.gitlab_sast.parser import GitlabSastParser
@@ -157,6 +162,105 @@ class TestDojoDefaultImporter(DojoTestCase):
         self.assertEqual(1, len_new_findings)
         self.assertEqual(0, len_closed_findings)
 
+    def test_import_scan_bulk_create(self):
+        scan_type = "Nuclei Scan"
+        user, _ = User.objects.get_or_create(username="admin")
+        product_type, _ = Product_Type.objects.get_or_create(name="test3")
+        environment, _ = Development_Environment.objects.get_or_create(name="Development")
+        system_settings = System_Settings.objects.get()
+        system_settings.enable_deduplication = True
+        system_settings.save()
+        # run the post processing (deduplication) in the foreground
+        UserContactInfo.objects.update_or_create(user=user, defaults={'block_execution': True})
+        user.refresh_from_db()
+
+        def snapshot(test):
+            return sorted(
+                (finding.title, finding.severity, finding.numerical_severity, finding.hash_code, finding.cve,
+                 finding.static_finding, finding.dynamic_finding, finding.active, finding.duplicate,
+                 tuple(sorted(str(endpoint) for endpoint in finding.endpoints.all())),
+                 tuple(sorted(str(vulnerability_id) for vulnerability_id in finding.vulnerability_id_set.all())),
+                 tuple(sorted(tag.name for tag in finding.tags.all())),
+                 tuple(finding.found_by.values_list('name', flat=True)))
+                for finding in Finding.objects.filter(test=test)
+            )
+
+        snapshots = []
+        for bulk_create in [False, True]:
+            product = Product.objects.create(name="TestDojoDefaultImporter bulk_create=%s" % bulk_create, prod_type=product_type)
+            engagement = Engagement.objects.create(
+                name="Test Bulk Create Engagement",
+                product=product,
+                target_start=timezone.now(),
+                target_end=timezone.now(),
+            )
+            # a small batch size to have several batches and duplicates across batches
+            with override_settings(IMPORT_BULK_CREATE=bulk_create, IMPORT_BULK_CREATE_BATCH_SIZE=7), impersonate(user):
+                with open(get_unit_tests_path() + "/scans/nuclei/many_findings.json") as scan:
+                    test, len_new_findings, len_closed_findings, _ = Importer().import_scan(scan, scan_type, engagement, lead=None, environment=environment,
+                                active=True, verified=True, user=user)
+            self.assertEqual(16, len_new_findings)
+            self.assertEqual(0, len_closed_findings)
+            snapshots.append(snapshot(test))
+
+        regular_snapshot, bulk_snapshot = snapshots
+        self.assertEqual(regular_snapshot, bulk_snapshot)
+        # the report contains duplicates, make sure they are detected in both modes
+        self.assertEqual(8, len([row for row in bulk_snapshot if row[8]]))
+
+    def test_import_scan_streaming(self):
+        scan_type = "ZAP Scan"
+        user, _ = User.objects.get_or_create(username="admin")
+        product_type, _ = Product_Type.objects.get_or_create(name="test4")
+        product, _ = Product.objects.get_or_create(name="TestDojoDefaultImporter streaming", prod_type=product_type)
+        engagement = Engagement.objects.create(
+            name="Test Streaming Engagement",
+            product=product,
+            target_start=timezone.now(),
+            target_end=timezone.now(),
+        )
+        environment, _ = Development_Environment.objects.get_or_create(name="Development")
+        batched = []
+        with override_settings(IMPORT_STREAMING_BATCH_SIZE=2), impersonate(user):
+            with patch.object(Importer, 'process_parsed_findings', autospec=True, side_effect=Importer.process_parsed_findings) as mock, \
+                    patch('dojo.notifications.helper.notify_scan_added',
+                          side_effect=lambda *args, **kwargs: batched.append(notifications_helper._batch.notifications is not None)):
+                with open(get_unit_tests_path() + "/scans/zap/dvwa_baseline_dojo.xml") as scan:
+                    test, len_new_findings, len_closed_findings, _ = Importer().import_scan(scan, scan_type, engagement, lead=None, environment=environment,
+                                active=True, verified=True, user=user)
+        # the notifications of the import are sent batched
+        self.assertEqual([True], batched)
+        self.assertEqual(19, len_new_findings)
+        self.assertEqual(0, len_closed_findings)
+        self.assertEqual(19, Finding.objects.filter(test=test).count())
+        # the findings of the report are processed in batches of 2
+        self.assertEqual(10, mock.call_count)
+        self.assertTrue(all(len(call.args[2]) <= 2 for call in mock.call_args_list))
+
+    def test_import_scan_streaming_pushes_finding_groups_once(self):
+        scan_type = "ZAP Scan"
+        user, _ = User.objects.get_or_create(username="admin")
+        product_type, _ = Product_Type.objects.get_or_create(name="test4")
+        product, _ = Product.objects.get_or_create(name="TestDojoDefaultImporter streaming groups", prod_type=product_type)
+        engagement = Engagement.objects.create(
+            name="Test Streaming Groups Engagement",
+            product=product,
+            target_start=timezone.now(),
+            target_end=timezone.now(),
+        )
+        environment, _ = Development_Environment.objects.get_or_create(name="Development")
+        # all findings are in one group, which spans all batches
+        with override_settings(IMPORT_STREAMING_BATCH_SIZE=2), impersonate(user), \
+                patch('dojo.finding.helper.get_group_by_group_name', return_value='Findings in: zap'), \
+                patch('dojo.jira_link.helper.push_to_jira') as push_to_jira:
+            with open(get_unit_tests_path() + "/scans/zap/dvwa_baseline_dojo.xml") as scan:
+                test, len_new_findings, _, _ = Importer().import_scan(scan, scan_type, engagement, lead=None, environment=environment,
+                            active=True, verified=True, user=user, push_to_jira=True, group_by='component_name')
+        self.assertEqual(19, len_new_findings)
+        finding_group = Finding_Group.objects.get(test=test)
+        self.assertEqual(19, finding_group.findings.count())
+        push_to_jira.assert_called_once_with(finding_group)
+
 
 class FlexibleImportTestAPI(DojoAPITestCase):
     def __init__(self, *args, **kwargs):
@@ -596,3 +700,56 @@ class TestImporterUtils(DojoAPITestCase):
         handle_vulnerability_ids(finding)
 
         mock.assert_not_called()
+
+
+class TestReimporterUtils(DojoTestCase):
+    fixtures = ['dojo_testdata.json']
+
+    def test_existing_findings_index_matches_like_queries(self):
+        for test in Test.objects.filter(finding__isnull=False).distinct():
+            for deduplication_algorithm in ['hash_code', 'unique_id_from_tool', 'unique_id_from_tool_or_hash_code', 'legacy']:
+                index = reimporter_utils.ExistingFindingsIndex(test, deduplication_algorithm)
+                for finding in Finding.objects.all():
+                    new_finding = Finding(title=finding.title, severity=finding.severity, hash_code=finding.hash_code, unique_id_from_tool=finding.unique_id_from_tool)
+                    expected = list(reimporter_utils.match_new_finding_to_existing_finding(new_finding, test, deduplication_algorithm))
+                    self.assertEqual(expected, index.match(new_finding), (test.id, deduplication_algorithm, finding.id))
+
+    def test_existing_findings_index_add(self):
+        test = Test.objects.get(id=3)
+        index = reimporter_utils.ExistingFindingsIndex(test, 'hash_code')
+        new_finding = Finding(title='new finding', severity='High', hash_code='new-hash-code')
+        self.assertEqual([], index.match(new_finding))
+
+        new_finding.test = test
+        new_finding.reporter = User.objects.get(id=1)
+        new_finding.save(dedupe_option=False)
+        index.add(new_finding)
+        self.assertEqual([new_finding], index.match(Finding(title='another finding', severity='Low', hash_code=new_finding.hash_code)))
+
+
+class TestEndpointResolver(DojoTestCase):
+    fixtures = ['dojo_testdata.json']
+
+    def test_add_endpoints_to_findings(self):
+        test = Test.objects.get(id=3)
+        product = test.engagement.product
+        existing = Endpoint.objects.create(protocol='https', host='example.com', port=443, product=product)
+        findings = list(test.finding_set.all()[:2])
+        statuses_before = Endpoint_Status.objects.filter(finding__in=findings).count()
+
+        resolver = EndpointResolver(product)
+        # the first finding matches the existing endpoint (default port, host in different case) and reports a new endpoint twice
+        resolver.add_endpoints_to_findings([
+            (findings[0], [Endpoint(protocol='HTTPS', host='Example.com'), Endpoint(host='new.example.com', path='a'), Endpoint(host='new.example.com', path='a')]),
+            (findings[1], [Endpoint(host='new.example.com', path='a')]),
+        ])
+
+        new_endpoint = Endpoint.objects.get(product=product, host='new.example.com', path='a')
+        self.assertTrue({existing, new_endpoint} <= set(findings[0].endpoints.all()))
+        self.assertIn(new_endpoint, findings[1].endpoints.all())
+
+        # endpoints and statuses that already exist are not created again
+        with self.assertNumQueries(1):
+            resolver.add_endpoints_to_findings([(findings[1], [Endpoint(host='new.example.com', path='a')])])
+        self.assertEqual(1, Endpoint.objects.filter(product=product, host='new.example.com').count())
+        self.assertEqual(statuses_before + 3, Endpoint_Status.objects.filter(finding__in=findings).count())
@@ -0,0 +1,66 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import override_settings
+
+from dojo.markdown_cache import MarkdownRenderCache, markdown_render_cache_counts, render_markdown, warm_markdown_render_cache
+from dojo.models import Finding
+from dojo.templatetags.display_tags import markdown_render
+from .dojo_test_case import DojoTestCase
+
+
+class TestMarkdownRenderCache(DojoTestCase):
+    fixtures = ['dojo_testdata.json']
+
+    def setUp(self):
+        MarkdownRenderCache.clear()
+        cache.clear()
+
+    def tearDown(self):
+        MarkdownRenderCache.clear()
+
+    def test_render_is_cached(self):
+        text = '# Title\n\n```python\nprint("hello")\n```\n<script>alert(1)</script>'
+        local, miss = markdown_render_cache_counts['local'], markdown_render_cache_counts['miss']
+        html = markdown_render(text)
+        self.assertIn('<h1 id="title">Title</h1>', html)
+        self.assertNotIn('<script>', html)
+
+        with patch('dojo.markdown_cache.render_markdown') as render:
+            self.assertEqual(html, markdown_render(text))
+            render.assert_not_called()
+        self.assertEqual((local + 1, miss + 1), (markdown_render_cache_counts['local'], markdown_render_cache_counts['miss']))
+
+        # other processes find the rendering in the django cache
+        MarkdownRenderCache.clear()
+        shared = markdown_render_cache_counts['shared']
+        with patch('dojo.markdown_cache.render_markdown') as render:
+            self.assertEqual(html, markdown_render(text))
+            render.assert_not_called()
+        self.assertEqual(shared + 1, markdown_render_cache_counts['shared'])
+
+    @override_settings(MARKDOWN_RENDER_CACHE_TTL=0)
+    def test_least_recently_used_are_evicted(self):
+        texts = ['text %d' % i for i in range(3)]
+        size = len(render_markdown(texts[0]))
+        with override_settings(MARKDOWN_RENDER_CACHE_SIZE=size * 2):
+            for text in texts[:2]:
+                MarkdownRenderCache.render(text)
+            MarkdownRenderCache.render(texts[0])
+            MarkdownRenderCache.render(texts[2])
+
+            with patch('dojo.markdown_cache.render_markdown', side_effect=render_markdown) as render:
+                MarkdownRenderCache.render(texts[0])
+                MarkdownRenderCache.render(texts[2])
+                render.assert_not_called()
+                MarkdownRenderCache.render(texts[1])
+                render.assert_called_once_with(texts[1])
+
+    def test_warm_new_findings(self):
+        finding = Finding.objects.get(id=2)
+        warm_markdown_render_cache([finding.id], sync=True)
+        self.assertEqual(render_markdown(finding.description), cache.get(MarkdownRenderCache.get_key(finding.description)))
+
+        with patch('dojo.markdown_cache.render_markdown') as render:
+            markdown_render(finding.description)
+            render.assert_not_called()
@@ -169,7 +169,7 @@ class EndpointQueriesTest(DojoTestCase):
 
     def test_endpoint_queries(self):
         # Queries over Finding and Endpoint_Status
-        with self.assertNumQueries(69):
+        with self.assertNumQueries(43):
             product_types = []
             endpoint_queries = views.endpoint_querys(
                 product_types,
@@ -0,0 +1,122 @@
+import datetime
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from dojo.metrics.helper import defer_metrics_rollup, update_metrics_rollup
+from dojo.models import Engagement, Finding, Product, Product_Metrics_Rollup, User
+from .dojo_test_case import DojoTestCase
+
+METRICS_CONTEXT = ['opened_per_month', 'active_per_month', 'opened_per_week', 'accepted_per_month', 'accepted_per_week',
+                   'age_detail', 'in_period_counts', 'in_period_details', 'accepted_in_period_details',
+                   'closed_in_period_counts', 'closed_in_period_details', 'start_date', 'end_date']
+PRODUCT_METRICS_CONTEXT = ['verified_objs_by_severity', 'inactive_objs_by_severity', 'closed_objs_by_severity',
+                           'false_positive_objs_by_severity', 'out_of_scope_objs_by_severity', 'all_objs_by_severity',
+                           'new_objs_by_severity', 'verified_objs_count', 'inactive_objs_count', 'closed_objs_count',
+                           'false_positive_objs_count', 'out_of_scope_objs_count', 'all_objs_count']
+
+
+@override_settings(METRICS_ROLLUP_DEBOUNCE_SECONDS=0)
+class TestMetricsRollup(DojoTestCase):
+    fixtures = ['dojo_testdata.json']
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(User.objects.get(username='admin'))
+
+        # spread the findings over a few months and states
+        today = timezone.now().date()
+        for index, finding in enumerate(Finding.objects.order_by('id')):
+            finding.date = today - datetime.timedelta(days=17 * index)
+            finding.verified = index % 4 != 0
+            if index % 3 == 0:
+                finding.active = False
+                finding.is_mitigated = True
+                finding.mitigated = timezone.now() - datetime.timedelta(days=5 * index)
+            if index % 5 == 0:
+                finding.risk_accepted = True
+            finding.save(dedupe_option=False, rules_option=False, product_grading_option=False,
+                         issue_updater_option=False)
+        call_command('metrics_rollup')
+
+    def get_context(self, url, keys):
+        # the metrics views are cached
+        cache.clear()
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        return {key: response.context[key] for key in keys}
+
+    def test_metrics_rollup_matches_findings(self):
+        # the default of the past 30 days, the past 90 days and any date
+        for query in ['', '?date=2', '?date=7']:
+            url = '/metrics/product/type' + query
+            with override_settings(METRICS_ROLLUP_ENABLED=False):
+                expected = self.get_context(url, METRICS_CONTEXT + ['top_ten_products'])
+            with override_settings(METRICS_ROLLUP_ENABLED=True):
+                actual = self.get_context(url, METRICS_CONTEXT + ['top_ten_products'])
+
+            for key in METRICS_CONTEXT:
+                self.assertEqual(expected[key], actual[key], (query, key))
+            self.assertEqual([(p.id, p.critical, p.high, p.medium, p.low) for p in expected['top_ten_products']],
+                             [(p.id, p.critical, p.high, p.medium, p.low) for p in actual['top_ten_products']])
+
+    def test_product_metrics_rollup_matches_findings(self):
+        for product in Product.objects.filter(engagement__test__finding__isnull=False).distinct():
+            for query in ['', '&date=7']:
+                url = f'/product/{product.id}/metrics?type=Finding' + query
+                with override_settings(METRICS_ROLLUP_ENABLED=False):
+                    expected = self.get_context(url, PRODUCT_METRICS_CONTEXT)
+                with override_settings(METRICS_ROLLUP_ENABLED=True):
+                    actual = self.get_context(url, PRODUCT_METRICS_CONTEXT)
+                self.assertEqual(expected, actual, (product, query))
+
+    def test_filtered_metrics_do_not_use_rollup(self):
+        Product_Metrics_Rollup.objects.all().delete()
+        with override_settings(METRICS_ROLLUP_ENABLED=True):
+            context = self.get_context('/metrics/product/type?severity=High&date=7', ['in_period_counts'])
+        self.assertEqual(Finding.objects.filter(verified=True, severity='High').count(), context['in_period_counts']['High'])
+
+    @override_settings(METRICS_ROLLUP_ENABLED=True)
+    def test_finding_changes_update_rollup(self):
+        finding = Finding.objects.filter(verified=True, severity='High').first()
+        product = finding.test.engagement.product
+
+        def opened(severity):
+            return sum(Product_Metrics_Rollup.objects.filter(product=product, severity=severity).values_list('opened', flat=True))
+
+        high, critical = opened('High'), opened('Critical')
+        finding.severity = 'Critical'
+        finding.save(dedupe_option=False, rules_option=False, product_grading_option=False, issue_updater_option=False)
+        self.assertEqual((high - 1, critical + 1), (opened('High'), opened('Critical')))
+
+        finding.delete()
+        self.assertEqual(critical, opened('Critical'))
+
+    @override_settings(METRICS_ROLLUP_ENABLED=True)
+    def test_deferred_rollup_is_updated_once_per_product(self):
+        findings = list(Finding.objects.filter(test__engagement__product__isnull=False).select_related('test__engagement'))
+        with patch('dojo.metrics.helper.update_metrics_rollup') as update:
+            with defer_metrics_rollup():
+                for finding in findings:
+                    finding.save(dedupe_option=False, rules_option=False, product_grading_option=False, issue_updater_option=False)
+                with defer_metrics_rollup():
+                    findings[0].save(dedupe_option=False, rules_option=False, product_grading_option=False, issue_updater_option=False)
+                update.assert_not_called()
+                # the products of the tests are looked up when the block ends, after the engagement has been moved
+                other_product = Product.objects.exclude(id=findings[0].test.engagement.product_id).order_by('id').first()
+                Engagement.objects.filter(id=findings[0].test.engagement_id).update(product=other_product)
+                product_ids = set(Finding.objects.filter(id__in=[finding.id for finding in findings])
+                                  .values_list('test__engagement__product_id', flat=True))
+        self.assertEqual(sorted(product_ids), [call.args[0] for call in update.call_args_list])
+
+    def test_update_metrics_rollup(self):
+        product = Product.objects.filter(engagement__test__finding__isnull=False).first()
+        findings = Finding.objects.filter(test__engagement__product=product)
+        update_metrics_rollup(product.id)
+        rollup = Product_Metrics_Rollup.objects.filter(product=product)
+        self.assertEqual(findings.count(), sum(row.total for row in rollup))
+        self.assertEqual(findings.filter(verified=True).count(), sum(row.opened for row in rollup))
+        self.assertEqual(findings.filter(mitigated__isnull=False).count(), sum(row.mitigated for row in rollup))
@@ -1,5 +1,13 @@
+from unittest.mock import MagicMock, patch
+
+from django.conf import settings
+from django.test import override_settings
+
 from .dojo_test_case import DojoTestCase
-from dojo.models import Product, User, Notifications
+from dojo.models import Alerts, Product, Product_Member, Role, User, Notifications
+from dojo.notifications import helper as notifications_helper
+from dojo.notifications.helper import NotificationRecipientCache, batch_notifications, create_notification, \
+    dispatch_notification
 
 
 class TestNotifications(DojoTestCase):
@@ -54,3 +62,103 @@ class TestNotifications(DojoTestCase):
         self.assertEqual('mail' in merged_notifications.other, True)
         self.assertEqual('slack' in merged_notifications.other, True)  # default alert from global
         self.assertEqual(len(merged_notifications.other), 3)
+
+
+@override_settings(NOTIFICATION_RECIPIENT_CACHE_TTL=60)
+class TestNotificationRecipientCache(DojoTestCase):
+    fixtures = ['dojo_testdata.json']
+
+    def setUp(self):
+        NotificationRecipientCache.invalidate()
+        self.product = Product.objects.get(id=1)
+        # the tests use the local memory cache as if it was shared
+        patcher = patch.object(NotificationRecipientCache, 'LOCAL_CACHE_BACKENDS', ())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_recipients(self):
+        return NotificationRecipientCache.get_recipients('other', self.product, None)
+
+    def test_recipients_are_cached(self):
+        with patch.object(notifications_helper, 'get_recipients', wraps=notifications_helper.get_recipients) as get_recipients:
+            expected = self.get_recipients()
+            self.assertEqual(expected, self.get_recipients())
+            get_recipients.assert_called_once()
+
+            # another event or product has other recipients
+            NotificationRecipientCache.get_recipients('test_added', self.product, None)
+            NotificationRecipientCache.get_recipients('other', Product.objects.get(id=2), None)
+            self.assertEqual(3, get_recipients.call_count)
+
+    def test_recipients_are_not_cached_in_a_cache_per_process(self):
+        with patch.object(notifications_helper, 'get_recipients', wraps=notifications_helper.get_recipients) as get_recipients, \
+                patch.object(NotificationRecipientCache, 'LOCAL_CACHE_BACKENDS', (settings.CACHES['default']['BACKEND'],)):
+            self.get_recipients()
+            self.get_recipients()
+            self.assertEqual(2, get_recipients.call_count)
+
+    def test_changes_invalidate_recipients(self):
+        with patch.object(notifications_helper, 'get_recipients', wraps=notifications_helper.get_recipients) as get_recipients:
+            self.get_recipients()
+            Notifications.objects.create(user=User.objects.get(username='user2'), product=self.product)
+            self.get_recipients()
+            self.assertEqual(2, get_recipients.call_count)
+
+            Product_Member.objects.create(user=User.objects.get(username='user2'), product=self.product, role=Role.objects.get(id=1))
+            self.get_recipients()
+            self.assertEqual(3, get_recipients.call_count)
+
+            # the grading of a product doesn't change the recipients
+            self.product.save(update_fields=['prod_numeric_grade', 'updated'])
+            self.get_recipients()
+            self.assertEqual(3, get_recipients.call_count)
+
+
+class TestBatchNotifications(DojoTestCase):
+    fixtures = ['dojo_testdata.json']
+
+    def test_notifications_are_batched_per_channel_and_user(self):
+        admin, user2 = User.objects.get(username='admin'), User.objects.get(username='user2')
+        senders = {channel: (MagicMock(), MagicMock()) for channel in ['slack', 'msteams', 'mail', 'alert']}
+        with patch.dict(notifications_helper.NOTIFICATION_SENDERS, senders):
+            with batch_notifications():
+                for index in range(3):
+                    dispatch_notification('mail', 'other', admin, title='admin %i' % index)
+                    # nested blocks are sent with the outer block
+                    with batch_notifications():
+                        dispatch_notification('mail', 'other', None, title='system %i' % index)
+                dispatch_notification('slack', 'other', user2, title='user2')
+                senders['mail'][1].assert_not_called()
+
+        send_mail_notification, send_mail_notifications = senders['mail']
+        send_mail_notification.assert_not_called()
+        self.assertEqual(2, send_mail_notifications.call_count)
+        self.assertEqual(
+            [([('other', {'title': 'admin %i' % index}) for index in range(3)], admin),
+             ([('other', {'title': 'system %i' % index}) for index in range(3)], None)],
+            [call.args for call in send_mail_notifications.call_args_list])
+        # a single notification is sent the usual way
+        senders['slack'][0].assert_called_once_with('other', user2, title='user2')
+        senders['slack'][1].assert_not_called()
+
+    @override_settings(NOTIFICATION_BATCH_SIZE=2)
+    def test_batches_are_limited_in_size(self):
+        senders = {'mail': (MagicMock(), MagicMock())}
+        with patch.dict(notifications_helper.NOTIFICATION_SENDERS, senders):
+            with batch_notifications():
+                for index in range(5):
+                    dispatch_notification('mail', 'other', None, title='system %i' % index)
+
+        self.assertEqual([2, 2], [len(call.args[0]) for call in senders['mail'][1].call_args_list])
+        senders['mail'][0].assert_called_once_with('other', None, title='system 4')
+
+    def test_batched_alerts(self):
+        Notifications.objects.create(user=User.objects.get(username='admin'), other=['alert'])
+        alerts = Alerts.objects.filter(user_id__username='admin')
+        count = alerts.count()
+        with batch_notifications():
+            for index in range(3):
+                create_notification(event='other', title='batched %i' % index, recipients=['admin'], url='/')
+            self.assertEqual(count, alerts.count())
+        self.assertEqual(['batched 0', 'batched 1', 'batched 2'],
+                         list(alerts.filter(title__startswith='batched').order_by('id').values_list('title', flat=True)))
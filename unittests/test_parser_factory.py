@@ -0,0 +1,78 @@
+from django.test import override_settings
+from dojo.models import Test_Type
+from dojo.tools import factory
+from dojo.tools.factory import PARSER_MANIFEST, PARSERS, ParserActivationCache, generate_parser_manifest, get_choices_sorted, \
+    get_parser, get_scan_types_sorted, load_parser, requires_file, requires_tool_type
+from .dojo_test_case import DojoTestCase
+
+
+class TestParserFactory(DojoTestCase):
+
+    def test_manifest_is_up_to_date(self):
+        self.assertEqual(generate_parser_manifest(), PARSER_MANIFEST, 'run "./manage.py generate_parser_manifest" to update dojo/tools/parser_manifest.json')
+
+    def test_choices_are_served_from_manifest(self):
+        self.assertEqual(sorted(PARSER_MANIFEST, key=str.lower), [choice for choice, _ in get_choices_sorted()])
+        self.assertIn(('ZAP Scan', 'ZAP XML report format.'), get_scan_types_sorted())
+        self.assertTrue(requires_file('ZAP Scan'))
+        self.assertFalse(requires_file('SonarQube API Import'))
+        self.assertEqual('SonarQube', requires_tool_type('SonarQube API Import'))
+
+    def test_get_parser_loads_parser_lazily(self):
+        saved = {scan_type: PARSERS.pop(scan_type) for scan_type in ['Checkmarx Scan', 'Checkmarx Scan detailed'] if scan_type in PARSERS}
+        try:
+            Test_Type.objects.get_or_create(name='Checkmarx Scan detailed', defaults={'active': True})
+            parser = get_parser('Checkmarx Scan detailed')
+            self.assertEqual('CheckmarxParser', parser.__class__.__name__)
+            self.assertEqual('detailed', parser.mode)
+            # all the scan types of the parser are registered at once
+            self.assertIsNone(load_parser('Checkmarx Scan').mode)
+            self.assertIs(parser, load_parser('Checkmarx Scan detailed'))
+        finally:
+            PARSERS.update(saved)
+
+    def test_get_parser_unknown_scan_type(self):
+        with self.assertRaisesRegex(ValueError, 'does not exists'):
+            get_parser('Unknown Scan')
+        self.assertIsNone(factory.get_parser_info('Unknown Scan'))
+
+
+@override_settings(PARSER_ACTIVATION_CACHE_TTL=60)
+class TestParserActivationCache(DojoTestCase):
+
+    def setUp(self):
+        ParserActivationCache.invalidate()
+
+    def tearDown(self):
+        ParserActivationCache.invalidate()
+
+    def test_get_parser_uses_cached_flags(self):
+        get_parser('ZAP Scan')
+        get_parser('Checkmarx Scan')
+        with self.assertNumQueries(0):
+            get_parser('ZAP Scan')
+            get_parser('Checkmarx Scan')
+
+    def test_saving_test_type_invalidates(self):
+        get_parser('ZAP Scan')
+        test_type, _ = Test_Type.objects.get_or_create(name='ZAP Scan')
+        test_type.active = False
+        test_type.save()
+        with self.assertRaisesRegex(ValueError, 'is not active'):
+            get_parser('ZAP Scan')
+        self.assertNotIn(('ZAP Scan', 'ZAP Scan'), get_choices_sorted(active_only=True))
+        self.assertIn(('ZAP Scan', 'ZAP Scan'), get_choices_sorted())
+
+    def test_parser_exclude(self):
+        with override_settings(PARSER_EXCLUDE='ZAP Scan|Acunetix'):
+            with self.assertRaisesRegex(ValueError, 'is not active'):
+                get_parser('ZAP Scan')
+            self.assertNotIn('Acunetix Scan', [scan_type for scan_type, _ in get_scan_types_sorted(active_only=True)])
+        self.assertEqual('ZapParser', get_parser('ZAP Scan').__class__.__name__)
+
+    def test_get_active_scan_types_creates_missing_test_types(self):
+        Test_Type.objects.filter(name__in=['Trivy Scan', 'Nuclei Scan']).delete()
+        with self.assertNumQueries(2):
+            self.assertEqual(['Trivy Scan', 'Nuclei Scan'], ParserActivationCache.get_active_scan_types(['Trivy Scan', 'Nuclei Scan']))
+        self.assertTrue(Test_Type.objects.get(name='Trivy Scan').active)
+        self.assertTrue(Test_Type.objects.get(name='Nuclei Scan').active)
@@ -0,0 +1,219 @@
+import calendar as tcalendar
+import logging
+import time
+from datetime import datetime, timedelta
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from dojo.models import Endpoint, Endpoint_Status, Finding, Risk_Acceptance, Test, User
+from dojo.utils import get_period_boundaries, get_period_counts
+from .dojo_test_case import DojoTestCase
+
+logger = logging.getLogger(__name__)
+
+
+def get_period_counts_per_period(findings,
+                                 findings_closed,
+                                 accepted_findings,
+                                 period_interval,
+                                 start_date,
+                                 relative_delta='months'):
+    """get_period_counts before the counts were grouped by day, with queries and a loop over the findings per period"""
+
+    tz = timezone.get_current_timezone()
+
+    start_date = datetime(start_date.year, start_date.month, start_date.day, tzinfo=tz)
+
+    opened_in_period = list()
+    active_in_period = list()
+    accepted_in_period = list()
+    opened_in_period.append(
+        ['Timestamp', 'Date', 'S0', 'S1', 'S2', 'S3', 'Total', 'Closed'])
+    active_in_period.append(
+        ['Timestamp', 'Date', 'S0', 'S1', 'S2', 'S3', 'Total', 'Closed'])
+    accepted_in_period.append(
+        ['Timestamp', 'Date', 'S0', 'S1', 'S2', 'S3', 'Total', 'Closed'])
+
+    for new_date, end_date in get_period_boundaries(period_interval, start_date, relative_delta):
+        try:
+            closed_in_range_count = findings_closed.filter(
+                mitigated__date__range=[new_date, end_date]).count()
+        except:
+            closed_in_range_count = findings_closed.filter(
+                mitigated_time__range=[new_date, end_date]).count()
+
+        if accepted_findings:
+            date_range = [
+                datetime(new_date.year, new_date.month, new_date.day, tzinfo=tz),
+                datetime(end_date.year, end_date.month, end_date.day, tzinfo=tz)
+            ]
+            try:
+                risks_a = accepted_findings.filter(risk_acceptance__created__date__range=date_range)
+            except:
+                risks_a = accepted_findings.filter(date__range=date_range)
+        else:
+            risks_a = None
+
+        f_crit_count, f_high_count, f_med_count, f_low_count, f_closed_count = [
+            0, 0, 0, 0, 0
+        ]
+        ra_crit_count, ra_high_count, ra_med_count, ra_low_count, ra_closed_count = [
+            0, 0, 0, 0, 0
+        ]
+        active_crit_count, active_high_count, active_med_count, active_low_count, active_closed_count = [
+            0, 0, 0, 0, 0
+        ]
+
+        for finding in findings:
+            try:
+                severity = finding.severity
+                active = finding.active
+#                risk_accepted = finding.risk_accepted TODO: in future release
+            except:
+                severity = finding.finding.severity
+                active = finding.finding.active
+#                risk_accepted = finding.finding.risk_accepted
+
+            try:
+                f_time = datetime.combine(finding.date, datetime.min.time()).replace(tzinfo=tz)
+            except:
+                f_time = finding.date
+
+            if f_time <= end_date:
+                if severity == 'Critical':
+                    if new_date <= f_time:
+                        f_crit_count += 1
+                    if active:
+                        active_crit_count += 1
+                elif severity == 'High':
+                    if new_date <= f_time:
+                        f_high_count += 1
+                    if active:
+                        active_high_count += 1
+                elif severity == 'Medium':
+                    if new_date <= f_time:
+                        f_med_count += 1
+                    if active:
+                        active_med_count += 1
+                elif severity == 'Low':
+                    if new_date <= f_time:
+                        f_low_count += 1
+                    if active:
+                        active_low_count += 1
+
+        if risks_a is not None:
+            for finding in risks_a:
+                try:
+                    severity = finding.severity
+                except:
+                    severity = finding.finding.severity
+                if severity == 'Critical':
+                    ra_crit_count += 1
+                elif severity == 'High':
+                    ra_high_count += 1
+                elif severity == 'Medium':
+                    ra_med_count += 1
+                elif severity == 'Low':
+                    ra_low_count += 1
+
+        total = f_crit_count + f_high_count + f_med_count + f_low_count
+        opened_in_period.append(
+            [(tcalendar.timegm(new_date.timetuple()) * 1000), new_date,
+             f_crit_count, f_high_count, f_med_count, f_low_count, total,
+             closed_in_range_count])
+
+        total = ra_crit_count + ra_high_count + ra_med_count + ra_low_count
+        accepted_in_period.append(
+            [(tcalendar.timegm(new_date.timetuple()) * 1000), new_date,
+             ra_crit_count, ra_high_count, ra_med_count, ra_low_count, total])
+
+        total = active_crit_count + active_high_count + active_med_count + active_low_count
+        active_in_period.append(
+            [(tcalendar.timegm(new_date.timetuple()) * 1000), new_date,
+             active_crit_count, active_high_count, active_med_count, active_low_count, total])
+
+    return {
+        'opened_per_period': opened_in_period,
+        'accepted_per_period': accepted_in_period,
+        'active_per_period': active_in_period
+    }
+
+
+class TestPeriodCounts(DojoTestCase):
+    """Compares get_period_counts with the previous implementation on two years of seeded findings"""
+    fixtures = ['dojo_testdata.json']
+
+    def setUp(self):
+        test = Test.objects.get(id=3)
+        reporter = User.objects.get(username='admin')
+        endpoint = Endpoint.objects.create(host='period-counts.example.com', product=test.engagement.product)
+        self.endpoint = endpoint
+        now = timezone.now()
+        self.start_date = now - timedelta(days=730)
+
+        severities = ['Critical', 'High', 'Medium', 'Low', 'Info']
+        findings = []
+        for index in range(600):
+            mitigated = now - timedelta(days=index % 97, hours=index % 24) if index % 3 == 0 else None
+            findings.append(Finding(title='period count %i' % index, test=test, reporter=reporter,
+                                    severity=severities[index % 5], numerical_severity='S%i' % (index % 5),
+                                    date=(now - timedelta(days=(index * 7) % 730)).date(),
+                                    active=mitigated is None, verified=True, is_mitigated=mitigated is not None,
+                                    mitigated=mitigated, risk_accepted=index % 11 == 0))
+        findings = Finding.objects.bulk_create(findings)
+        self.findings = Finding.objects.filter(title__startswith='period count ')
+
+        risk_acceptance = Risk_Acceptance.objects.create(name='period counts', owner=reporter)
+        risk_acceptance.accepted_findings.set(self.findings.filter(risk_accepted=True))
+        Risk_Acceptance.objects.filter(id=risk_acceptance.id).update(created=now - timedelta(days=45))
+
+        Endpoint_Status.objects.bulk_create([
+            Endpoint_Status(endpoint=endpoint, finding=finding, date=finding.date, mitigated=finding.is_mitigated,
+                            mitigated_time=finding.mitigated, risk_accepted=finding.risk_accepted)
+            for finding in findings])
+        self.endpoint_statuses = Endpoint_Status.objects.filter(endpoint=endpoint)
+
+    def compare(self, findings, closed, accepted):
+        for period_interval, relative_delta in [(25, 'months'), (105, 'weeks')]:
+            timings, queries = {}, {}
+            for name, function in [('per period', get_period_counts_per_period), ('grouped', get_period_counts)]:
+                # fresh querysets, so that neither implementation reads the results cached by the other
+                args = (findings.all(), closed.all(), accepted.all() if accepted is not None else None, period_interval,
+                        self.start_date, relative_delta)
+                with CaptureQueriesContext(connection) as context:
+                    started = time.perf_counter()
+                    counts = function(*args)
+                    timings[name] = time.perf_counter() - started
+                queries[name] = len(context.captured_queries)
+                if name == 'per period':
+                    expected = counts
+            self.assertEqual(expected, counts, relative_delta)
+            self.assertLessEqual(queries['grouped'], 3)
+            logger.info('get_period_counts over %i %s of %s: %i queries in %.3fs, before %i queries in %.3fs',
+                        period_interval, relative_delta, findings.model.__name__, queries['grouped'], timings['grouped'],
+                        queries['per period'], timings['per period'])
+
+    def test_finding_period_counts(self):
+        self.compare(self.findings, self.findings.filter(mitigated__isnull=False), self.findings.filter(risk_accepted=True))
+
+    def test_endpoint_period_counts(self):
+        self.compare(self.endpoint_statuses, self.endpoint_statuses.filter(mitigated=True),
+                     self.endpoint_statuses.filter(risk_accepted=True))
+
+    def test_period_counts_without_accepted_findings(self):
+        self.compare(self.findings, Finding.objects.none(), None)
+
+    def test_period_counts_of_host_findings(self):
+        # the findings are on two endpoints of the same host, the join repeats them
+        other_endpoint = Endpoint.objects.create(host='period-counts.example.com', port=8443, product=self.endpoint.product)
+        Endpoint_Status.objects.bulk_create([Endpoint_Status(endpoint=other_endpoint, finding=finding, date=finding.date)
+                                             for finding in self.findings])
+        host_findings = self.endpoint.host_findings()
+        self.assertEqual(self.findings.count(), host_findings.count())
+
+        self.assertEqual(get_period_counts(self.findings, self.findings.filter(mitigated__isnull=False),
+                                           self.findings.filter(risk_accepted=True), 25, self.start_date),
+                         get_period_counts(host_findings, host_findings.filter(mitigated__isnull=False),
+                                           host_findings.filter(risk_accepted=True), 25, self.start_date))
@@ -0,0 +1,106 @@
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from dojo.models import Finding, Product, User
+from dojo.reports import helper as report_helper
+from .dojo_test_case import DojoTestCase
+
+
+class TestReportGeneration(DojoTestCase):
+    fixtures = ['dojo_testdata.json']
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.user = User.objects.get(username='admin')
+        # report_url_resolver needs the host header
+        self.client = Client(HTTP_HOST='localhost')
+        self.client.force_login(self.user)
+        self.product = Product.objects.get(id=2)
+        self.url = f'/product/{self.product.id}/report?_generate=&report_type=HTML&include_finding_notes=1'
+
+    def set_block_execution(self, block_execution):
+        self.user.usercontactinfo.block_execution = block_execution
+        self.user.usercontactinfo.save()
+
+    def test_report_is_served_from_artifact(self):
+        # generate the report in the foreground
+        self.set_block_execution(True)
+        response = self.client.get(self.url)
+        self.assertEqual(200, response.status_code)
+        self.assertContains(response, 'Product Report')
+
+        with patch.object(report_helper, 'generate_report_artifact') as generate_report_artifact:
+            response = self.client.get(self.url)
+            self.assertEqual(200, response.status_code)
+            self.assertContains(response, 'Product Report')
+            generate_report_artifact.assert_not_called()
+
+            # other report options are another report
+            self.client.get(self.url + '&include_finding_images=1')
+            self.assertEqual(1, generate_report_artifact.call_count)
+
+    def test_changed_findings_regenerate_report(self):
+        self.set_block_execution(True)
+        self.client.get(self.url)
+
+        finding = Finding.objects.filter(test__engagement__product=self.product).first()
+        finding.active = False
+        finding.last_status_update = timezone.now()
+        finding.save()
+
+        with patch.object(report_helper, 'generate_report_artifact') as generate_report_artifact:
+            self.client.get(self.url)
+            generate_report_artifact.assert_called_once()
+
+    def test_report_job(self):
+        self.set_block_execution(False)
+        with patch.object(report_helper, 'generate_report_artifact') as generate_report_artifact:
+            response = self.client.get(self.url)
+            self.assertEqual(202, response.status_code)
+            job_id = response.context['job_id']
+            self.assertEqual('pending', response.context['status'])
+
+            # repeated requests don't queue the job again
+            self.assertEqual(202, self.client.get(self.url).status_code)
+            generate_report_artifact.assert_called_once()
+
+        status = self.client.get(f'/reports/job/{job_id}').json()
+        self.assertEqual({'job_id': job_id, 'status': 'pending'}, status)
+        self.assertEqual(404, self.client.get(f'/reports/job/{job_id}/report').status_code)
+
+        # run the job like the celery worker does
+        args = generate_report_artifact.call_args[0]
+        report_helper.generate_report_artifact(*args, sync=True)
+
+        status = self.client.get(f'/reports/job/{job_id}').json()
+        self.assertEqual('done', status['status'])
+        response = self.client.get(status['url'])
+        self.assertEqual(200, response.status_code)
+        self.assertContains(response, 'Product Report')
+
+        # the reports are only served to the user who generated them
+        other_client = Client(HTTP_HOST='localhost')
+        other_client.force_login(User.objects.exclude(id=self.user.id).first())
+        self.assertEqual(404, other_client.get(f'/reports/job/{job_id}').status_code)
+        self.assertEqual(404, other_client.get(f'/reports/job/{job_id}/report').status_code)
+
+    def test_failed_report_job(self):
+        self.set_block_execution(True)
+        with patch('dojo.reports.views.ReportFindingFilter', side_effect=ValueError('broken filter')):
+            response = self.client.get(self.url)
+        self.assertEqual(202, response.status_code)
+        self.assertEqual('failed', response.context['status'])
+        self.assertEqual('broken filter', response.context['error'])
+
+        # the next request tries again
+        response = self.client.get(self.url)
+        self.assertEqual(200, response.status_code)
@@ -0,0 +1,56 @@
+from django.test import override_settings
+
+from dojo.finding.views import prefetch_for_findings
+from dojo.models import Finding, Product, SLA_Configuration
+from dojo.sla_config.helpers import SLAConfigurationCache, annotate_sla_configuration
+from .dojo_test_case import DojoTestCase
+
+
+@override_settings(SLA_CONFIGURATION_CACHE_TTL=60)
+class TestSLAConfigurationCache(DojoTestCase):
+    fixtures = ['dojo_testdata.json']
+
+    def setUp(self):
+        SLAConfigurationCache.invalidate()
+
+    def tearDown(self):
+        SLAConfigurationCache.invalidate()
+
+    def test_sla_of_findings_uses_cached_configurations(self):
+        findings = list(prefetch_for_findings(Finding.objects.order_by('id')))
+        expected = [finding.sla_days_remaining() for finding in findings]
+        self.assertTrue(any(expected))
+        with self.assertNumQueries(0):
+            self.assertEqual(expected, [finding.sla_days_remaining() for finding in findings])
+            for finding in findings:
+                finding.sla_deadline()
+
+    def test_saving_sla_configuration_invalidates(self):
+        finding = Finding.objects.get(id=2)
+        sla_configuration = finding.get_sla_periods()
+        days_remaining = finding.sla_days_remaining()
+
+        setattr(sla_configuration, finding.severity.lower(), getattr(sla_configuration, finding.severity.lower()) + 10)
+        sla_configuration.save()
+        self.assertEqual(days_remaining + 10, finding.sla_days_remaining())
+
+    def test_configuration_created_in_another_process(self):
+        SLAConfigurationCache.get_all()
+        # created without the signal that invalidates the cache, like in another process without a shared django cache
+        SLA_Configuration.objects.bulk_create([SLA_Configuration(name='other process', critical=1, high=2, medium=3, low=4)])
+        sla_configuration = SLA_Configuration.objects.get(name='other process')
+
+        self.assertEqual(sla_configuration.id, SLAConfigurationCache.get(sla_configuration.id).id)
+        # and the reloaded configurations are cached again
+        with self.assertNumQueries(0):
+            SLAConfigurationCache.get(sla_configuration.id)
+
+    def test_annotate_list_of_findings(self):
+        sla_configuration = SLA_Configuration.objects.create(name='short', critical=1, high=2, medium=3, low=4)
+        Product.objects.filter(id=2).update(sla_configuration=sla_configuration)
+        findings = list(Finding.objects.order_by('id'))
+        with self.assertNumQueries(1):
+            annotate_sla_configuration(findings)
+        for finding in findings:
+            self.assertEqual(finding.test.engagement.product.sla_configuration_id, finding.sla_configuration_id)
+            self.assertEqual(finding.sla_configuration_id, finding.get_sla_periods().id)
@@ -1,4 +1,7 @@
+from django.core.cache import cache
+from django.test import override_settings
 from .dojo_test_case import DojoTestCase
+from dojo.middleware import SystemSettingsCache
 from dojo.models import System_Settings
 
 
@@ -25,3 +28,42 @@ class TestSystemSettings(DojoTestCase):
         system_settings.save()
         system_settings = System_Settings.objects.get(no_cache=True)
         self.assertEqual(system_settings.enable_jira, True)
+
+
+@override_settings(SYSTEM_SETTINGS_CACHE_TTL=60)
+class TestSystemSettingsCache(DojoTestCase):
+
+    def setUp(self):
+        System_Settings.objects.get_or_create()
+        SystemSettingsCache.invalidate()
+
+    def test_cached_until_saved(self):
+        misses = SystemSettingsCache.get_stats()['misses']
+        System_Settings.objects.get()
+        self.assertEqual(misses + 1, SystemSettingsCache.get_stats()['misses'])
+
+        hits = SystemSettingsCache.get_stats()['hits']
+        with self.assertNumQueries(0):
+            system_settings = System_Settings.objects.get()
+        self.assertEqual(hits + 1, SystemSettingsCache.get_stats()['hits'])
+
+        # update() doesn't send signals, so it's not seen until the cache expires
+        System_Settings.objects.update(enable_jira=not system_settings.enable_jira)
+        self.assertEqual(system_settings.enable_jira, System_Settings.objects.get().enable_jira)
+
+        system_settings = System_Settings.objects.get(no_cache=True)
+        system_settings.enable_jira = not system_settings.enable_jira
+        system_settings.save()
+        self.assertEqual(system_settings.enable_jira, System_Settings.objects.get().enable_jira)
+
+    def test_version_changed_by_other_process(self):
+        System_Settings.objects.get()
+        cache.incr(SystemSettingsCache.VERSION_KEY)
+        with self.assertNumQueries(1):
+            System_Settings.objects.get()
+
+    @override_settings(SYSTEM_SETTINGS_CACHE_TTL=0)
+    def test_disabled(self):
+        System_Settings.objects.get()
+        with self.assertNumQueries(1):
+            System_Settings.objects.get()
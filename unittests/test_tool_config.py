@@ -1,5 +1,5 @@
 from .dojo_test_case import DojoTestCase
-from dojo.tools.factory import get_api_scan_configuration_hints, PARSERS
+from dojo.tools.factory import get_api_scan_configuration_hints, load_all_parsers
 from dojo.tool_config.factory import SCAN_APIS
 from dojo.models import Tool_Configuration, Tool_Type
 
@@ -58,7 +58,7 @@ class TestApiScanConfigEntry(DojoTestCase):
         self.assertEqual(acsh[4]['tool_configurations'].count(), 1)
 
     def test_has_functions(self):
-        for parser_name, parser in PARSERS.items():
+        for parser_name, parser in load_all_parsers().items():
             if parser.__module__.startswith('dojo.tools.api_'):
                 with self.subTest(parser_name):
                     self.assertTrue(hasattr(parser, "requires_tool_type"), "All API parsers should have function 'requires_tool_type'")
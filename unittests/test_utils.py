@@ -1,11 +1,17 @@
 from dojo.models import IMPORT_CLOSED_FINDING, IMPORT_CREATED_FINDING, IMPORT_REACTIVATED_FINDING, IMPORT_UNTOUCHED_FINDING, \
     Engagement, Product, Test, Test_Import, Test_Import_Finding_Action, \
     Dojo_User, Dojo_Group, Dojo_Group_Member, Role, System_Settings, Notifications, \
-    Product_Type, Endpoint
+    Product_Type, Endpoint, Finding, SLA_Configuration
+import datetime
 from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
 from .dojo_test_case import DojoTestCase
 from unittest.mock import patch, Mock
-from dojo.utils import dojo_crypto_encrypt, prepare_for_view, user_post_save
+from dojo.utils import dojo_crypto_encrypt, prepare_for_view, user_post_save, perform_product_grading, \
+    get_product_grade_interpreter, get_product_grading_cache_key, sla_compute_and_notify, calculate_grade
 from dojo.authorization.roles_permissions import Roles
 import logging
 
@@ -162,6 +168,106 @@ class TestUtils(DojoTestCase):
         save_mock_member.save.assert_not_called()
 
 
+class TestProductGrading(DojoTestCase):
+    def setUp(self):
+        self.product = Product(id=1234, name='grading product')
+        cache.delete(get_product_grading_cache_key(self.product))
+
+    @override_settings(PRODUCT_GRADE_DEBOUNCE_SECONDS=10)
+    @patch('dojo.utils.we_want_async', return_value=True)
+    @patch('dojo.utils.calculate_grade')
+    @patch('dojo.utils.System_Settings.objects')
+    def test_perform_product_grading_debounced(self, mock_settings, mock_calculate_grade, mock_we_want_async):
+        mock_settings.get.return_value = System_Settings(enable_product_grade=True)
+
+        perform_product_grading(self.product)
+        perform_product_grading(self.product)
+
+        mock_calculate_grade.assert_called_once_with(self.product, countdown=10)
+
+    @override_settings(PRODUCT_GRADE_DEBOUNCE_SECONDS=10)
+    @patch('dojo.utils.we_want_async', return_value=False)
+    @patch('dojo.utils.calculate_grade')
+    @patch('dojo.utils.System_Settings.objects')
+    def test_perform_product_grading_sync(self, mock_settings, mock_calculate_grade, mock_we_want_async):
+        mock_settings.get.return_value = System_Settings(enable_product_grade=True)
+
+        perform_product_grading(self.product)
+        perform_product_grading(self.product)
+
+        self.assertEqual(2, mock_calculate_grade.call_count)
+        mock_calculate_grade.assert_called_with(self.product)
+
+    @patch('dojo.utils.calculate_grade')
+    @patch('dojo.utils.System_Settings.objects')
+    def test_perform_product_grading_disabled(self, mock_settings, mock_calculate_grade):
+        mock_settings.get.return_value = System_Settings(enable_product_grade=False)
+
+        perform_product_grading(self.product)
+
+        mock_calculate_grade.assert_not_called()
+
+    @patch('dojo.decorators.we_want_async', return_value=False)
+    @patch('dojo.utils.System_Settings.objects')
+    def test_calculate_grade_of_deleted_product(self, mock_settings, mock_we_want_async):
+        mock_settings.get.return_value = System_Settings(enable_product_grade=True)
+
+        # the product has been deleted since the grading was scheduled
+        calculate_grade(self.product)
+
+        self.assertFalse(Product.objects.filter(id=self.product.id).exists())
+
+    def test_product_grade_interpreter_cached(self):
+        product_grade = 'def grade_product(crit, high, med, low):\n    return 100 - crit * 10 - high'
+        self.assertIs(get_product_grade_interpreter(product_grade), get_product_grade_interpreter(product_grade))
+        self.assertEqual(100, get_product_grade_interpreter(product_grade)('grade_product(0, 0, 0, 0)'))
+        self.assertEqual(78, get_product_grade_interpreter(product_grade)('grade_product(2, 2, 0, 0)'))
+
+
+class TestSlaComputeAndNotify(DojoTestCase):
+    fixtures = ['dojo_testdata.json']
+
+    def setUp(self):
+        System_Settings.objects.update(enable_finding_sla=True, enable_notify_sla_active=True,
+                                       enable_notify_sla_active_verified=False, enable_notify_sla_jira_only=False)
+        SLA_Configuration.objects.update(critical=3, high=5, medium=11, low=0)
+        today = timezone.now().date()
+        for index, finding in enumerate(Finding.objects.order_by('id')):
+            Finding.objects.filter(id=finding.id).update(
+                active=True, is_mitigated=False, mitigated=None, duplicate=False,
+                date=today - datetime.timedelta(days=index),
+                sla_start_date=today - datetime.timedelta(days=index // 2) if index % 3 == 0 else None)
+
+    def get_expected_findings(self, exponential_backoff):
+        expected = set()
+        for finding in Finding.objects.filter(active=True, is_mitigated=False, duplicate=False).exclude(severity='Info'):
+            sla_age = finding.sla_days_remaining() or 0
+            if sla_age < 0:
+                overdue = abs(sla_age)
+                if overdue <= settings.SLA_NOTIFY_POST_BREACH and (not exponential_backoff or overdue & (overdue - 1) == 0):
+                    expected.add((finding.id, sla_age))
+            elif sla_age <= settings.SLA_NOTIFY_PRE_BREACH:
+                expected.add((finding.id, sla_age))
+        return expected
+
+    @patch('dojo.utils.create_notification')
+    def test_sla_compute_and_notify(self, mock_create_notification):
+        for exponential_backoff in [False, True]:
+            System_Settings.objects.update(enable_notify_sla_exponential_backoff=exponential_backoff)
+            mock_create_notification.reset_mock()
+            sla_compute_and_notify()
+            notified = {(call.kwargs['finding'].id, call.kwargs['sla_age']) for call in mock_create_notification.call_args_list}
+            self.assertTrue(notified)
+            self.assertEqual(self.get_expected_findings(exponential_backoff), notified)
+
+    @patch('dojo.utils.create_notification')
+    def test_sla_compute_and_notify_jira_only(self, mock_create_notification):
+        System_Settings.objects.update(enable_notify_sla_jira_only=True)
+        sla_compute_and_notify()
+        for call in mock_create_notification.call_args_list:
+            self.assertTrue(call.kwargs['finding'].has_jira_issue)
+
+
 class assertNumOfModelsCreated():
     def __init__(self, test_case, queryset, num):
         self.test_case = test_case
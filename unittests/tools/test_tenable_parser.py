@@ -27,6 +27,16 @@ class TestTenableParser(DojoTestCase):
         endpoint = finding.unsaved_endpoints[1]
         self.assertEqual("tcp", endpoint.protocol)
 
+    def test_iter_findings_nessus(self):
+        parser = TenableParser()
+        with open(path.join(path.dirname(__file__), "../scans/tenable/nessus/nessus_many_vuln.xml")) as testfile:
+            iterator = parser.iter_findings(testfile, self.create_test())
+            self.assertNotIsInstance(iterator, list)
+            findings = list(iterator)
+        self.assertEqual(6, len(findings))
+        self.assertEqual("Info", findings[5].severity)
+        self.assertEqual(["https", "tcp"], [endpoint.protocol for endpoint in findings[5].unsaved_endpoints[:2]])
+
     def test_parse_some_findings_csv_nessus_legacy(self):
         """Test one report provided by a user"""
         testfile = open(path.join(path.dirname(__file__), "../scans/tenable/nessus/nessus_many_vuln.csv"))